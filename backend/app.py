@@ -1,18 +1,64 @@
+import os
+
+# Green threads (ASYNC_MODE=eventlet or gevent) let one process hold
+# thousands of idle websockets without a thread each. The standard
+# library must be patched before anything else imports it.
+ASYNC_MODE = os.environ.get('ASYNC_MODE', 'threading')
+if ASYNC_MODE == 'eventlet':
+    import eventlet
+    eventlet.monkey_patch()
+elif ASYNC_MODE == 'gevent':
+    from gevent import monkey
+    monkey.patch_all()
+
 from flask import Flask, request, jsonify, session, make_response, send_from_directory
 from flask_cors import CORS
-from flask_socketio import SocketIO, emit
+from flask_socketio import SocketIO, emit, join_room, leave_room
 from werkzeug.security import generate_password_hash, check_password_hash
-import pymysql
-import os
 from datetime import datetime, timedelta
 import json
 import secrets
 import hashlib
-import pyotp
-import qrcode
+import hmac
+import math
+import threading
+import time
 from io import BytesIO
 import base64
 
+from modules.geo import (
+    GEO_ALL_SCREENS, GEO_UNASSIGNED, GEO_CLUSTER_MAX_ZOOM, get_geo_version, replace_geo_entries,
+    update_geo_entries, apply_geo_update, query_geo_bbox, query_geo_clusters
+)
+from modules.geofence import (
+    GEOFENCE_DEFAULT_RADIUS, ALERT_GEOFENCE_EXIT, ALERT_GEOFENCE_RETURN, get_geofence, forget_geofence,
+    is_outside_geofence, geofence_distance
+)
+from modules.fanout import (
+    FANOUT_INTERVAL_MS, queue_update, take_pending, record_frame, get_frame_sequence, frames_since
+)
+from modules.subscriptions import (
+    subscribe_screens, subscribe_bbox, unsubscribe, is_subscribed, get_subscriber, set_subscriber_admin,
+    route_update
+)
+from modules.dbpool import ConnectionPool
+from modules.storage import DatabaseError, make_engine
+from modules.migrations import OnlineAlter, run_migrations
+from modules.theme import get_theme_bundle
+from modules.static_files import StaticFiles, IMMUTABLE_CACHE_CONTROL
+from modules.uploads import UploadRejected, receive_upload
+from modules.images import (
+    UPLOAD_DIR as UI_UPLOAD_DIR, ASSET_NAME, ASSET_FILE, MIMETYPES as IMAGE_MIMETYPES,
+    InvalidImage, store_upload, build_variants, get_manifest, choose_variant
+)
+from modules.settings_cache import get_fresh_settings, get_settings_for_version, store_settings, forget_settings
+from modules.bus import make_client_manager, start_listening, bus_enabled, publish, on_bus_event
+from modules.fleet import (
+    ADMIN_SCOPE, BOOT_ID, get_fleet_version, record_fleet_change, add_fleet_change_listener, get_changes_since,
+    make_version_token, parse_version_token, make_etag,
+    get_cached_payload, store_cached_payload
+)
+
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.environ.get('SECRET_KEY', 'lxcloud-secret-key-change-in-production')
 
@@ -79,9 +125,17 @@ CORS(app,
      allow_headers=['Content-Type', 'Authorization'],
      methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
 
+# With SOCKETIO_MESSAGE_QUEUE set, several workers share one message queue
+# so an event emitted by any of them reaches browsers connected to all
+socketio_options = {}
+socketio_client_manager = make_client_manager()
+if socketio_client_manager is not None:
+    socketio_options['client_manager'] = socketio_client_manager
+
 socketio = SocketIO(app, 
                    cors_allowed_origins="*",
-                   async_mode='threading')
+                   async_mode=ASYNC_MODE,
+                   **socketio_options)
 
 # Database configuration with environment variable support
 DB_CONFIG = {
@@ -92,13 +146,42 @@ DB_CONFIG = {
     'charset': 'utf8mb4'
 }
 
+# Storage engine: mariadb (default), sqlite (a database file at
+# STORAGE_PATH) or memory (emptied on restart, used by app_standalone.py)
+STORAGE_ENGINE = os.environ.get('STORAGE_ENGINE', 'mariadb')
+
+# Connections kept open by the pool; 0 opens one connection per request.
+# Green threads need the bound, or thousands of concurrent handlers would
+# run into MariaDB's max_connections.
+DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE', 0 if ASYNC_MODE == 'threading' else 20))
+
+# Make the first user to register an admin (for installs without one)
+FIRST_USER_ADMIN = os.environ.get('FIRST_USER_ADMIN', 'false').lower() == 'true'
+
+# Give every user who registers administrator access (standalone demos)
+NEW_USERS_ADMINISTRATORS = os.environ.get('NEW_USERS_ADMINISTRATORS', 'false').lower() == 'true'
+
+storage = None
+db_pool = None
+
+def use_storage(engine):
+    """Send all database access to a storage engine"""
+    global storage, db_pool
+    storage = engine
+    db_pool = ConnectionPool(engine.connect, DB_POOL_SIZE) if DB_POOL_SIZE and engine.poolable else None
+
+use_storage(make_engine(STORAGE_ENGINE, DB_CONFIG))
+
 def get_db_connection():
     """Get database connection with error handling"""
     try:
-        return pymysql.connect(**DB_CONFIG)
+        if db_pool is not None:
+            return db_pool.acquire()
+        return storage.connect()
     except Exception as e:
         print(f"Database connection failed: {e}")
-        print("Please ensure MariaDB/MySQL is running and credentials are correct")
+        if storage.name == 'mariadb':
+            print("Please ensure MariaDB/MySQL is running and credentials are correct")
         raise
 
 def require_auth():
@@ -131,9 +214,60 @@ def generate_registration_key():
     """Generate a secure registration key for controllers"""
     return secrets.token_urlsafe(32)
 
+# 2FA QR code cache
+# pyotp, qrcode and Pillow are imported inside the 2FA handlers so workers
+# don't pay for them at startup; rendered QR codes are cached per
+# provisioning URI for a short time.
+QR_CODE_CACHE_TTL = int(os.environ.get('QR_CODE_CACHE_TTL', 300))
+QR_CODE_CACHE_MAX_ENTRIES = 256
+QR_CODE_FORMATS = ('png', 'svg')
+
+_qr_code_cache = {}
+_qr_code_cache_lock = threading.Lock()
+
+def render_qr_code(data, image_format='png'):
+    """Render a QR code as a data URI, reusing a recent rendering if available"""
+    cache_key = (data, image_format)
+    now = time.monotonic()
+
+    with _qr_code_cache_lock:
+        cached = _qr_code_cache.get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1]
+
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=10, border=5)
+    qr.add_data(data)
+    qr.make(fit=True)
+
+    buffer = BytesIO()
+    if image_format == 'svg':
+        # SVG is written by qrcode itself without building a Pillow image
+        import qrcode.image.svg
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(buffer)
+        mime_type = 'image/svg+xml'
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(buffer, format='PNG')
+        mime_type = 'image/png'
+
+    data_uri = f"data:{mime_type};base64,{base64.b64encode(buffer.getvalue()).decode()}"
+
+    with _qr_code_cache_lock:
+        # Drop expired entries, then the oldest ones if the cache is still full
+        for key in [k for k, v in _qr_code_cache.items() if v[0] <= now]:
+            del _qr_code_cache[key]
+        while len(_qr_code_cache) >= QR_CODE_CACHE_MAX_ENTRIES:
+            del _qr_code_cache[next(iter(_qr_code_cache))]
+        _qr_code_cache[cache_key] = (now + QR_CODE_CACHE_TTL, data_uri)
+
+    return data_uri
+
 # Application version
 APP_VERSION = "1.2.0"
-DATABASE_VERSION = 4
+DATABASE_VERSION = 12
 
 def get_database_version():
     """Get current database version"""
@@ -148,311 +282,328 @@ def get_database_version():
     except:
         return 0
 
-def set_database_version(version):
-    """Set database version"""
-    try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        cursor.execute(
-            "INSERT INTO schema_version (version, updated_at) VALUES (%s, CURRENT_TIMESTAMP)",
-            (version,)
+def migrate_to_1(cursor):
+    """Create the initial schema"""
+    # Users table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            username VARCHAR(50) UNIQUE NOT NULL,
+            email VARCHAR(100) UNIQUE NOT NULL,
+            password_hash VARCHAR(255) NOT NULL,
+            is_admin BOOLEAN DEFAULT FALSE,
+            is_administrator BOOLEAN DEFAULT FALSE,
+            two_fa_enabled BOOLEAN DEFAULT FALSE,
+            two_fa_secret VARCHAR(255),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
         )
-        conn.commit()
-        cursor.close()
-        conn.close()
-        print(f"Database version updated to {version}")
-    except Exception as e:
-        print(f"Failed to update database version: {e}")
+    """)
+    
+    # Controllers registration table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS controllers (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            serial_number VARCHAR(100) UNIQUE NOT NULL,
+            registration_key VARCHAR(255) NOT NULL,
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            online_status BOOLEAN DEFAULT FALSE,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            assigned BOOLEAN DEFAULT FALSE
+        )
+    """)
+    
+    # Screens table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS screens (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            serial_number VARCHAR(100) UNIQUE NOT NULL,
+            user_id INT,
+            custom_name VARCHAR(100),
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            online_status BOOLEAN DEFAULT FALSE,
+            last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
+        )
+    """)
+    
+    # Screen data table
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS screen_data (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            screen_id INT,
+            information TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            year INT,
+            FOREIGN KEY (screen_id) REFERENCES screens(id) ON DELETE CASCADE,
+            INDEX idx_year (year),
+            INDEX idx_timestamp (timestamp)
+        )
+    """)
+
+def migrate_to_2(cursor):
+    """Add the app_info table for tracking installs and updates"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS app_info (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            app_version VARCHAR(20) NOT NULL,
+            install_type ENUM('fresh', 'update') NOT NULL,
+            previous_version VARCHAR(20),
+            installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            notes TEXT
+        )
+    """)
+    
+    # Record this migration
+    cursor.execute("""
+        INSERT INTO app_info (app_version, install_type, notes)
+        VALUES (%s, 'update', 'Database migration to add version tracking')
+    """, (APP_VERSION,))
+
+def migrate_to_3(cursor):
+    """Add the admin_settings table"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS admin_settings (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            setting_key VARCHAR(100) UNIQUE NOT NULL,
+            setting_value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_setting_key (setting_key)
+        )
+    """)
+    
+    # Insert default settings
+    default_settings = [
+        ('logoText', 'LXCloud'),
+        ('siteName', 'LXCloud - LED Screen Management Platform')
+    ]
+    
+    for key, value in default_settings:
+        cursor.execute("""
+            INSERT IGNORE INTO admin_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+        """, (key, value))
+
+def migrate_to_4(cursor):
+    """Add the ui_settings table for UI customization"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS ui_settings (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            setting_key VARCHAR(100) UNIQUE NOT NULL,
+            setting_value TEXT,
+            updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_setting_key (setting_key)
+        )
+    """)
+    
+    # Insert default UI settings
+    default_ui_settings = [
+        ('app_name', 'LXCloud'),
+        ('primary_color', '#667eea'),
+        ('secondary_color', '#f093fb'),
+        ('header_color', '#667eea'),
+        ('button_color', '#667eea'),
+        ('button_hover_color', '#5a6fd8'),
+        ('logo_url', ''),
+        ('favicon_url', ''),
+        ('background_image_url', ''),
+        ('custom_button_images', '{}'),
+    
+        # Screen management button icons
+        ('screen_view_data_icon', ''),
+        ('screen_edit_icon', ''),
+        ('screen_unbind_icon', ''),
+    ]
+    
+    for key, value in default_ui_settings:
+        cursor.execute("""
+            INSERT IGNORE INTO ui_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+        """, (key, value))
+
+def migrate_to_5(cursor):
+    """Add extended UI customization settings (v1.3)"""
+    # Add new UI settings for v1.3
+    extended_ui_settings = [
+        # Footer customization
+        ('footer_enabled', 'true'),
+        ('footer_text', 'Powered by LXCloud'),
+        ('footer_color', '#f8f9fa'),
+        ('footer_text_color', '#6c757d'),
+        ('footer_links', '{}'),  # JSON for custom footer links
+    
+        # Typography settings
+        ('font_family', 'system-ui, -apple-system, sans-serif'),
+        ('font_size_base', '16px'),
+        ('font_size_heading', '24px'),
+        ('line_height', '1.5'),
+    
+        # Navigation customization
+        ('nav_style', 'default'),  # default, pills, underline
+        ('nav_position', 'top'),   # top, side
+        ('nav_color', '#667eea'),
+        ('nav_hover_color', '#5a6fd8'),
+        ('header_text_color', '#ffffff'),  # header menu text color
+    
+        # Advanced button customization
+        ('button_style', 'default'),  # default, rounded, square, outline
+        ('button_size', 'medium'),     # small, medium, large
+        ('button_shadow', 'true'),
+        ('button_animation', 'true'),
+    
+        # Page-specific settings
+        ('dashboard_layout', 'grid'),     # grid, list, cards
+        ('dashboard_theme', 'default'),   # default, dark, light
+        ('login_background_url', ''),
+        ('login_style', 'default'),       # default, centered, split
+    
+        # Custom text overrides (JSON)
+        ('custom_text_labels', '{}'),     # Custom text for UI labels
+        ('page_titles', '{}'),            # Custom page titles
+    
+        # Advanced customization
+        ('custom_css', ''),               # Custom CSS injection
+        ('theme_mode', 'light'),          # light, dark, auto
+        ('border_radius', '8px'),         # Global border radius
+        ('spacing_unit', '16px'),         # Base spacing unit
+    
+        # Accessibility settings
+        ('high_contrast', 'false'),
+        ('large_text', 'false'),
+        ('reduced_motion', 'false'),
+    
+        # Advanced header settings
+        ('header_height', '60px'),
+        ('header_shadow', 'true'),
+        ('header_sticky', 'true'),
+    
+        # Card and component styling
+        ('card_shadow', 'true'),
+        ('card_border', 'true'),
+        ('card_hover_effect', 'true'),
+    ]
+    
+    for key, value in extended_ui_settings:
+        cursor.execute("""
+            INSERT IGNORE INTO ui_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+        """, (key, value))
+
+def migrate_to_6(cursor):
+    """Add header button customization settings"""
+    # Add new header button customization settings
+    header_button_settings = [
+        # Header button positioning and styling
+        ('header_button_alignment', 'default'),
+        ('header_button_vertical_alignment', 'center'),
+        ('header_button_spacing', '15px'),
+        ('header_button_individual_positions', '{}'),
+        ('header_button_individual_colors', '{}'),
+        ('header_custom_css', ''),
+    ]
+    
+    for key, value in header_button_settings:
+        cursor.execute("""
+            INSERT IGNORE INTO ui_settings (setting_key, setting_value)
+            VALUES (%s, %s)
+        """, (key, value))
+
+def migrate_to_7(cursor):
+    """Add columns for controller API key rotation"""
+    cursor.execute("""
+        ALTER TABLE controllers
+        ADD COLUMN IF NOT EXISTS previous_registration_key VARCHAR(255) NULL,
+        ADD COLUMN IF NOT EXISTS key_rotated_at TIMESTAMP NULL DEFAULT NULL
+    """)
+
+def migrate_to_8(cursor):
+    """Add indexes for paginated screen lists"""
+    screen_list_indexes = [
+        "CREATE INDEX IF NOT EXISTS idx_screens_user_created ON screens (user_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_screens_created ON screens (created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_screens_last_seen ON screens (last_seen, id)",
+        "CREATE INDEX IF NOT EXISTS idx_screens_online_created ON screens (online_status, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_screens_custom_name ON screens (custom_name)",
+        "CREATE INDEX IF NOT EXISTS idx_controllers_assigned_created ON controllers (assigned, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS idx_controllers_assigned_last_seen ON controllers (assigned, last_seen, id)",
+        "CREATE INDEX IF NOT EXISTS idx_controllers_assigned_online ON controllers (assigned, online_status, created_at, id)",
+    ]
+    
+    for statement in screen_list_indexes:
+        cursor.execute(statement)
+
+def migrate_to_9(cursor):
+    """Add geofence columns and the screen alerts table"""
+    cursor.execute("""
+        ALTER TABLE screens
+        ADD COLUMN IF NOT EXISTS home_latitude DECIMAL(10, 8) NULL,
+        ADD COLUMN IF NOT EXISTS home_longitude DECIMAL(11, 8) NULL,
+        ADD COLUMN IF NOT EXISTS geofence_radius INT NULL,
+        ADD COLUMN IF NOT EXISTS geofence_breached BOOLEAN DEFAULT FALSE
+    """)
+    
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS screen_alerts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            screen_id INT NOT NULL,
+            alert_type VARCHAR(32) NOT NULL,
+            latitude DECIMAL(10, 8),
+            longitude DECIMAL(11, 8),
+            distance_meters DECIMAL(12, 2),
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            INDEX idx_screen_alerts_screen (screen_id, created_at),
+            FOREIGN KEY (screen_id) REFERENCES screens(id) ON DELETE CASCADE
+        )
+    """)
+
+def migrate_to_10(cursor):
+    """Add settings version rows for caching"""
+    cursor.execute("""
+        CREATE TABLE IF NOT EXISTS settings_versions (
+            scope VARCHAR(64) PRIMARY KEY,
+            version BIGINT NOT NULL DEFAULT 0
+        )
+    """)
+    cursor.execute("""
+        INSERT IGNORE INTO settings_versions (scope, version)
+        VALUES ('ui_settings', 0), ('admin_settings', 0)
+    """)
+
+def migrate_to_11(cursor):
+    """Record schema fingerprints for the startup check"""
+    cursor.execute("""
+        ALTER TABLE schema_version
+        ADD COLUMN IF NOT EXISTS fingerprint VARCHAR(64) NULL
+    """)
+
+# Steps of modules.migrations.run_migrations, in version order. The
+# descriptions are part of the schema fingerprint: changing one makes
+# every worker take the migration lock once at its next start.
+MIGRATIONS = [
+    (1, "Creating initial database schema", migrate_to_1),
+    (2, "Adding application info tracking", migrate_to_2),
+    (3, "Adding admin settings table", migrate_to_3),
+    (4, "Adding UI settings table", migrate_to_4),
+    (5, "Adding extended UI customization settings for version 1.3", migrate_to_5),
+    (6, "Adding header button customization settings", migrate_to_6),
+    (7, "Adding controller key rotation columns", migrate_to_7),
+    (8, "Adding screen list indexes", migrate_to_8),
+    (9, "Adding geofence columns and screen alerts table", migrate_to_9),
+    (10, "Adding settings versions table", migrate_to_10),
+    (11, "Adding schema fingerprints", migrate_to_11),
+    # Serves the per-screen data query; screen_data is the largest table
+    (12, "Adding screen data lookup index", OnlineAlter(
+        'screen_data', "ADD INDEX IF NOT EXISTS idx_screen_data_screen_year_time (screen_id, year, timestamp)"
+    )),
+]
 
 def run_database_migrations():
     """Run database migrations"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        current_version = get_database_version()
-        print(f"Current database version: {current_version}")
-        print(f"Target database version: {DATABASE_VERSION}")
-        
-        if current_version < DATABASE_VERSION:
-            print("Running database migrations...")
-            
-            # Migration from version 0 to 1 (initial schema)
-            if current_version < 1:
-                print("Creating initial database schema...")
-                
-                # Schema version table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS schema_version (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        version INT NOT NULL,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Users table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS users (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        username VARCHAR(50) UNIQUE NOT NULL,
-                        email VARCHAR(100) UNIQUE NOT NULL,
-                        password_hash VARCHAR(255) NOT NULL,
-                        is_admin BOOLEAN DEFAULT FALSE,
-                        is_administrator BOOLEAN DEFAULT FALSE,
-                        two_fa_enabled BOOLEAN DEFAULT FALSE,
-                        two_fa_secret VARCHAR(255),
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                    )
-                """)
-                
-                # Controllers registration table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS controllers (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        serial_number VARCHAR(100) UNIQUE NOT NULL,
-                        registration_key VARCHAR(255) NOT NULL,
-                        latitude DECIMAL(10, 8),
-                        longitude DECIMAL(11, 8),
-                        online_status BOOLEAN DEFAULT FALSE,
-                        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        assigned BOOLEAN DEFAULT FALSE
-                    )
-                """)
-                
-                # Screens table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS screens (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        serial_number VARCHAR(100) UNIQUE NOT NULL,
-                        user_id INT,
-                        custom_name VARCHAR(100),
-                        latitude DECIMAL(10, 8),
-                        longitude DECIMAL(11, 8),
-                        online_status BOOLEAN DEFAULT FALSE,
-                        last_seen TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        FOREIGN KEY (user_id) REFERENCES users(id) ON DELETE CASCADE
-                    )
-                """)
-                
-                # Screen data table
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS screen_data (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        screen_id INT,
-                        information TEXT,
-                        timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        year INT,
-                        FOREIGN KEY (screen_id) REFERENCES screens(id) ON DELETE CASCADE,
-                        INDEX idx_year (year),
-                        INDEX idx_timestamp (timestamp)
-                    )
-                """)
-                
-                set_database_version(1)
-                print("Migration to version 1 completed")
-            
-            # Migration from version 1 to 2 (add app_info table for tracking installs/updates)
-            if current_version < 2:
-                print("Adding application info tracking...")
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS app_info (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        app_version VARCHAR(20) NOT NULL,
-                        install_type ENUM('fresh', 'update') NOT NULL,
-                        previous_version VARCHAR(20),
-                        installed_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                        notes TEXT
-                    )
-                """)
-                
-                # Record this migration
-                cursor.execute("""
-                    INSERT INTO app_info (app_version, install_type, notes)
-                    VALUES (%s, 'update', 'Database migration to add version tracking')
-                """, (APP_VERSION,))
-                
-                set_database_version(2)
-                print("Migration to version 2 completed")
-            
-            # Migration from version 2 to 3 (add admin_settings table)
-            if current_version < 3:
-                print("Adding admin settings table...")
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS admin_settings (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        setting_key VARCHAR(100) UNIQUE NOT NULL,
-                        setting_value TEXT,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        INDEX idx_setting_key (setting_key)
-                    )
-                """)
-                
-                # Insert default settings
-                default_settings = [
-                    ('logoText', 'LXCloud'),
-                    ('siteName', 'LXCloud - LED Screen Management Platform')
-                ]
-                
-                for key, value in default_settings:
-                    cursor.execute("""
-                        INSERT IGNORE INTO admin_settings (setting_key, setting_value)
-                        VALUES (%s, %s)
-                    """, (key, value))
-                
-                set_database_version(3)
-                print("Migration to version 3 completed")
-            
-            # Migration from version 3 to 4 (add ui_settings table for UI customization)
-            if current_version < 4:
-                print("Adding UI settings table...")
-                
-                cursor.execute("""
-                    CREATE TABLE IF NOT EXISTS ui_settings (
-                        id INT AUTO_INCREMENT PRIMARY KEY,
-                        setting_key VARCHAR(100) UNIQUE NOT NULL,
-                        setting_value TEXT,
-                        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
-                        INDEX idx_setting_key (setting_key)
-                    )
-                """)
-                
-                # Insert default UI settings
-                default_ui_settings = [
-                    ('app_name', 'LXCloud'),
-                    ('primary_color', '#667eea'),
-                    ('secondary_color', '#f093fb'),
-                    ('header_color', '#667eea'),
-                    ('button_color', '#667eea'),
-                    ('button_hover_color', '#5a6fd8'),
-                    ('logo_url', ''),
-                    ('favicon_url', ''),
-                    ('background_image_url', ''),
-                    ('custom_button_images', '{}'),
-                    
-                    # Screen management button icons
-                    ('screen_view_data_icon', ''),
-                    ('screen_edit_icon', ''),
-                    ('screen_unbind_icon', ''),
-                ]
-                
-                for key, value in default_ui_settings:
-                    cursor.execute("""
-                        INSERT IGNORE INTO ui_settings (setting_key, setting_value)
-                        VALUES (%s, %s)
-                    """, (key, value))
-                
-                set_database_version(4)
-                print("Migration to version 4 completed")
-            
-            # Migration from version 4 to 5 (add extended UI customization for v1.3)
-            if current_version < 5:
-                print("Adding extended UI customization settings for version 1.3...")
-                
-                # Add new UI settings for v1.3
-                extended_ui_settings = [
-                    # Footer customization
-                    ('footer_enabled', 'true'),
-                    ('footer_text', 'Powered by LXCloud'),
-                    ('footer_color', '#f8f9fa'),
-                    ('footer_text_color', '#6c757d'),
-                    ('footer_links', '{}'),  # JSON for custom footer links
-                    
-                    # Typography settings
-                    ('font_family', 'system-ui, -apple-system, sans-serif'),
-                    ('font_size_base', '16px'),
-                    ('font_size_heading', '24px'),
-                    ('line_height', '1.5'),
-                    
-                    # Navigation customization
-                    ('nav_style', 'default'),  # default, pills, underline
-                    ('nav_position', 'top'),   # top, side
-                    ('nav_color', '#667eea'),
-                    ('nav_hover_color', '#5a6fd8'),
-                    ('header_text_color', '#ffffff'),  # header menu text color
-                    
-                    # Advanced button customization
-                    ('button_style', 'default'),  # default, rounded, square, outline
-                    ('button_size', 'medium'),     # small, medium, large
-                    ('button_shadow', 'true'),
-                    ('button_animation', 'true'),
-                    
-                    # Page-specific settings
-                    ('dashboard_layout', 'grid'),     # grid, list, cards
-                    ('dashboard_theme', 'default'),   # default, dark, light
-                    ('login_background_url', ''),
-                    ('login_style', 'default'),       # default, centered, split
-                    
-                    # Custom text overrides (JSON)
-                    ('custom_text_labels', '{}'),     # Custom text for UI labels
-                    ('page_titles', '{}'),            # Custom page titles
-                    
-                    # Advanced customization
-                    ('custom_css', ''),               # Custom CSS injection
-                    ('theme_mode', 'light'),          # light, dark, auto
-                    ('border_radius', '8px'),         # Global border radius
-                    ('spacing_unit', '16px'),         # Base spacing unit
-                    
-                    # Accessibility settings
-                    ('high_contrast', 'false'),
-                    ('large_text', 'false'),
-                    ('reduced_motion', 'false'),
-                    
-                    # Advanced header settings
-                    ('header_height', '60px'),
-                    ('header_shadow', 'true'),
-                    ('header_sticky', 'true'),
-                    
-                    # Card and component styling
-                    ('card_shadow', 'true'),
-                    ('card_border', 'true'),
-                    ('card_hover_effect', 'true'),
-                ]
-                
-                for key, value in extended_ui_settings:
-                    cursor.execute("""
-                        INSERT IGNORE INTO ui_settings (setting_key, setting_value)
-                        VALUES (%s, %s)
-                    """, (key, value))
-                
-                set_database_version(5)
-                print("Migration to version 5 completed")
-            
-            # Migration from version 5 to 6 (add header button customization)
-            if current_version < 6:
-                print("Adding header button customization settings...")
-                
-                # Add new header button customization settings
-                header_button_settings = [
-                    # Header button positioning and styling
-                    ('header_button_alignment', 'default'),
-                    ('header_button_vertical_alignment', 'center'),
-                    ('header_button_spacing', '15px'),
-                    ('header_button_individual_positions', '{}'),
-                    ('header_button_individual_colors', '{}'),
-                    ('header_custom_css', ''),
-                ]
-                
-                for key, value in header_button_settings:
-                    cursor.execute("""
-                        INSERT IGNORE INTO ui_settings (setting_key, setting_value)
-                        VALUES (%s, %s)
-                    """, (key, value))
-                
-                set_database_version(6)
-                print("Migration to version 6 completed")
-            
-            conn.commit()
-            print("All database migrations completed successfully")
-        else:
-            print("Database is up to date")
-            
-        cursor.close()
-        conn.close()
-        
+        run_migrations(storage, get_db_connection, MIGRATIONS)
     except Exception as e:
         print(f"Database migration failed: {e}")
         raise
@@ -460,23 +611,9 @@ def run_database_migrations():
 def init_database():
     """Initialize database with required tables and run migrations"""
     try:
-        conn = get_db_connection()
-        cursor = conn.cursor()
-        
-        # First, create schema_version table if it doesn't exist
-        cursor.execute("""
-            CREATE TABLE IF NOT EXISTS schema_version (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                version INT NOT NULL,
-                updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-            )
-        """)
-        conn.commit()
-        cursor.close()
-        conn.close()
-        
-        # Run migrations
+        # Creates schema_version as well
         run_database_migrations()
+        storage.finish_schema()
         
         print("Database initialized successfully")
         
@@ -487,6 +624,7 @@ def init_database():
         print("1. Install and start MariaDB/MySQL")
         print("2. Create database and user as described in README.md")
         print("3. Or use the install.sh script for automatic setup")
+        print("4. Or run without a database server: STORAGE_ENGINE=sqlite")
 
 # Health check endpoint
 @app.route('/api/health', methods=['GET'])
@@ -554,6 +692,138 @@ def get_version():
             'error': f'Could not retrieve full version info: {str(e)}'
         }), 200
 
+# Controller API authentication
+# Controllers sign each request with HMAC-SHA256 over "<timestamp>.<raw body>",
+# keyed with the registration_key they received when registering, and send
+# it in the X-LXCloud-Timestamp / X-LXCloud-Signature headers. Keys are kept
+# in a per-process cache so verifying a heartbeat doesn't need a DB query.
+CONTROLLER_AUTH_REQUIRED = os.environ.get('CONTROLLER_AUTH_REQUIRED', 'False').lower() == 'true'
+CONTROLLER_SIGNATURE_WINDOW = int(os.environ.get('CONTROLLER_SIGNATURE_WINDOW', 300))
+CONTROLLER_KEY_ROTATION_GRACE = int(os.environ.get('CONTROLLER_KEY_ROTATION_GRACE', 86400))
+CONTROLLER_KEY_REFRESH_INTERVAL = 30
+
+_controller_keys = {}  # serial_number -> {'keys': [(key, valid_until)], 'loaded_at': ...}
+_controller_seen_signatures = {}  # signature -> expiry, for replay protection
+_controller_unsigned_warned = set()  # serial numbers warned about unsigned requests
+_controller_auth_lock = threading.Lock()
+
+def cache_controller_keys(serial_number, registration_key, previous_key=None, previous_key_ttl=0):
+    """Store the currently valid signing keys of a controller in the key cache"""
+    now = time.monotonic()
+    keys = [(registration_key.encode(), None)]
+    if previous_key and previous_key_ttl > 0:
+        keys.append((previous_key.encode(), now + previous_key_ttl))
+
+    with _controller_auth_lock:
+        _controller_keys[serial_number] = {'keys': keys, 'loaded_at': now}
+
+def load_controller_keys(serial_number):
+    """Load the signing keys of a controller from the database into the key cache"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute("""
+        SELECT registration_key, previous_registration_key,
+               GREATEST(0, %s - TIMESTAMPDIFF(SECOND, key_rotated_at, NOW()))
+        FROM controllers
+        WHERE serial_number = %s
+    """, (CONTROLLER_KEY_ROTATION_GRACE, serial_number))
+    row = cursor.fetchone()
+    cursor.close()
+    conn.close()
+
+    if not row:
+        # Remember unknown serial numbers as well, so bad signatures for
+        # them don't query the database more often than the refresh interval
+        now = time.monotonic()
+        with _controller_auth_lock:
+            if len(_controller_keys) > 10000:
+                for unknown in [k for k, v in _controller_keys.items()
+                                if not v['keys'] and now - v['loaded_at'] > CONTROLLER_KEY_REFRESH_INTERVAL]:
+                    del _controller_keys[unknown]
+            _controller_keys[serial_number] = {'keys': [], 'loaded_at': now}
+        return False
+
+    cache_controller_keys(serial_number, row[0], row[1], row[2] or 0)
+    return True
+
+def _signature_matches(serial_number, message, signature):
+    now = time.monotonic()
+    with _controller_auth_lock:
+        entry = _controller_keys.get(serial_number)
+        keys = list(entry['keys']) if entry else []
+
+    for key, valid_until in keys:
+        if valid_until is not None and valid_until < now:
+            continue
+        expected = hmac.new(key, message, hashlib.sha256).hexdigest()
+        if hmac.compare_digest(expected, signature):
+            return True
+    return False
+
+def verify_controller_signature(serial_number):
+    """Verify the HMAC signature of the current controller request"""
+    timestamp = request.headers.get('X-LXCloud-Timestamp', '')
+    signature = request.headers.get('X-LXCloud-Signature', '').lower()
+
+    if not timestamp or not signature:
+        return False, 'Missing controller signature'
+
+    try:
+        request_time = int(timestamp)
+    except ValueError:
+        return False, 'Invalid signature timestamp'
+
+    if abs(time.time() - request_time) > CONTROLLER_SIGNATURE_WINDOW:
+        return False, 'Signature timestamp outside allowed window'
+
+    message = timestamp.encode() + b'.' + request.get_data()
+
+    if not _signature_matches(serial_number, message, signature):
+        # The key may have been rotated by another worker; reload it from
+        # the database, but not more often than the refresh interval
+        with _controller_auth_lock:
+            entry = _controller_keys.get(serial_number)
+            stale = not entry or time.monotonic() - entry['loaded_at'] > CONTROLLER_KEY_REFRESH_INTERVAL
+        if not stale or not load_controller_keys(serial_number):
+            return False, 'Invalid controller signature'
+        if not _signature_matches(serial_number, message, signature):
+            return False, 'Invalid controller signature'
+
+    now = time.monotonic()
+    with _controller_auth_lock:
+        if _controller_seen_signatures.get(signature, 0) > now:
+            return False, 'Replayed controller request'
+        if len(_controller_seen_signatures) > 10000:
+            for seen in [k for k, v in _controller_seen_signatures.items() if v <= now]:
+                del _controller_seen_signatures[seen]
+        _controller_seen_signatures[signature] = now + 2 * CONTROLLER_SIGNATURE_WINDOW
+
+    return True, None
+
+def require_controller_auth(serial_number):
+    """Check controller authentication for device endpoints
+
+    Signed requests are always verified. Unsigned requests are only
+    accepted while CONTROLLER_AUTH_REQUIRED is disabled, so existing
+    devices keep working until they are updated to sign requests; each
+    controller doing so is logged once per process.
+    """
+    if not request.headers.get('X-LXCloud-Signature') and not CONTROLLER_AUTH_REQUIRED:
+        with _controller_auth_lock:
+            warn = serial_number not in _controller_unsigned_warned and len(_controller_unsigned_warned) < 10000
+            if warn:
+                _controller_unsigned_warned.add(serial_number)
+        if warn:
+            print(f"Warning: accepted unsigned request from controller {serial_number}; "
+                  f"set CONTROLLER_AUTH_REQUIRED=true once all controllers sign their requests")
+        return True, None, None
+
+    valid, error = verify_controller_signature(serial_number)
+    if not valid:
+        return False, jsonify({'error': error}), 401
+
+    return True, None, None
+
 # Controller registration endpoint (secured API for controllers)
 @app.route('/api/controller/register', methods=['POST'])
 def controller_register():
@@ -564,15 +834,15 @@ def controller_register():
             return jsonify({'error': 'No data provided'}), 400
             
         serial_number = data.get('serial_number', '').strip()
-        latitude = data.get('latitude')
-        longitude = data.get('longitude')
+        latitude, longitude = parse_position(data.get('latitude'), data.get('longitude')) or (None, None)
         auth_key = data.get('auth_key', '').strip()
         
         if not serial_number:
             return jsonify({'error': 'Serial number is required'}), 400
         
-        # Simple authentication for controllers
-        # In production, you would use proper JWT tokens or API keys
+        # Legacy auth key, still checked for controllers that send it. It is
+        # derived from the serial number alone, so it is never handed out:
+        # the registration_key below is the controller's secret
         expected_auth_key = hashlib.sha256(f"lxcloud-controller-{serial_number}".encode()).hexdigest()[:16]
         if auth_key and auth_key != expected_auth_key:
             return jsonify({'error': 'Invalid authentication key'}), 401
@@ -585,6 +855,19 @@ def controller_register():
         existing = cursor.fetchone()
         
         if existing:
+            # Re-registering must be signed with the controller's current key
+            # once signatures are enforced, otherwise anyone knowing the
+            # serial number could fetch its registration key. The check may
+            # load the key with a connection of its own, so release this one
+            cursor.close()
+            conn.close()
+            auth_check, auth_response, auth_status = require_controller_auth(serial_number)
+            if not auth_check:
+                return auth_response, auth_status
+            
+            conn = get_db_connection()
+            cursor = conn.cursor()
+            
             # Update existing controller location and status
             cursor.execute("""
                 UPDATE controllers 
@@ -608,27 +891,91 @@ def controller_register():
         cursor.close()
         conn.close()
         
+        record_fleet_change(serial_number)
+        
+        if not existing:
+            cache_controller_keys(serial_number, registration_key)
+        
         return jsonify({
             'message': 'Controller registered successfully',
             'serial_number': serial_number,
             'registration_key': registration_key,
-            'expected_auth_key': expected_auth_key,
             'status': 'awaiting_assignment'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
 
+@app.route('/api/controller/rotate-key', methods=['POST'])
+def controller_rotate_key():
+    """Issue a new registration key to a controller
+
+    The request must be signed with the current key. The previous key stays
+    valid for CONTROLLER_KEY_ROTATION_GRACE seconds so requests that are
+    already in flight, or other workers' caches, don't fail during rollover.
+    """
+    try:
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No data provided'}), 400
+        
+        serial_number = data.get('serial_number', '').strip()
+        if not serial_number:
+            return jsonify({'error': 'Serial number is required'}), 400
+        
+        valid, error = verify_controller_signature(serial_number)
+        if not valid:
+            return jsonify({'error': error}), 401
+        
+        conn = get_db_connection()
+        cursor = conn.cursor()
+        
+        cursor.execute("SELECT registration_key FROM controllers WHERE serial_number = %s", (serial_number,))
+        controller = cursor.fetchone()
+        if not controller:
+            cursor.close()
+            conn.close()
+            return jsonify({'error': 'Controller not found'}), 404
+        
+        registration_key = generate_registration_key()
+        cursor.execute("""
+            UPDATE controllers
+            SET previous_registration_key = registration_key,
+                registration_key = %s,
+                key_rotated_at = CURRENT_TIMESTAMP
+            WHERE serial_number = %s
+        """, (registration_key, serial_number))
+        
+        conn.commit()
+        cursor.close()
+        conn.close()
+        
+        cache_controller_keys(serial_number, registration_key, controller[0], CONTROLLER_KEY_ROTATION_GRACE)
+        
+        return jsonify({
+            'message': 'Controller key rotated successfully',
+            'serial_number': serial_number,
+            'registration_key': registration_key,
+            'previous_key_valid_for': CONTROLLER_KEY_ROTATION_GRACE
+        }), 200
+        
+    except DatabaseError as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
+    except Exception as e:
+        return jsonify({'error': f'Key rotation failed: {str(e)}'}), 500
+
 # Optional: Serve frontend if no nginx is configured
+# The build is indexed and precompressed once (see modules.static_files).
+frontend_files = StaticFiles(os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist'))
+frontend_files.refresh()
+
 @app.route('/')
 def serve_frontend_fallback():
     """Serve frontend as fallback if no nginx configured"""
-    try:
-        frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
-        return send_from_directory(frontend_path, 'index.html')
-    except Exception as e:
+    response = frontend_files.send('index.html', request.accept_encodings)
+    if response is None:
         return jsonify({
             'message': 'LXCloud Backend API',
             'status': 'running',
@@ -636,27 +983,27 @@ def serve_frontend_fallback():
             'frontend_build': 'Run: cd frontend && npm run build',
             'nginx_setup': 'See README.md for nginx configuration'
         }), 200
+    return response
 
 @app.route('/<path:path>')
 def serve_frontend_static(path):
     """Serve frontend static files as fallback"""
-    try:
-        frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
-        return send_from_directory(frontend_path, path)
-    except:
-        # Return JSON for API-like requests, fallback for others
-        if path.startswith('api/'):
-            return jsonify({'error': 'API endpoint not found'}), 404
-        else:
-            # For frontend routes, serve index.html (React Router)
-            try:
-                frontend_path = os.path.join(os.path.dirname(__file__), '..', 'frontend', 'dist')
-                return send_from_directory(frontend_path, 'index.html')
-            except:
-                return jsonify({
-                    'error': 'Frontend not found',
-                    'note': 'Please build frontend: cd frontend && npm run build'
-                }), 404
+    response = frontend_files.send(path, request.accept_encodings)
+    if response is not None:
+        return response
+    
+    # Return JSON for API-like requests, fallback for others
+    if path.startswith('api/'):
+        return jsonify({'error': 'API endpoint not found'}), 404
+    
+    # For frontend routes, serve index.html (React Router)
+    response = frontend_files.send('index.html', request.accept_encodings)
+    if response is None:
+        return jsonify({
+            'error': 'Frontend not found',
+            'note': 'Please build frontend: cd frontend && npm run build'
+        }), 404
+    return response
 
 # Handle preflight requests for CORS
 @app.before_request
@@ -735,10 +1082,14 @@ def register():
             return jsonify({'error': 'Username or email already exists'}), 400
         
         # Create user
+        is_admin = False
+        if FIRST_USER_ADMIN:
+            cursor.execute("SELECT COUNT(*) FROM users")
+            is_admin = cursor.fetchone()[0] == 0
         password_hash = generate_password_hash(password)
         cursor.execute(
-            "INSERT INTO users (username, email, password_hash) VALUES (%s, %s, %s)",
-            (username, email, password_hash)
+            "INSERT INTO users (username, email, password_hash, is_admin, is_administrator) VALUES (%s, %s, %s, %s, %s)",
+            (username, email, password_hash, is_admin, NEW_USERS_ADMINISTRATORS)
         )
         
         user_id = cursor.lastrowid
@@ -756,7 +1107,7 @@ def register():
             'user': {'id': user_id, 'username': username, 'email': email}
         }), 201
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Registration failed: {str(e)}'}), 500
@@ -804,6 +1155,7 @@ def login():
             if not user[5]:  # two_fa_secret
                 return jsonify({'error': '2FA is enabled but secret is missing. Please contact administrator.'}), 500
             
+            import pyotp
             totp = pyotp.TOTP(user[5])
             if not totp.verify(two_fa_token):
                 return jsonify({'error': 'Invalid 2FA token'}), 401
@@ -825,7 +1177,7 @@ def login():
             }
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Login failed: {str(e)}'}), 500
@@ -873,7 +1225,7 @@ def get_current_user():
             }
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Failed to get user: {str(e)}'}), 500
@@ -927,7 +1279,7 @@ def change_password():
         
         return jsonify({'message': 'Password changed successfully'}), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Password change failed: {str(e)}'}), 500
@@ -939,16 +1291,21 @@ def setup_2fa():
     if not auth_check:
         return auth_response, auth_status
     
+    # PNG by default; SVG skips Pillow image rendering
+    data = request.get_json(silent=True) or {}
+    image_format = (request.args.get('format') or data.get('format') or 'png').lower()
+    if image_format not in QR_CODE_FORMATS:
+        return jsonify({'error': f"Unsupported QR code format. Use one of: {', '.join(QR_CODE_FORMATS)}"}), 400
+    
     try:
+        import pyotp
+        
         conn = get_db_connection()
         cursor = conn.cursor()
         
-        # Generate secret
-        secret = pyotp.random_base32()
-        
         # Get user info for QR code
         cursor.execute(
-            "SELECT username, email FROM users WHERE id = %s",
+            "SELECT username, email, two_fa_enabled, two_fa_secret FROM users WHERE id = %s",
             (session['user_id'],)
         )
         user = cursor.fetchone()
@@ -958,6 +1315,10 @@ def setup_2fa():
             conn.close()
             return jsonify({'error': 'User not found'}), 404
         
+        # Reuse a pending (not yet verified) secret so repeated setup requests
+        # show the same QR code and hit the render cache
+        secret = user[3] if user[3] and not user[2] else pyotp.random_base32()
+        
         # Generate QR code
         totp = pyotp.TOTP(secret)
         qr_url = totp.provisioning_uri(
@@ -965,15 +1326,7 @@ def setup_2fa():
             issuer_name="LXCloud"
         )
         
-        # Generate QR code image
-        qr = qrcode.QRCode(version=1, box_size=10, border=5)
-        qr.add_data(qr_url)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        buffer = BytesIO()
-        img.save(buffer, format='PNG')
-        qr_image_b64 = base64.b64encode(buffer.getvalue()).decode()
+        qr_code = render_qr_code(qr_url, image_format)
         
         # Store secret (but don't enable yet)
         cursor.execute(
@@ -987,11 +1340,11 @@ def setup_2fa():
         
         return jsonify({
             'secret': secret,
-            'qr_code': f"data:image/png;base64,{qr_image_b64}",
+            'qr_code': qr_code,
             'qr_url': qr_url
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'2FA setup failed: {str(e)}'}), 500
@@ -1029,6 +1382,7 @@ def verify_2fa():
             return jsonify({'error': '2FA not set up'}), 400
         
         # Verify token
+        import pyotp
         totp = pyotp.TOTP(user[0])
         if not totp.verify(token):
             cursor.close()
@@ -1047,7 +1401,7 @@ def verify_2fa():
         
         return jsonify({'message': '2FA enabled successfully'}), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'2FA verification failed: {str(e)}'}), 500
@@ -1085,6 +1439,7 @@ def disable_2fa():
             return jsonify({'error': '2FA not enabled'}), 400
         
         # Verify token
+        import pyotp
         totp = pyotp.TOTP(user[0])
         if not totp.verify(token):
             cursor.close()
@@ -1103,111 +1458,716 @@ def disable_2fa():
         
         return jsonify({'message': '2FA disabled successfully'}), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'2FA disable failed: {str(e)}'}), 500
-@app.route('/api/screens', methods=['GET'])
-def get_screens():
-    """Get all screens for current user or all screens for admin"""
-    if 'user_id' not in session:
-        return jsonify({'error': 'Not authenticated'}), 401
+# Users' admin flags, cached for the screen list so a revalidation can be
+# answered without a database query
+_user_admin_flags = {}
+_user_admin_flags_lock = threading.Lock()
+
+def is_admin_user_cached(user_id):
+    """Check if a user is admin or administrator, using the in-memory cache"""
+    with _user_admin_flags_lock:
+        if user_id in _user_admin_flags:
+            return _user_admin_flags[user_id]
     
     conn = get_db_connection()
     cursor = conn.cursor()
-    
-    # Check if user is admin
     cursor.execute(
         "SELECT is_admin, is_administrator FROM users WHERE id = %s",
-        (session['user_id'],)
+        (user_id,)
     )
     user_roles = cursor.fetchone()
-    is_admin_user = user_roles and (user_roles[0] or user_roles[1])
+    cursor.close()
+    conn.close()
+    
+    is_admin_user = bool(user_roles and (user_roles[0] or user_roles[1]))
+    with _user_admin_flags_lock:
+        _user_admin_flags[user_id] = is_admin_user
+    return is_admin_user
+
+def forget_user_admin_flag(user_id):
+    """Drop a user's cached admin flag after their roles changed"""
+    with _user_admin_flags_lock:
+        _user_admin_flags.pop(user_id, None)
+
+def screen_from_row(row, with_owner=False):
+    """Convert a screens row to its API representation
+
+    Expects id, serial_number, custom_name, latitude, longitude,
+    online_status, last_seen, created_at and, with_owner, the owner's
+    username.
+    """
+    screen = {
+        'id': row[0],
+        'serial_number': row[1],
+        'custom_name': row[2],
+        'latitude': float(row[3]) if row[3] else None,
+        'longitude': float(row[4]) if row[4] else None,
+        'online_status': bool(row[5]),
+        'last_seen': row[6].isoformat() if row[6] else None,
+        'created_at': row[7].isoformat() if row[7] else None,
+        'assigned': True
+    }
+    if with_owner:
+        screen['assigned_user'] = row[8]
+        screen['assigned'] = bool(row[8])
+    return screen
+
+def controller_from_row(row):
+    """Convert an unassigned controllers row to its API representation
+
+    Expects id, serial_number, latitude, longitude, online_status,
+    last_seen and created_at.
+    """
+    return {
+        'id': row[0],
+        'serial_number': row[1],
+        'custom_name': None,
+        'latitude': float(row[2]) if row[2] else None,
+        'longitude': float(row[3]) if row[3] else None,
+        'online_status': bool(row[4]),
+        'last_seen': row[5].isoformat() if row[5] else None,
+        'created_at': row[6].isoformat() if row[6] else None,
+        'assigned_user': None,
+        'assigned': False,
+        'is_controller': True
+    }
+
+# Changed entries a delta sync fetches by serial number; a client that missed
+# more gets the full list, which is cheaper than a huge IN (...) list and
+# stays under SQLite's bound parameter limit
+SCREEN_DELTA_MAX_CHANGES = 500
+
+def build_screen_list(user_id, is_admin_user, serial_numbers=None):
+    """Query the screen list of a user, or the whole fleet for admins
+
+    When serial_numbers is given only those screens and controllers are
+    returned, which is how delta syncs fetch changed entries.
+    """
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    serial_filter = ''
+    serial_params = ()
+    if serial_numbers is not None:
+        serial_filter = f"serial_number IN ({', '.join(['%s'] * len(serial_numbers))})"
+        serial_params = tuple(serial_numbers)
     
     if is_admin_user:
         # Admin can see all screens and unassigned controllers
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT s.id, s.serial_number, s.custom_name, s.latitude, s.longitude, 
                    s.online_status, s.last_seen, s.created_at, u.username as assigned_user
             FROM screens s
             LEFT JOIN users u ON s.user_id = u.id
+            {'WHERE s.' + serial_filter if serial_filter else ''}
             ORDER BY s.created_at DESC
-        """)
+        """, serial_params)
         
-        screens = []
-        for row in cursor.fetchall():
-            screens.append({
-                'id': row[0],
-                'serial_number': row[1],
-                'custom_name': row[2],
-                'latitude': float(row[3]) if row[3] else None,
-                'longitude': float(row[4]) if row[4] else None,
-                'online_status': bool(row[5]),
-                'last_seen': row[6].isoformat() if row[6] else None,
-                'created_at': row[7].isoformat() if row[7] else None,
-                'assigned_user': row[8],
-                'assigned': bool(row[8])
-            })
+        screens = [screen_from_row(row, with_owner=True) for row in cursor.fetchall()]
         
         # Also get unassigned controllers
-        cursor.execute("""
+        cursor.execute(f"""
             SELECT id, serial_number, latitude, longitude, online_status, last_seen, created_at
             FROM controllers
-            WHERE assigned = FALSE
+            WHERE assigned = FALSE {'AND ' + serial_filter if serial_filter else ''}
             ORDER BY created_at DESC
-        """)
+        """, serial_params)
         
-        unassigned_controllers = []
-        for row in cursor.fetchall():
-            unassigned_controllers.append({
-                'id': row[0],
-                'serial_number': row[1],
-                'custom_name': None,
-                'latitude': float(row[2]) if row[2] else None,
-                'longitude': float(row[3]) if row[3] else None,
-                'online_status': bool(row[4]),
-                'last_seen': row[5].isoformat() if row[5] else None,
-                'created_at': row[6].isoformat() if row[6] else None,
-                'assigned_user': None,
-                'assigned': False,
-                'is_controller': True
-            })
+        unassigned_controllers = [controller_from_row(row) for row in cursor.fetchall()]
         
         cursor.close()
         conn.close()
         
-        return jsonify({
+        return {
             'screens': screens,
             'unassigned_controllers': unassigned_controllers
-        }), 200
+        }
+    
+    # Regular user sees only their assigned screens
+    cursor.execute(f"""
+        SELECT s.id, s.serial_number, s.custom_name, s.latitude, s.longitude, 
+               s.online_status, s.last_seen, s.created_at
+        FROM screens s
+        WHERE s.user_id = %s {'AND s.' + serial_filter if serial_filter else ''}
+        ORDER BY s.created_at DESC
+    """, (user_id,) + serial_params)
+    
+    screens = [screen_from_row(row) for row in cursor.fetchall()]
+    
+    cursor.close()
+    conn.close()
+    
+    return {'screens': screens}
+
+def build_screen_delta(user_id, is_admin_user, serial_numbers):
+    """Build a delta of the screen list for the given changed serial numbers"""
+    if not serial_numbers:
+        delta = {'screens': []}
+        if is_admin_user:
+            delta['unassigned_controllers'] = []
     else:
-        # Regular user sees only their assigned screens
-        cursor.execute("""
-            SELECT s.id, s.serial_number, s.custom_name, s.latitude, s.longitude, 
-                   s.online_status, s.last_seen, s.created_at
-            FROM screens s
-            WHERE s.user_id = %s
-            ORDER BY s.created_at DESC
-        """, (session['user_id'],))
+        delta = build_screen_list(user_id, is_admin_user, serial_numbers)
+    
+    # Changed entries that are no longer visible in this list were removed
+    # (deleted, unbound, or assigned away from the unassigned controllers)
+    present = {screen['serial_number'] for screen in delta['screens']}
+    present.update(controller['serial_number'] for controller in delta.get('unassigned_controllers', []))
+    delta['removed'] = [serial for serial in serial_numbers if serial not in present]
+    delta['delta'] = True
+    return delta
+
+# Paginated screen list
+# Sorting uses keyset pagination on (sort key, id) so every page is an index
+# range scan, no matter how deep the client has paged.
+SCREEN_PAGE_PARAMS = ('limit', 'cursor', 'sort', 'order', 'online_status', 'assigned_user', 'q', 'type')
+SCREEN_PAGE_SORT_KEYS = {
+    # sort key -> (screens row index, controllers row index)
+    'created_at': (7, 6),
+    'last_seen': (6, 5),
+    'serial_number': (1, 1)
+}
+SCREEN_PAGE_DEFAULT_LIMIT = 50
+SCREEN_PAGE_MAX_LIMIT = 500
+
+def encode_page_cursor(value, row_id):
+    """Encode the keyset position after a row as an opaque cursor"""
+    position = json.dumps([str(value) if value is not None else None, row_id])
+    return base64.urlsafe_b64encode(position.encode()).decode()
+
+def decode_page_cursor(cursor):
+    """Decode a cursor into (sort value, id), or None if it is malformed"""
+    try:
+        value, row_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(row_id)
+    except (ValueError, TypeError):
+        return None
+
+def parse_screen_page_args(args, is_admin_user):
+    """Parse pagination, sorting and filter parameters
+
+    Returns (options, None, None) or (None, error message, status code).
+    """
+    options = {
+        'type': args.get('type', 'screens'),
+        'sort': args.get('sort', 'created_at'),
+        'order': args.get('order', 'desc').lower(),
+        'online_status': None,
+        'assigned_user': args.get('assigned_user', '').strip() or None,
+        'q': args.get('q', '').strip()[:100] or None,
+        'cursor': None
+    }
+    
+    if options['type'] not in ('screens', 'controllers'):
+        return None, 'type must be screens or controllers', 400
+    if not is_admin_user and (options['type'] == 'controllers' or options['assigned_user']):
+        return None, 'Admin access required', 403
+    if options['type'] == 'controllers' and options['assigned_user']:
+        return None, 'Unassigned controllers have no assigned user', 400
+    if options['sort'] not in SCREEN_PAGE_SORT_KEYS:
+        return None, f"sort must be one of: {', '.join(SCREEN_PAGE_SORT_KEYS)}", 400
+    if options['order'] not in ('asc', 'desc'):
+        return None, 'order must be asc or desc', 400
+    
+    try:
+        options['limit'] = int(args.get('limit', SCREEN_PAGE_DEFAULT_LIMIT))
+    except ValueError:
+        return None, 'limit must be a number', 400
+    if not 1 <= options['limit'] <= SCREEN_PAGE_MAX_LIMIT:
+        return None, f'limit must be between 1 and {SCREEN_PAGE_MAX_LIMIT}', 400
+    
+    online_status = args.get('online_status')
+    if online_status is not None:
+        if online_status.lower() not in ('true', 'false'):
+            return None, 'online_status must be true or false', 400
+        options['online_status'] = online_status.lower() == 'true'
+    
+    if args.get('cursor'):
+        options['cursor'] = decode_page_cursor(args['cursor'])
+        if options['cursor'] is None:
+            return None, 'Invalid cursor', 400
+    
+    return options, None, None
+
+def screen_page_filters(options, user_id, is_admin_user):
+    """Build the WHERE clauses and parameters for a screen list page or count"""
+    clauses = []
+    params = []
+    
+    if options['type'] == 'controllers':
+        prefix = 'c.'
+        clauses.append('c.assigned = FALSE')
+    else:
+        prefix = 's.'
+        if not is_admin_user:
+            clauses.append('s.user_id = %s')
+            params.append(user_id)
+    
+    if options['online_status'] is not None:
+        clauses.append(f'{prefix}online_status = %s')
+        params.append(options['online_status'])
+    
+    if options['assigned_user']:
+        clauses.append('u.username = %s')
+        params.append(options['assigned_user'])
+    
+    if options['q']:
+        # Prefix match, so the serial number and custom name indexes apply
+        pattern = options['q'].replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        if options['type'] == 'controllers':
+            clauses.append('c.serial_number LIKE %s')
+            params.append(pattern)
+        else:
+            clauses.append('(s.serial_number LIKE %s OR s.custom_name LIKE %s)')
+            params.extend([pattern, pattern])
+    
+    return clauses, params
+
+def screen_page_from_clause(options, is_admin_user):
+    """Get the FROM clause for a screen list page or count"""
+    if options['type'] == 'controllers':
+        return 'FROM controllers c'
+    if is_admin_user:
+        return 'FROM screens s LEFT JOIN users u ON s.user_id = u.id'
+    return 'FROM screens s'
+
+def query_screen_page(options, user_id, is_admin_user):
+    """Query one page of screens or unassigned controllers"""
+    controllers = options['type'] == 'controllers'
+    prefix = 'c.' if controllers else 's.'
+    clauses, params = screen_page_filters(options, user_id, is_admin_user)
+    
+    sort_column = f"{prefix}{options['sort']}"
+    comparison = '<' if options['order'] == 'desc' else '>'
+    direction = options['order'].upper()
+    
+    if options['cursor']:
+        # MariaDB sorts NULLs (never-seen last_seen) first ascending, last descending
+        value, row_id = options['cursor']
+        id_after = f"{prefix}id {comparison} %s"
+        if value is None and options['order'] == 'desc':
+            clauses.append(f"({sort_column} IS NULL AND {id_after})")
+            params.append(row_id)
+        elif value is None:
+            clauses.append(f"({sort_column} IS NOT NULL OR {id_after})")
+            params.append(row_id)
+        else:
+            nulls_after = f" OR {sort_column} IS NULL" if options['order'] == 'desc' else ''
+            clauses.append(
+                f"({sort_column} {comparison} %s OR ({sort_column} = %s AND {id_after}){nulls_after})"
+            )
+            params.extend([value, value, row_id])
+    
+    if controllers:
+        columns = 'c.id, c.serial_number, c.latitude, c.longitude, c.online_status, c.last_seen, c.created_at'
+    else:
+        columns = 's.id, s.serial_number, s.custom_name, s.latitude, s.longitude, s.online_status, s.last_seen, s.created_at'
+        if is_admin_user:
+            columns += ', u.username'
+    
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT {columns}
+        {screen_page_from_clause(options, is_admin_user)}
+        {where}
+        ORDER BY {sort_column} {direction}, {prefix}id {direction}
+        LIMIT %s
+    """, tuple(params) + (options['limit'] + 1,))
+    rows = cursor.fetchall()
+    cursor.close()
+    conn.close()
+    
+    has_more = len(rows) > options['limit']
+    rows = rows[:options['limit']]
+    
+    if controllers:
+        items = [controller_from_row(row) for row in rows]
+    else:
+        items = [screen_from_row(row, with_owner=is_admin_user) for row in rows]
+    
+    next_cursor = None
+    if has_more:
+        sort_index = SCREEN_PAGE_SORT_KEYS[options['sort']][1 if controllers else 0]
+        next_cursor = encode_page_cursor(rows[-1][sort_index], rows[-1][0])
+    
+    return {
+        'unassigned_controllers' if controllers else 'screens': items,
+        'next_cursor': next_cursor
+    }
+
+def count_screens(options, user_id, is_admin_user):
+    """Count screens or unassigned controllers matching the filters"""
+    prefix = 'c.' if options['type'] == 'controllers' else 's.'
+    clauses, params = screen_page_filters(options, user_id, is_admin_user)
+    where = f"WHERE {' AND '.join(clauses)}" if clauses else ''
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    cursor.execute(f"""
+        SELECT COUNT(*), COALESCE(SUM({prefix}online_status), 0),
+               COALESCE(SUM({prefix}latitude IS NOT NULL AND {prefix}longitude IS NOT NULL), 0)
+        {screen_page_from_clause(options, is_admin_user)}
+        {where}
+    """, tuple(params))
+    total, online, with_location = cursor.fetchone()
+    cursor.close()
+    conn.close()
+    
+    return {
+        'count': int(total),
+        'online': int(online),
+        'offline': int(total) - int(online),
+        'with_location': int(with_location)
+    }
+
+def query_etag(scope, version):
+    """Build an entity tag for a version of a scope and the request's query"""
+    query_hash = hashlib.sha1(request.query_string).hexdigest()[:12]
+    return f"{make_etag(scope, version)}-{query_hash}"
+
+@app.route('/api/screens/count', methods=['GET'])
+def get_screens_count():
+    """Count screens or unassigned controllers matching the list filters"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    scope = ADMIN_SCOPE if is_admin_user else user_id
+    
+    options, error, status = parse_screen_page_args(request.args, is_admin_user)
+    if error:
+        return jsonify({'error': error}), status
+    
+    version = get_fleet_version(scope)
+    etag = query_etag(scope, version)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify(count_screens(options, user_id, is_admin_user))
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+# Device update writes
+# Heartbeats mostly repeat what is stored; see device_position_writes
+LOCATION_WRITE_EPSILON = float(os.environ.get('LOCATION_WRITE_EPSILON', 0.00001))  # ~1 m
+HEARTBEAT_WRITE_INTERVAL = int(os.environ.get('HEARTBEAT_WRITE_INTERVAL', 60))
+
+# Map viewport queries
+# Located screens are kept in the in-memory grid of modules.geo, refreshed
+# from the fleet change log so every write path is picked up.
+GEO_MAX_INCREMENTAL_REFRESH = 1000
+GEO_MAX_ZOOM = 22
+
+_geo_refresh_lock = threading.Lock()
+
+def load_geo_entries(serial_numbers=None):
+    """Load located screens and unassigned controllers for the geo index"""
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    serial_filter = ''
+    serial_params = ()
+    if serial_numbers is not None:
+        serial_filter = f"serial_number IN ({', '.join(['%s'] * len(serial_numbers))})"
+        serial_params = tuple(serial_numbers)
+    
+    cursor.execute(f"""
+        SELECT s.id, s.serial_number, s.custom_name, s.latitude, s.longitude,
+               s.online_status, s.last_seen, s.created_at, u.username, s.user_id
+        FROM screens s
+        LEFT JOIN users u ON s.user_id = u.id
+        WHERE s.latitude IS NOT NULL AND s.longitude IS NOT NULL {'AND s.' + serial_filter if serial_filter else ''}
+    """, serial_params)
+    entries = [
+        (row[1], float(row[3]), float(row[4]), row[9], screen_from_row(row, with_owner=True))
+        for row in cursor.fetchall()
+    ]
+    
+    cursor.execute(f"""
+        SELECT id, serial_number, latitude, longitude, online_status, last_seen, created_at
+        FROM controllers
+        WHERE assigned = FALSE AND latitude IS NOT NULL AND longitude IS NOT NULL {'AND ' + serial_filter if serial_filter else ''}
+    """, serial_params)
+    entries.extend(
+        (row[1], float(row[2]), float(row[3]), None, controller_from_row(row))
+        for row in cursor.fetchall()
+    )
+    
+    cursor.close()
+    conn.close()
+    
+    return entries
+
+def refresh_geo_index():
+    """Bring the geo index up to date with the current fleet version"""
+    with _geo_refresh_lock:
+        # Read the version first so writes racing the load trigger another refresh
+        version = get_fleet_version(ADMIN_SCOPE)
+        indexed_version = get_geo_version()
+        if indexed_version == version:
+            return
+        
+        changes = None
+        if indexed_version is not None:
+            changes = get_changes_since(ADMIN_SCOPE, indexed_version)
+        
+        if changes is None or len(changes) > GEO_MAX_INCREMENTAL_REFRESH:
+            replace_geo_entries(load_geo_entries(), version)
+        else:
+            update_geo_entries(changes, load_geo_entries(changes) if changes else [], version)
+
+def parse_position(latitude, longitude):
+    """Parse a reported position, returning None unless both coordinates are valid"""
+    try:
+        latitude, longitude = float(latitude), float(longitude)
+    except (TypeError, ValueError):
+        return None
+    # float() accepts 'nan' and 'inf', which would poison the geo grid and
+    # the geofence distance
+    if not (math.isfinite(latitude) and math.isfinite(longitude)):
+        return None
+    if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+        return None
+    return latitude, longitude
+
+def parse_geofence_settings(data):
+    """Parse the geofence fields of a screen update
+
+    Returns ({column: value} for the fields present, None) or (None, error).
+    """
+    limits = {
+        'home_latitude': (-90, 90),
+        'home_longitude': (-180, 180),
+        'geofence_radius': (1, 1000000)
+    }
+    settings = {}
+    for column, (low, high) in limits.items():
+        if column not in data:
+            continue
+        value = data[column]
+        if value is not None:
+            try:
+                value = int(value) if column == 'geofence_radius' else float(value)
+            except (TypeError, ValueError):
+                return None, f'{column} must be a number'
+            if not low <= value <= high:
+                return None, f'{column} must be between {low} and {high}'
+        settings[column] = value
+    
+    # Clearing either home coordinate clears the home
+    if settings.get('home_latitude', 0) is None or settings.get('home_longitude', 0) is None:
+        settings['home_latitude'] = settings['home_longitude'] = None
+    return settings, None
+
+def device_position_writes(stored, latitude, longitude, position, force=False):
+    """Get the column writes a device update needs for position and liveness
+
+    stored is the device's (latitude, longitude, online_status, seconds
+    since last_seen) row. Positions within LOCATION_WRITE_EPSILON degrees
+    of the stored one aren't rewritten, and last_seen only every
+    HEARTBEAT_WRITE_INTERVAL seconds, so a stationary device that is
+    already online usually needs no write at all. With force, last_seen
+    is written regardless. Returns (assignments, params).
+    """
+    stored_latitude, stored_longitude, online_status, seconds_since_seen = stored
+    
+    if position is None or stored_latitude is None or stored_longitude is None:
+        # Missing coordinates are stored as reported
+        moved = (latitude, longitude) != (stored_latitude, stored_longitude)
+    else:
+        moved = (abs(position[0] - float(stored_latitude)) > LOCATION_WRITE_EPSILON or
+                 abs(position[1] - float(stored_longitude)) > LOCATION_WRITE_EPSILON)
+    
+    assignments = []
+    params = []
+    if moved:
+        assignments.append('latitude = %s, longitude = %s')
+        params.extend([latitude, longitude])
+    
+    if (moved or force or not online_status or seconds_since_seen is None or
+            seconds_since_seen >= HEARTBEAT_WRITE_INTERVAL):
+        assignments.append('online_status = TRUE, last_seen = CURRENT_TIMESTAMP')
+    
+    return assignments, params
+
+def check_geofence(serial_number, screen, position):
+    """Check a reported position against a screen's geofence
+
+    screen is the row device_update selects. Returns the alert to raise
+    when the screen left or returned to its geofence, otherwise None.
+    """
+    fence = get_geofence(serial_number, screen[2], screen[3], screen[4])
+    if fence is None or position is None:
+        return None
+    
+    outside = is_outside_geofence(fence, *position)
+    if outside == bool(screen[5]):
+        return None
+    
+    return {
+        'alert_type': ALERT_GEOFENCE_EXIT if outside else ALERT_GEOFENCE_RETURN,
+        'latitude': position[0],
+        'longitude': position[1],
+        'distance_meters': round(geofence_distance(fence, *position), 2)
+    }
+
+def apply_device_geo_update(serial_number, latitude, longitude, sequence, timestamp):
+    """Move a reporting device in the geo index without a reload"""
+    latitude, longitude = parse_position(latitude, longitude) or (None, None)
+    
+    apply_geo_update(serial_number, latitude, longitude, {
+        'online_status': True,
+        'last_seen': timestamp
+    }, sequence)
+
+def parse_bbox(value):
+    """Parse a west,south,east,north bounding box, returning None if invalid"""
+    try:
+        west, south, east, north = (float(part) for part in (value or '').split(','))
+    except ValueError:
+        return None
+    if not all(-1000 <= coordinate <= 1000 for coordinate in (west, south, east, north)):
+        return None
+    if south > north:
+        return None
+    return west, south, east, north
+
+@app.route('/api/screens/geo', methods=['GET'])
+def get_screens_geo():
+    """Get the screens located inside a map viewport
+
+    bbox is west,south,east,north in degrees; zoom is the map zoom level.
+    Up to GEO_CLUSTER_MAX_ZOOM, screens sharing a cluster cell are returned
+    as clusters with their count, online/offline split and centroid.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    bbox = parse_bbox(request.args.get('bbox'))
+    if bbox is None:
+        return jsonify({'error': 'bbox must be west,south,east,north'}), 400
+    
+    try:
+        zoom = int(request.args.get('zoom', GEO_MAX_ZOOM))
+    except ValueError:
+        return jsonify({'error': 'zoom must be a number'}), 400
+    if not 0 <= zoom <= GEO_MAX_ZOOM:
+        return jsonify({'error': f'zoom must be between 0 and {GEO_MAX_ZOOM}'}), 400
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    scope = ADMIN_SCOPE if is_admin_user else user_id
+    version = get_fleet_version(scope)
+    
+    etag = query_etag(scope, version)
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        refresh_geo_index()
+        
+        payload = {}
+        if zoom <= GEO_CLUSTER_MAX_ZOOM:
+            payload['clusters'], items = query_geo_clusters(
+                *bbox, zoom, GEO_ALL_SCREENS if is_admin_user else user_id
+            )
+            if is_admin_user:
+                payload['controller_clusters'], controllers = query_geo_clusters(*bbox, zoom, GEO_UNASSIGNED)
+                items = items + controllers
+        else:
+            items = query_geo_bbox(*bbox, user_id=None if is_admin_user else user_id)
         
-        screens = []
-        for row in cursor.fetchall():
-            screens.append({
-                'id': row[0],
-                'serial_number': row[1],
-                'custom_name': row[2],
-                'latitude': float(row[3]) if row[3] else None,
-                'longitude': float(row[4]) if row[4] else None,
-                'online_status': bool(row[5]),
-                'last_seen': row[6].isoformat() if row[6] else None,
-                'created_at': row[7].isoformat() if row[7] else None,
-                'assigned': True
-            })
+        if is_admin_user:
+            payload['screens'] = [item for item in items if not item.get('is_controller')]
+            payload['unassigned_controllers'] = [item for item in items if item.get('is_controller')]
+        else:
+            payload['screens'] = [
+                {key: value for key, value in item.items() if key != 'assigned_user'} for item in items
+            ]
         
-        cursor.close()
-        conn.close()
+        payload['version'] = make_version_token(version)
+        response = jsonify(payload)
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+@app.route('/api/screens', methods=['GET'])
+def get_screens():
+    """Get all screens for current user or all screens for admin
+
+    Responses carry a strong ETag derived from the fleet version, so
+    unchanged lists are answered with 304 without touching the database.
+    With ?since=<version> only the screens and controllers changed or
+    removed since that version are returned. Any of SCREEN_PAGE_PARAMS
+    switches to a single filtered, keyset-paginated page of screens or
+    (type=controllers) unassigned controllers.
+    """
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    scope = ADMIN_SCOPE if is_admin_user else user_id
+    
+    # Read the version before querying so a concurrent write invalidates
+    # what we are about to build
+    version = get_fleet_version(scope)
+    
+    since = request.args.get('since')
+    if since:
+        since_version = parse_version_token(since)
+        changed = get_changes_since(scope, since_version) if since_version is not None else None
+        if changed is not None and len(changed) <= SCREEN_DELTA_MAX_CHANGES:
+            delta = build_screen_delta(user_id, is_admin_user, changed)
+            delta['version'] = make_version_token(version)
+            response = jsonify(delta)
+            response.headers['Cache-Control'] = 'private, no-store'
+            return response, 200
+        # Too old to reconstruct, or too many changes; fall through to a full list
+    
+    elif any(param in request.args for param in SCREEN_PAGE_PARAMS):
+        options, error, status = parse_screen_page_args(request.args, is_admin_user)
+        if error:
+            return jsonify({'error': error}), status
+        
+        etag = query_etag(scope, version)
+        if request.if_none_match.contains(etag):
+            response = make_response('', 304)
+        else:
+            page = query_screen_page(options, user_id, is_admin_user)
+            page['version'] = make_version_token(version)
+            response = jsonify(page)
         
-        return jsonify({'screens': screens}), 200
+        response.set_etag(etag)
+        response.headers['Cache-Control'] = 'private, no-cache'
+        return response
+    
+    etag = make_etag(scope, version)
+    
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        payload = get_cached_payload(scope, version)
+        if payload is None:
+            screen_list = build_screen_list(user_id, is_admin_user)
+            screen_list['version'] = make_version_token(version)
+            payload = app.json.dumps(screen_list)
+            store_cached_payload(scope, version, payload)
+        response = make_response(payload, 200)
+        response.mimetype = 'application/json'
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
 
 @app.route('/api/screens', methods=['POST'])
 def add_screen():
@@ -1253,6 +2213,8 @@ def add_screen():
         cursor.close()
         conn.close()
         
+        record_fleet_change(serial_number, session['user_id'])
+        
         return jsonify({
             'message': 'Controller assigned successfully',
             'screen': {
@@ -1273,6 +2235,8 @@ def add_screen():
         cursor.close()
         conn.close()
         
+        record_fleet_change(serial_number, session['user_id'])
+        
         return jsonify({
             'message': 'Screen added successfully (controller will be available when it registers)',
             'screen': {
@@ -1284,13 +2248,22 @@ def add_screen():
 
 @app.route('/api/screens/<int:screen_id>', methods=['PUT'])
 def update_screen(screen_id):
-    """Update screen details"""
+    """Update screen details
+
+    home_latitude, home_longitude and geofence_radius (meters) set the
+    screen's geofence. Setting the home to null makes the next reported
+    location the new home.
+    """
     if 'user_id' not in session:
         return jsonify({'error': 'Not authenticated'}), 401
     
     data = request.get_json()
     custom_name = data.get('custom_name', '')
     
+    geofence, error = parse_geofence_settings(data)
+    if error:
+        return jsonify({'error': error}), 400
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
@@ -1311,31 +2284,37 @@ def update_screen(screen_id):
     if is_current_user_admin:
         # Admin can update any screen
         cursor.execute(
-            "SELECT id FROM screens WHERE id = %s",
+            "SELECT id, user_id, serial_number FROM screens WHERE id = %s",
             (screen_id,)
         )
     else:
         # Regular user can only update their own screens
         cursor.execute(
-            "SELECT id FROM screens WHERE id = %s AND user_id = %s",
+            "SELECT id, user_id, serial_number FROM screens WHERE id = %s AND user_id = %s",
             (screen_id, session['user_id'])
         )
     
-    if not cursor.fetchone():
+    screen = cursor.fetchone()
+    if not screen:
         cursor.close()
         conn.close()
         return jsonify({'error': 'Screen not found or access denied'}), 404
     
-    # Update screen
+    # Update screen; a changed geofence is evaluated afresh on the next report
+    assignments = ['custom_name = %s'] + [f'{column} = %s' for column in geofence]
+    if geofence:
+        assignments.append('geofence_breached = FALSE')
     cursor.execute(
-        "UPDATE screens SET custom_name = %s WHERE id = %s",
-        (custom_name, screen_id)
+        f"UPDATE screens SET {', '.join(assignments)} WHERE id = %s",
+        (custom_name, *geofence.values(), screen_id)
     )
     
     conn.commit()
     cursor.close()
     conn.close()
     
+    record_fleet_change(screen[2], screen[1])
+    
     return jsonify({'message': 'Screen updated successfully'}), 200
 
 @app.route('/api/screens/<int:screen_id>', methods=['DELETE'])
@@ -1364,17 +2343,18 @@ def delete_screen(screen_id):
     if is_current_user_admin:
         # Admin can delete any screen
         cursor.execute(
-            "SELECT id FROM screens WHERE id = %s",
+            "SELECT id, user_id, serial_number FROM screens WHERE id = %s",
             (screen_id,)
         )
     else:
         # Regular user can only delete their own screens
         cursor.execute(
-            "SELECT id FROM screens WHERE id = %s AND user_id = %s",
+            "SELECT id, user_id, serial_number FROM screens WHERE id = %s AND user_id = %s",
             (screen_id, session['user_id'])
         )
     
-    if not cursor.fetchone():
+    screen = cursor.fetchone()
+    if not screen:
         cursor.close()
         conn.close()
         return jsonify({'error': 'Screen not found or access denied'}), 404
@@ -1386,6 +2366,9 @@ def delete_screen(screen_id):
     cursor.close()
     conn.close()
     
+    record_fleet_change(screen[2], screen[1])
+    forget_geofence(screen[2])
+    
     return jsonify({'message': 'Screen deleted successfully'}), 200
 
 @app.route('/api/screens/<int:screen_id>/unbind', methods=['POST'])
@@ -1416,7 +2399,7 @@ def unbind_screen(screen_id):
             # Admin can unbind any screen
             cursor.execute("""
                 SELECT s.serial_number, s.latitude, s.longitude, s.online_status, s.last_seen,
-                       u.username
+                       u.username, s.user_id
                 FROM screens s
                 JOIN users u ON s.user_id = u.id
                 WHERE s.id = %s
@@ -1425,7 +2408,7 @@ def unbind_screen(screen_id):
             # Regular user can only unbind their own screens
             cursor.execute("""
                 SELECT s.serial_number, s.latitude, s.longitude, s.online_status, s.last_seen,
-                       u.username
+                       u.username, s.user_id
                 FROM screens s
                 JOIN users u ON s.user_id = u.id
                 WHERE s.id = %s AND s.user_id = %s
@@ -1437,15 +2420,16 @@ def unbind_screen(screen_id):
             conn.close()
             return jsonify({'error': 'Screen not found or access denied'}), 404
         
-        serial_number, latitude, longitude, online_status, last_seen, owner_username = screen_data
+        serial_number, latitude, longitude, online_status, last_seen, owner_username, owner_id = screen_data
         
         # Move screen back to controllers table as unassigned
-        # Use ON DUPLICATE KEY UPDATE to handle case where controller already exists
+        # Use ON DUPLICATE KEY UPDATE to handle case where controller already exists;
+        # an existing controller keeps its registration key so its signed
+        # requests keep verifying after the unbind
         cursor.execute("""
             INSERT INTO controllers (serial_number, registration_key, latitude, longitude, online_status, last_seen, assigned)
             VALUES (%s, %s, %s, %s, %s, %s, FALSE)
             ON DUPLICATE KEY UPDATE
-                registration_key = VALUES(registration_key),
                 latitude = VALUES(latitude),
                 longitude = VALUES(longitude),
                 online_status = VALUES(online_status),
@@ -1467,11 +2451,14 @@ def unbind_screen(screen_id):
         cursor.close()
         conn.close()
         
+        record_fleet_change(serial_number, owner_id)
+        forget_geofence(serial_number)
+        
         return jsonify({
             'message': f'Screen {serial_number} has been unbound and is now an unassigned controller'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Failed to unbind screen: {str(e)}'}), 500
@@ -1539,6 +2526,67 @@ def get_screen_data(screen_id):
     
     return jsonify({'data': data}), 200
 
+@app.route('/api/screens/<int:screen_id>/alerts', methods=['GET'])
+def get_screen_alerts(screen_id):
+    """Get a screen's geofence and its recent alerts"""
+    if 'user_id' not in session:
+        return jsonify({'error': 'Not authenticated'}), 401
+    
+    is_admin_user = is_admin_user_cached(session['user_id'])
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    
+    # Verify screen access - admin can access any screen, regular users only their own
+    if is_admin_user:
+        cursor.execute("""
+            SELECT home_latitude, home_longitude, geofence_radius, geofence_breached
+            FROM screens WHERE id = %s
+        """, (screen_id,))
+    else:
+        cursor.execute("""
+            SELECT home_latitude, home_longitude, geofence_radius, geofence_breached
+            FROM screens WHERE id = %s AND user_id = %s
+        """, (screen_id, session['user_id']))
+    
+    screen = cursor.fetchone()
+    if not screen:
+        cursor.close()
+        conn.close()
+        return jsonify({'error': 'Screen not found or access denied'}), 404
+    
+    cursor.execute("""
+        SELECT id, alert_type, latitude, longitude, distance_meters, created_at
+        FROM screen_alerts
+        WHERE screen_id = %s
+        ORDER BY created_at DESC, id DESC
+        LIMIT 100
+    """, (screen_id,))
+    
+    alerts = []
+    for row in cursor.fetchall():
+        alerts.append({
+            'id': row[0],
+            'alert_type': row[1],
+            'latitude': float(row[2]) if row[2] is not None else None,
+            'longitude': float(row[3]) if row[3] is not None else None,
+            'distance_meters': float(row[4]) if row[4] is not None else None,
+            'created_at': row[5].isoformat() if row[5] else None
+        })
+    
+    cursor.close()
+    conn.close()
+    
+    return jsonify({
+        'geofence': {
+            'home_latitude': float(screen[0]) if screen[0] is not None else None,
+            'home_longitude': float(screen[1]) if screen[1] is not None else None,
+            'radius': screen[2] or GEOFENCE_DEFAULT_RADIUS,
+            'breached': bool(screen[3])
+        },
+        'alerts': alerts
+    }), 200
+
 # API endpoint for Android devices to send data
 @app.route('/api/device/update', methods=['POST'])
 def device_update():
@@ -1552,11 +2600,23 @@ def device_update():
     if not serial_number:
         return jsonify({'error': 'Serial number is required'}), 400
     
+    auth_check, auth_response, auth_status = require_controller_auth(serial_number)
+    if not auth_check:
+        return auth_response, auth_status
+    
     conn = get_db_connection()
     cursor = conn.cursor()
     
+    position = parse_position(latitude, longitude)
+    # Invalid coordinates (non-numeric, NaN, out of range) are stored as missing
+    latitude, longitude = position or (None, None)
+    
     # First check if this is an assigned screen
-    cursor.execute("SELECT id, user_id FROM screens WHERE serial_number = %s", (serial_number,))
+    cursor.execute("""
+        SELECT id, user_id, home_latitude, home_longitude, geofence_radius, geofence_breached,
+               latitude, longitude, online_status, TIMESTAMPDIFF(SECOND, last_seen, NOW())
+        FROM screens WHERE serial_number = %s
+    """, (serial_number,))
     screen = cursor.fetchone()
     
     if screen:
@@ -1564,12 +2624,35 @@ def device_update():
         screen_id = screen[0]
         current_year = datetime.now().year
         
-        # Update screen location and status
-        cursor.execute("""
-            UPDATE screens
-            SET latitude = %s, longitude = %s, online_status = TRUE, last_seen = CURRENT_TIMESTAMP
-            WHERE id = %s
-        """, (latitude, longitude, screen_id))
+        alert = check_geofence(serial_number, screen, position)
+        
+        # Only write what changed; the first reported location becomes home
+        geofence_assignments = []
+        geofence_params = []
+        if position and (screen[2] is None or screen[3] is None):
+            geofence_assignments.append('home_latitude = %s, home_longitude = %s')
+            geofence_params.extend(position)
+        if alert:
+            geofence_assignments.append('geofence_breached = %s')
+            geofence_params.append(alert['alert_type'] == ALERT_GEOFENCE_EXIT)
+        
+        assignments, params = device_position_writes(
+            screen[6:10], latitude, longitude, position, force=bool(geofence_assignments)
+        )
+        assignments += geofence_assignments
+        params += geofence_params
+        
+        if assignments:
+            cursor.execute(
+                f"UPDATE screens SET {', '.join(assignments)} WHERE id = %s",
+                (*params, screen_id)
+            )
+        
+        if alert:
+            cursor.execute("""
+                INSERT INTO screen_alerts (screen_id, alert_type, latitude, longitude, distance_meters)
+                VALUES (%s, %s, %s, %s, %s)
+            """, (screen_id, alert['alert_type'], alert['latitude'], alert['longitude'], alert['distance_meters']))
         
         # Add data entry if information provided (only for assigned screens)
         if information:
@@ -1582,30 +2665,47 @@ def device_update():
         cursor.close()
         conn.close()
         
+        timestamp = datetime.now().isoformat()
+        if assignments:
+            sequence = record_fleet_change(serial_number, screen[1])
+            apply_device_geo_update(serial_number, latitude, longitude, sequence, timestamp)
+        
         # Emit real-time update to connected clients
-        socketio.emit('screen_update', {
+        rooms = screen_event_rooms(screen[1])
+        update = {
             'screen_id': screen_id,
             'serial_number': serial_number,
             'latitude': latitude,
             'longitude': longitude,
             'online_status': True,
             'information': information,
-            'timestamp': datetime.now().isoformat()
-        })
+            'timestamp': timestamp
+        }
+        deliver_screen_update(screen_id, screen[1], position, update)
+        publish('screen_update', {'screen_id': screen_id, 'owner_id': screen[1],
+                                  'position': position, 'update': update})
+        
+        if alert:
+            socketio.emit('screen_alert', dict(alert, screen_id=screen_id, serial_number=serial_number,
+                                               timestamp=timestamp), to=rooms)
         
         return jsonify({'message': 'Update received successfully'}), 200
     else:
         # Check if this is an unassigned controller
-        cursor.execute("SELECT id FROM controllers WHERE serial_number = %s", (serial_number,))
+        cursor.execute("""
+            SELECT id, latitude, longitude, online_status, TIMESTAMPDIFF(SECOND, last_seen, NOW())
+            FROM controllers WHERE serial_number = %s
+        """, (serial_number,))
         controller = cursor.fetchone()
         
         if controller:
             # Update existing unassigned controller (don't store data)
-            cursor.execute("""
-                UPDATE controllers
-                SET latitude = %s, longitude = %s, online_status = TRUE, last_seen = CURRENT_TIMESTAMP
-                WHERE id = %s
-            """, (latitude, longitude, controller[0]))
+            assignments, params = device_position_writes(controller[1:5], latitude, longitude, position)
+            if assignments:
+                cursor.execute(
+                    f"UPDATE controllers SET {', '.join(assignments)} WHERE id = %s",
+                    (*params, controller[0])
+                )
         else:
             # Create new unassigned controller
             registration_key = generate_registration_key()
@@ -1618,6 +2718,10 @@ def device_update():
         cursor.close()
         conn.close()
         
+        if not controller or assignments:
+            sequence = record_fleet_change(serial_number)
+            apply_device_geo_update(serial_number, latitude, longitude, sequence, datetime.now().isoformat())
+        
         return jsonify({'message': 'Controller update received (not assigned to user yet)'}), 200
 
 # Admin management routes
@@ -1632,9 +2736,13 @@ def admin_get_users():
     cursor = conn.cursor()
     
     cursor.execute("""
-        SELECT id, username, email, is_admin, is_administrator, two_fa_enabled, created_at
-        FROM users
-        ORDER BY created_at DESC
+        SELECT u.id, u.username, u.email, u.is_admin, u.is_administrator, u.two_fa_enabled, u.created_at,
+               COALESCE(sc.screen_count, 0)
+        FROM users u
+        LEFT JOIN (
+            SELECT user_id, COUNT(*) AS screen_count FROM screens GROUP BY user_id
+        ) sc ON sc.user_id = u.id
+        ORDER BY u.created_at DESC
     """)
     
     users = []
@@ -1646,7 +2754,8 @@ def admin_get_users():
             'is_admin': bool(row[3]),
             'is_administrator': bool(row[4]),
             'two_fa_enabled': bool(row[5]),
-            'created_at': row[6].isoformat() if row[6] else None
+            'created_at': row[6].isoformat() if row[6] else None,
+            'screen_count': int(row[7])
         })
     
     cursor.close()
@@ -1688,6 +2797,10 @@ def admin_toggle_user_admin(user_id):
     cursor.close()
     conn.close()
     
+    forget_user_admin_flag(user_id)
+    sync_socket_rooms(user_id, is_admin_user_cached(user_id))
+    publish('user_access', {'user_id': user_id, 'removed': False})
+    
     return jsonify({'message': 'User administrator status toggled'}), 200
 
 @app.route('/api/admin/create-admin', methods=['POST'])
@@ -1757,7 +2870,7 @@ def create_admin():
             'user': {'id': user_id, 'username': username, 'email': email}
         }), 201
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Admin creation failed: {str(e)}'}), 500
@@ -1807,11 +2920,13 @@ def admin_unbind_user_screens(user_id):
         cursor.close()
         conn.close()
         
+        record_fleet_change(None, user_id)
+        
         return jsonify({
             'message': f'Successfully unbound {screen_count} screens from user {user[0]}'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Failed to unbind screens: {str(e)}'}), 500
@@ -1867,7 +2982,7 @@ def admin_reset_user_password(user_id):
             'message': f'Password reset successfully for user {user[0]}'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Password reset failed: {str(e)}'}), 500
@@ -1920,7 +3035,7 @@ def admin_disable_user_2fa(user_id):
             'message': f'2FA has been disabled for user {username}'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'Failed to disable 2FA: {str(e)}'}), 500
@@ -1971,15 +3086,173 @@ def admin_delete_user(user_id):
         cursor.close()
         conn.close()
         
+        forget_user_admin_flag(user_id)
+        sync_socket_rooms(user_id, remove=True)
+        publish('user_access', {'user_id': user_id, 'removed': True})
+        record_fleet_change(None, user_id)
+        
         return jsonify({
             'message': f'User {user[0]} deleted successfully. {screen_count} screens moved to unassigned controllers.'
         }), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
     except Exception as e:
         return jsonify({'error': f'User deletion failed: {str(e)}'}), 500
 
+# Values of settings that were never saved
+ADMIN_SETTINGS_DEFAULTS = {
+    'logoUrl': None,
+    'logoText': 'LXCloud',
+    'siteName': 'LXCloud - LED Screen Management Platform',
+    'faviconUrl': None,
+    'mapMarkerOnline': None,
+    'mapMarkerOffline': None
+}
+
+UI_SETTINGS_DEFAULTS = {
+    # Original settings
+    'app_name': 'LXCloud',
+    'primary_color': '#667eea',
+    'secondary_color': '#f093fb',
+    'header_color': '#667eea',
+    'button_color': '#667eea',
+    'button_hover_color': '#5a6fd8',
+    'logo_url': '',
+    'favicon_url': '',
+    'background_image_url': '',
+    'custom_button_images': '{}',
+    
+    # Screen management button icons
+    'screen_view_data_icon': '',
+    'screen_edit_icon': '',
+    'screen_unbind_icon': '',
+    
+    # Footer customization
+    'footer_enabled': 'true',
+    'footer_text': 'Powered by LXCloud',
+    'footer_color': '#f8f9fa',
+    'footer_text_color': '#6c757d',
+    'footer_links': '{}',
+    
+    # Typography settings
+    'font_family': 'system-ui, -apple-system, sans-serif',
+    'font_size_base': '16px',
+    'font_size_heading': '24px',
+    'line_height': '1.5',
+    
+    # Navigation customization
+    'nav_style': 'default',
+    'nav_position': 'top',
+    'nav_color': '#667eea',
+    'nav_hover_color': '#5a6fd8',
+    'header_text_color': '#ffffff',
+    
+    # Advanced button customization
+    'button_style': 'default',
+    'button_size': 'medium',
+    'button_shadow': 'true',
+    'button_animation': 'true',
+    
+    # Page-specific settings
+    'dashboard_layout': 'grid',
+    'dashboard_theme': 'default',
+    'login_background_url': '',
+    'login_style': 'default',
+    
+    # Custom text overrides
+    'custom_text_labels': '{}',
+    'page_titles': '{}',
+    
+    # Advanced customization
+    'custom_css': '',
+    'theme_mode': 'light',
+    'border_radius': '8px',
+    'spacing_unit': '16px',
+    
+    # Per-page custom CSS
+    'dashboard_custom_css': '',
+    'manage_screens_custom_css': '',
+    
+    # Accessibility settings
+    'high_contrast': 'false',
+    'large_text': 'false',
+    'reduced_motion': 'false',
+    
+    # Advanced header settings
+    'header_height': '60px',
+    'header_shadow': 'true',
+    'header_sticky': 'true',
+    
+    # Header button customization
+    'header_button_alignment': 'default',
+    'header_button_vertical_alignment': 'center',
+    'header_button_spacing': '15px',
+    'header_button_individual_positions': '{}',
+    'header_button_individual_colors': '{}',
+    'header_custom_css': '',
+    
+    # Card and component styling
+    'card_shadow': 'true',
+    'card_border': 'true',
+    'card_hover_effect': 'true'
+}
+
+def load_settings(table, defaults):
+    """Get (version, settings, payload) of a settings table
+
+    Served from memory while the table's version row is unchanged; the
+    row is read at most once per SETTINGS_POLL_INTERVAL.
+    """
+    entry = get_fresh_settings(table)
+    if entry is not None:
+        return entry
+    
+    conn = get_db_connection()
+    cursor = conn.cursor()
+    try:
+        cursor.execute("SELECT version FROM settings_versions WHERE scope = %s", (table,))
+        row = cursor.fetchone()
+        version = row[0] if row else 0
+        
+        entry = get_settings_for_version(table, version)
+        if entry is None:
+            cursor.execute(f"SELECT setting_key, setting_value FROM {table}")
+            settings = {**defaults, **dict(cursor.fetchall())}
+            entry = store_settings(table, version, settings, app.json.dumps({'settings': settings}))
+        return entry
+    finally:
+        cursor.close()
+        conn.close()
+
+def bump_settings_version(cursor, table):
+    """Bump a settings table's version, in the transaction of the write"""
+    cursor.execute("UPDATE settings_versions SET version = version + 1 WHERE scope = %s", (table,))
+
+def forget_changed_settings(table):
+    """Drop cached settings after a committed write, here and on other workers"""
+    forget_settings(table)
+    publish('settings_change', {'table': table})
+
+def settings_response(table, entry):
+    """Build the response for cached settings, or a 304 for a current ETag
+
+    Versions live in the database, so the ETag holds across workers and restarts.
+    A hash of the payload is part of it too, so changed defaults or response
+    fields after an upgrade aren't answered with a 304 for the same version.
+    """
+    version, _, payload = entry
+    etag = f"{table}-{version}-{hashlib.sha1(payload.encode()).hexdigest()[:12]}"
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(payload, 200)
+        response.mimetype = 'application/json'
+    
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
 @app.route('/api/admin/settings', methods=['GET'])
 def get_admin_settings():
     """Get admin settings (super admin only)"""
@@ -1991,43 +3264,17 @@ def get_admin_settings():
     cursor = conn.cursor()
     cursor.execute("SELECT is_admin FROM users WHERE id = %s", (session['user_id'],))
     user = cursor.fetchone()
+    cursor.close()
+    conn.close()
     
     if not user or not user[0]:
-        cursor.close()
-        conn.close()
         return jsonify({'error': 'Super admin access required'}), 403
     
     try:
-        # Get settings from database
-        cursor.execute("SELECT setting_key, setting_value FROM admin_settings")
-        settings_rows = cursor.fetchall()
-        
-        # Convert to dictionary
-        settings = {}
-        for key, value in settings_rows:
-            settings[key] = value
-        
-        # Return default values if no settings exist
-        default_settings = {
-            'logoUrl': None,
-            'logoText': 'LXCloud',
-            'siteName': 'LXCloud - LED Screen Management Platform',
-            'faviconUrl': None,
-            'mapMarkerOnline': None,
-            'mapMarkerOffline': None
-        }
-        
-        # Merge defaults with saved settings
-        final_settings = {**default_settings, **settings}
-        
-        cursor.close()
-        conn.close()
+        entry = load_settings('admin_settings', ADMIN_SETTINGS_DEFAULTS)
+        return settings_response('admin_settings', entry)
         
-        return jsonify({'settings': final_settings}), 200
-        
-    except pymysql.Error as e:
-        cursor.close()
-        conn.close()
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @app.route('/api/admin/settings', methods=['POST'])
@@ -2067,13 +3314,15 @@ def update_admin_settings():
                     updated_at = NOW()
                 """, (key, value))
         
+        bump_settings_version(cursor, 'admin_settings')
         conn.commit()
         cursor.close()
         conn.close()
+        forget_changed_settings('admin_settings')
         
         return jsonify({'message': 'Settings updated successfully'}), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         cursor.close()
         conn.close()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
@@ -2085,119 +3334,11 @@ def get_ui_settings():
     if not is_authorized:
         return error_response, status_code
     
-    conn = get_db_connection()
-    cursor = conn.cursor()
-    
     try:
-        # Get UI settings from database
-        cursor.execute("SELECT setting_key, setting_value FROM ui_settings")
-        settings_rows = cursor.fetchall()
-        
-        # Convert to dictionary
-        settings = {}
-        for key, value in settings_rows:
-            settings[key] = value
-        
-        # Return default values if no settings exist
-        default_settings = {
-            # Original settings
-            'app_name': 'LXCloud',
-            'primary_color': '#667eea',
-            'secondary_color': '#f093fb',
-            'header_color': '#667eea',
-            'button_color': '#667eea',
-            'button_hover_color': '#5a6fd8',
-            'logo_url': '',
-            'favicon_url': '',
-            'background_image_url': '',
-            'custom_button_images': '{}',
-            
-            # Screen management button icons
-            'screen_view_data_icon': '',
-            'screen_edit_icon': '',
-            'screen_unbind_icon': '',
-            
-            # Footer customization
-            'footer_enabled': 'true',
-            'footer_text': 'Powered by LXCloud',
-            'footer_color': '#f8f9fa',
-            'footer_text_color': '#6c757d',
-            'footer_links': '{}',
-            
-            # Typography settings
-            'font_family': 'system-ui, -apple-system, sans-serif',
-            'font_size_base': '16px',
-            'font_size_heading': '24px',
-            'line_height': '1.5',
-            
-            # Navigation customization
-            'nav_style': 'default',
-            'nav_position': 'top',
-            'nav_color': '#667eea',
-            'nav_hover_color': '#5a6fd8',
-            'header_text_color': '#ffffff',
-            
-            # Advanced button customization
-            'button_style': 'default',
-            'button_size': 'medium',
-            'button_shadow': 'true',
-            'button_animation': 'true',
-            
-            # Page-specific settings
-            'dashboard_layout': 'grid',
-            'dashboard_theme': 'default',
-            'login_background_url': '',
-            'login_style': 'default',
-            
-            # Custom text overrides
-            'custom_text_labels': '{}',
-            'page_titles': '{}',
-            
-            # Advanced customization
-            'custom_css': '',
-            'theme_mode': 'light',
-            'border_radius': '8px',
-            'spacing_unit': '16px',
-            
-            # Per-page custom CSS
-            'dashboard_custom_css': '',
-            'manage_screens_custom_css': '',
-            
-            # Accessibility settings
-            'high_contrast': 'false',
-            'large_text': 'false',
-            'reduced_motion': 'false',
-            
-            # Advanced header settings
-            'header_height': '60px',
-            'header_shadow': 'true',
-            'header_sticky': 'true',
-            
-            # Header button customization
-            'header_button_alignment': 'default',
-            'header_button_vertical_alignment': 'center',
-            'header_button_spacing': '15px',
-            'header_button_individual_positions': '{}',
-            'header_button_individual_colors': '{}',
-            'header_custom_css': '',
-            
-            # Card and component styling
-            'card_shadow': 'true',
-            'card_border': 'true',
-            'card_hover_effect': 'true'
-        }
-        
-        # Merge defaults with saved settings
-        final_settings = {**default_settings, **settings}
-        
-        cursor.close()
-        conn.close()
+        entry = load_settings('ui_settings', UI_SETTINGS_DEFAULTS)
+        return settings_response('ui_settings', entry)
         
-        return jsonify({'settings': final_settings}), 200
-        
-    except pymysql.Error as e:
-        cursor.close()
-        conn.close()
+    except DatabaseError as e:
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
 @app.route('/api/admin/ui-settings', methods=['POST'])
@@ -2272,95 +3413,513 @@ def update_ui_settings():
                     updated_at = NOW()
                 """, (key, value))
         
+        bump_settings_version(cursor, 'ui_settings')
         conn.commit()
         cursor.close()
         conn.close()
+        forget_changed_settings('ui_settings')
         
         return jsonify({'message': 'UI settings updated successfully'}), 200
         
-    except pymysql.Error as e:
+    except DatabaseError as e:
         cursor.close()
         conn.close()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
-@app.route('/api/admin/upload-ui-asset', methods=['POST'])
-def upload_ui_asset():
-    """Upload UI asset (logo, favicon, background) (admin only)"""
-    is_authorized, error_response, status_code = require_admin()
-    if not is_authorized:
-        return error_response, status_code
-    
-    if 'file' not in request.files:
-        return jsonify({'error': 'No file provided'}), 400
+# Public theme bundle. /api/theme names the current bundle; the bundle
+# URLs embed the settings version and a content hash, so browsers and
+# proxies may cache them forever.
+def current_theme_bundle():
+    """Get (reference, json, css) of the current theme"""
+    version, settings, _ = load_settings('ui_settings', UI_SETTINGS_DEFAULTS)
+    return get_theme_bundle(version, settings)
+
+def theme_bundle_response(reference, extension, mimetype):
+    """Serve a theme bundle file, redirecting outdated references"""
+    try:
+        current, payload, css = current_theme_bundle()
+    except DatabaseError as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
     
-    file = request.files['file']
-    asset_type = request.form.get('type', 'logo')
+    if reference != current:
+        response = make_response('', 302)
+        response.headers['Location'] = f'/api/theme/{current}.{extension}'
+        response.headers['Cache-Control'] = 'no-cache'
+        return response
     
-    if file.filename == '':
-        return jsonify({'error': 'No file selected'}), 400
+    etag = f'theme-{current}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = make_response(payload if extension == 'json' else css, 200)
+        response.mimetype = mimetype
     
-    # Validate file type
-    allowed_extensions = {'png', 'jpg', 'jpeg', 'gif', 'svg'}
-    allowed_mimes = {'image/png', 'image/jpeg', 'image/gif', 'image/svg+xml'}
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+    return response
+
+@app.route('/api/theme', methods=['GET'])
+def get_theme():
+    """Get the URLs of the current theme bundle (public)"""
+    try:
+        reference, _, _ = current_theme_bundle()
+    except DatabaseError as e:
+        return jsonify({'error': f'Database error: {str(e)}'}), 500
     
-    if file.content_type not in allowed_mimes:
-        return jsonify({'error': 'Invalid file type. Only PNG, JPEG, GIF, and SVG are allowed.'}), 400
+    etag = f'theme-{reference}'
+    if request.if_none_match.contains(etag):
+        response = make_response('', 304)
+    else:
+        response = jsonify({
+            'version': reference,
+            'json_url': f'/api/theme/{reference}.json',
+            'css_url': f'/api/theme/{reference}.css'
+        })
     
-    # Create uploads directory if it doesn't exist
-    upload_dir = os.path.join(os.path.dirname(__file__), 'static', 'uploads', 'ui')
-    os.makedirs(upload_dir, exist_ok=True)
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'public, no-cache'
+    return response
+
+@app.route('/api/theme/<reference>.json', methods=['GET'])
+def get_theme_json(reference):
+    """Get the merged UI settings of a theme version (public, immutable)"""
+    return theme_bundle_response(reference, 'json', 'application/json')
+
+@app.route('/api/theme/<reference>.css', methods=['GET'])
+def get_theme_css(reference):
+    """Get the compiled stylesheet of a theme version (public, immutable)"""
+    return theme_bundle_response(reference, 'css', 'text/css')
+
+def run_blocking(func, *args):
+    """Run CPU-bound work without stalling the green threads of other requests"""
+    if ASYNC_MODE == 'eventlet':
+        from eventlet import tpool
+        return tpool.execute(func, *args)
+    if ASYNC_MODE == 'gevent':
+        import gevent
+        return gevent.get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+# Largest UI asset upload accepted, checked while it streams in
+UI_ASSET_MAX_UPLOAD_SIZE = int(os.environ.get('UI_ASSET_MAX_UPLOAD_SIZE', 5 * 1024 * 1024))
+UI_ASSET_TYPES = {'image/png', 'image/jpeg', 'image/gif', 'image/svg+xml'}
+
+def build_ui_asset_variants(name, upload):
+    """Background task generating the remaining variants of an uploaded asset"""
+    try:
+        run_blocking(build_variants, name, upload.path)
+    except Exception as e:
+        print(f"Error processing UI asset {name}: {e}")
+    finally:
+        upload.discard()
+
+@app.route('/api/admin/upload-ui-asset', methods=['POST'])
+def upload_ui_asset():
+    """Upload UI asset (logo, favicon, background) (admin only)
+
+    The image is stored under a content-hash name with its metadata
+    stripped and scaled to the limits of its type; WebP/AVIF, high-DPR
+    and favicon variants are generated in the background.
+    """
+    is_authorized, error_response, status_code = require_admin()
+    if not is_authorized:
+        return error_response, status_code
     
+    # Streamed to a temporary file; the type is sniffed from the content
     try:
-        # Generate unique filename
-        import uuid
-        file_extension = file.filename.rsplit('.', 1)[1].lower()
-        unique_filename = f"{asset_type}_{uuid.uuid4().hex}.{file_extension}"
-        file_path = os.path.join(upload_dir, unique_filename)
-        
-        # Save file
-        file.save(file_path)
-        
-        # Generate URL for the uploaded file
-        file_url = f"/api/static/uploads/ui/{unique_filename}"
+        form, upload = receive_upload(request.environ, 'file', UI_ASSET_MAX_UPLOAD_SIZE, UI_ASSET_TYPES)
+    except UploadRejected as e:
+        if e.status_code == 415:
+            return jsonify({'error': 'Invalid file type. Only PNG, JPEG, GIF, and SVG are allowed.'}), 415
+        return jsonify({'error': e.message}), e.status_code
+    
+    asset_type = form.get('type', 'logo')
+    pending = False
+    try:
+        name, manifest, pending = run_blocking(store_upload, upload.path, upload.digest,
+                                               asset_type, upload.mimetype)
+        if pending:
+            socketio.start_background_task(build_ui_asset_variants, name, upload)
         
         return jsonify({
             'message': f'{asset_type.capitalize()} uploaded successfully',
-            'url': file_url,
-            'filename': unique_filename
+            'url': f"/api/static/uploads/ui/{name}",
+            'filename': name,
+            'processing': not manifest['complete']
         }), 200
         
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': f'Upload failed: {str(e)}'}), 500
+    finally:
+        if not pending:
+            upload.discard()
 
 @app.route('/api/static/uploads/ui/<filename>')
 def serve_ui_upload(filename):
-    """Serve uploaded UI assets"""
-    upload_dir = os.path.join(os.path.dirname(__file__), 'static', 'uploads', 'ui')
-    return send_from_directory(upload_dir, filename)
+    """Serve uploaded UI assets
+
+    Content-hash names without an extension get the best variant for the
+    Accept header and the device pixel ratio given as ?dpr=.
+    """
+    if not ASSET_NAME.match(filename):
+        if not ASSET_FILE.match(filename):
+            return send_from_directory(UI_UPLOAD_DIR, filename)
+        # Content-hash names never change, so the name is a strong ETag
+        response = send_from_directory(UI_UPLOAD_DIR, filename, etag=filename)
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL
+        return response
+    
+    manifest = get_manifest(filename)
+    if not manifest:
+        return jsonify({'error': 'Asset not found'}), 404
+    
+    try:
+        dpr = float(request.args.get('dpr', 1))
+    except ValueError:
+        dpr = 1
+    variant = choose_variant(manifest, request.headers.get('Accept'), dpr)
+    
+    response = send_from_directory(UI_UPLOAD_DIR, variant['file'], etag=variant['file'],
+                                   mimetype=IMAGE_MIMETYPES[variant['format']])
+    response.headers['Vary'] = 'Accept'
+    # Until the variants exist, a better one may replace what is sent now
+    response.headers['Cache-Control'] = (IMMUTABLE_CACHE_CONTROL if manifest['complete']
+                                         else 'public, max-age=60')
+    return response
 
 # WebSocket events
+# Connections are authenticated from the Flask session and join the room of
+# their user, plus the admin room for administrators, so screen events only
+# reach the screen's owner and admins.
+# Screen updates go to separate feed rooms: a connection that subscribes to
+# specific screens or a map area leaves its feed rooms and gets only the
+# updates routed to it by modules.subscriptions.
+# Frames of the feed rooms are numbered and kept for a while, so a client
+# reconnecting with its last sequence (in the Socket.IO auth payload) is
+# sent only the frames it missed.
+ADMIN_ROOM = 'admin'
+ADMIN_FEED_ROOM = 'screens:admin'
+
+_socket_sids = {}  # user_id -> set of connected socket ids
+_socket_sids_lock = threading.Lock()
+
+# Held while numbering and sending frames, and while a connection joins its
+# feed rooms and catches up, so no frame is missed or sent twice in between
+_screen_feed_lock = threading.Lock()
+
+def user_room(user_id):
+    """Get the Socket.IO room of a user"""
+    return f'user:{user_id}'
+
+def feed_room(user_id):
+    """Get the room receiving all screen updates of a user"""
+    return f'screens:user:{user_id}'
+
+def screen_feed_rooms(user_id):
+    """Get the feed rooms that receive updates of a screen owned by user_id"""
+    if user_id is None:
+        return [ADMIN_FEED_ROOM]
+    return [feed_room(user_id), ADMIN_FEED_ROOM]
+
+def is_feed_room(room):
+    """Check whether a room is a feed room (rather than a connection)"""
+    return room.startswith('screens:')
+
+def connection_feed_rooms(user_id, is_admin_user):
+    """Get the feed rooms of a connection"""
+    return [feed_room(user_id)] + ([ADMIN_FEED_ROOM] if is_admin_user else [])
+
+def set_screen_feed(user_id, is_admin_user, subscribed):
+    """Join or leave the feed rooms of the current connection"""
+    for room in connection_feed_rooms(user_id, is_admin_user):
+        if subscribed:
+            leave_room(room)
+        else:
+            join_room(room)
+
+def screen_event_rooms(user_id):
+    """Get the rooms that receive events about a screen owned by user_id"""
+    if user_id is None:
+        return ADMIN_ROOM
+    return [user_room(user_id), ADMIN_ROOM]
+
+def sync_socket_rooms(user_id, is_admin_user=None, remove=False):
+    """Update the connections of a user after their access changed
+
+    With remove the connections are closed, otherwise they join or leave
+    the admin room according to is_admin_user.
+    """
+    with _socket_sids_lock:
+        sids = list(_socket_sids.get(user_id, ()))
+    
+    for sid in sids:
+        if remove:
+            socketio.server.disconnect(sid, namespace='/')
+            continue
+        
+        rooms = [ADMIN_ROOM] if is_subscribed(sid) else [ADMIN_ROOM, ADMIN_FEED_ROOM]
+        for room in rooms:
+            if is_admin_user:
+                socketio.server.enter_room(sid, room, namespace='/')
+            else:
+                socketio.server.leave_room(sid, room, namespace='/')
+        set_subscriber_admin(sid, is_admin_user)
+
+_fanout_started = False
+_fanout_start_lock = threading.Lock()
+
+def flush_screen_updates():
+    """Send every room its queued screen updates as one screens_update frame
+
+    Frames go to this worker's connections only: every worker queues the
+    updates it hears about on the bus for its own connections.
+    Feed room frames carry their room and sequence. Frames routed to a
+    subscribed connection carry the sequence its feed room reached, as
+    they hold a subset of that room's updates.
+    """
+    with _screen_feed_lock:
+        pending = take_pending()
+        frames = {}
+        for room, updates in pending.items():
+            if is_feed_room(room):
+                frames[room] = {'room': room, 'seq': record_frame(room, updates), 'epoch': BOOT_ID}
+        
+        for room, updates in pending.items():
+            frame = frames.get(room)
+            if frame is None:
+                subscriber = get_subscriber(room)
+                if subscriber:
+                    user_id, is_admin_user = subscriber
+                    feed = ADMIN_FEED_ROOM if is_admin_user else feed_room(user_id)
+                    frame = {'room': feed, 'seq': get_frame_sequence(feed), 'epoch': BOOT_ID}
+            socketio.emit('screens_update', dict(frame or {}, updates=updates), to=room, ignore_queue=True)
+
+def run_screen_update_fanout():
+    """Flush queued screen updates every FANOUT_INTERVAL_MS"""
+    while True:
+        socketio.sleep(FANOUT_INTERVAL_MS / 1000)
+        try:
+            flush_screen_updates()
+        except Exception as e:
+            print(f"Error flushing screen updates: {e}")
+
+def queue_screen_update(rooms, update):
+    """Queue a screen update for the next batched frame of the given rooms"""
+    global _fanout_started
+    
+    queue_update(rooms, update['serial_number'], update)
+    if not _fanout_started:
+        with _fanout_start_lock:
+            if not _fanout_started:
+                socketio.start_background_task(run_screen_update_fanout)
+                _fanout_started = True
+
+def deliver_screen_update(screen_id, owner_id, position, update):
+    """Queue a screen update for the interested connections of this worker"""
+    targets = screen_feed_rooms(owner_id) + route_update(screen_id, owner_id, position)
+    queue_screen_update(targets, update)
+
+# Bus events from other workers (see modules.bus). Each worker acts on its
+# own changes directly and publishes them for the others.
+@on_bus_event('screen_update')
+def handle_bus_screen_update(data):
+    """Deliver a device update received by another worker"""
+    deliver_screen_update(data['screen_id'], data['owner_id'], data['position'], data['update'])
+
+@on_bus_event('fleet_change')
+def handle_bus_fleet_change(data):
+    """Invalidate cached lists and versions after another worker's write"""
+    record_fleet_change(data['serial_number'], *data['user_ids'], notify=False)
+
+@on_bus_event('settings_change')
+def handle_bus_settings_change(data):
+    """Drop settings cached before another worker's write"""
+    forget_settings(data['table'])
+
+@on_bus_event('user_access')
+def handle_bus_user_access(data):
+    """Update this worker's connections of a user whose access changed"""
+    user_id = data['user_id']
+    forget_user_admin_flag(user_id)
+    if data['removed']:
+        sync_socket_rooms(user_id, remove=True)
+    else:
+        sync_socket_rooms(user_id, is_admin_user_cached(user_id))
+
+def publish_fleet_change(serial_number, user_ids):
+    """Tell the other workers about a change recorded by this one"""
+    publish('fleet_change', {'serial_number': serial_number, 'user_ids': sorted(user_ids)})
+
+if bus_enabled():
+    add_fleet_change_listener(publish_fleet_change)
+    start_listening(socketio.server)
+    print(f"Sharing realtime events through a {socketio_client_manager.name} message queue")
+
+def replay_screen_feed(user_id, is_admin_user, auth):
+    """Send a reconnecting connection the feed frames it missed
+
+    auth may hold the epoch and the last sequence per feed room the client
+    saw. Rooms whose missed frames are no longer kept (or that come from
+    another worker or an earlier run) are listed in a resync event so the
+    client reloads. Either way the connection is told where its feed rooms
+    stand now with a feed_state event.
+    """
+    rooms = connection_feed_rooms(user_id, is_admin_user)
+    since = auth.get('since') if isinstance(auth, dict) else None
+    if isinstance(since, dict) and since:
+        resync = []
+        for room in rooms:
+            sequence = since.get(room)
+            frames = None
+            if auth.get('epoch') == BOOT_ID and isinstance(sequence, int):
+                frames = frames_since(room, sequence)
+            if frames is None:
+                resync.append(room)
+                continue
+            for sequence, updates in frames:
+                socketio.emit('screens_update', {'room': room, 'seq': sequence, 'epoch': BOOT_ID,
+                                                 'updates': updates}, to=request.sid, ignore_queue=True)
+        if resync:
+            socketio.emit('resync', {'rooms': resync}, to=request.sid, ignore_queue=True)
+    
+    socketio.emit('feed_state', {
+        'epoch': BOOT_ID,
+        'seqs': {room: get_frame_sequence(room) for room in rooms}
+    }, to=request.sid, ignore_queue=True)
+
 @socketio.on('connect')
-def handle_connect():
+def handle_connect(auth=None):
     """Handle client connection"""
-    print('Client connected')
+    if 'user_id' not in session:
+        return False
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    join_room(user_room(user_id))
+    if is_admin_user:
+        join_room(ADMIN_ROOM)
+    with _screen_feed_lock:
+        set_screen_feed(user_id, is_admin_user, subscribed=False)
+        replay_screen_feed(user_id, is_admin_user, auth)
+    
+    with _socket_sids_lock:
+        _socket_sids.setdefault(user_id, set()).add(request.sid)
+    print(f'Client connected (user {user_id})')
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
+    user_id = session.get('user_id')
+    unsubscribe(request.sid)
+    with _socket_sids_lock:
+        sids = _socket_sids.get(user_id)
+        if sids is not None:
+            sids.discard(request.sid)
+            if not sids:
+                del _socket_sids[user_id]
     print('Client disconnected')
 
+@socketio.on('subscribe_screens')
+def handle_subscribe_screens(data):
+    """Only receive updates of the given screen ids (an empty list clears)"""
+    if 'user_id' not in session:
+        return {'error': 'Not authenticated'}
+    
+    screen_ids = (data or {}).get('screen_ids')
+    if not isinstance(screen_ids, list) or not all(isinstance(screen_id, int) for screen_id in screen_ids):
+        return {'error': 'screen_ids must be a list of screen ids'}
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    subscribed = subscribe_screens(request.sid, user_id, is_admin_user, screen_ids)
+    set_screen_feed(user_id, is_admin_user, subscribed)
+    return {'subscribed': subscribed}
+
+@socketio.on('subscribe_bbox')
+def handle_subscribe_bbox(data):
+    """Only receive updates of screens inside a bounding box (null clears)"""
+    if 'user_id' not in session:
+        return {'error': 'Not authenticated'}
+    
+    bbox = (data or {}).get('bbox')
+    if bbox is not None:
+        if isinstance(bbox, list):
+            bbox = ','.join(str(coordinate) for coordinate in bbox)
+        bbox = parse_bbox(bbox if isinstance(bbox, str) else None)
+        if bbox is None:
+            return {'error': 'bbox must be west,south,east,north'}
+    
+    user_id = session['user_id']
+    is_admin_user = is_admin_user_cached(user_id)
+    subscribed = subscribe_bbox(request.sid, user_id, is_admin_user, bbox)
+    set_screen_feed(user_id, is_admin_user, subscribed)
+    return {'subscribed': subscribed}
+
+@socketio.on('unsubscribe')
+def handle_unsubscribe():
+    """Go back to receiving updates of all screens"""
+    if 'user_id' not in session:
+        return {'error': 'Not authenticated'}
+    
+    user_id = session['user_id']
+    unsubscribe(request.sid)
+    set_screen_feed(user_id, is_admin_user_cached(user_id), subscribed=False)
+    return {'subscribed': False}
+
+def configure_app(engine=None, init_db=True):
+    """Point the application at a storage engine and return (app, socketio)
+
+    This configures the module's single app and socketio rather than
+    building new ones: routes, caches and connection state are module
+    globals, so every call returns the same objects and a later call
+    moves them to another engine. Run separate processes for isolated
+    instances (benchmark_storage.py does).
+
+    `engine` replaces the one chosen by STORAGE_ENGINE. The schema is
+    created and migrated unless init_db is False; the application still
+    starts if that fails.
+    """
+    if engine is not None:
+        use_storage(engine)
+    print(f"Storage: {storage.describe()}")
+    
+    # Try to initialize database, but continue even if it fails
+    if init_db:
+        try:
+            init_database()
+        except Exception as e:
+            print(f"Warning: Database initialization failed: {e}")
+            print("Application will start but some features may not work")
+            print("See above for instructions to fix database issues")
+    
+    return app, socketio
+
+def run_server(port):
+    """Serve the application until interrupted"""
+    run_options = {}
+    if ASYNC_MODE == 'eventlet':
+        # eventlet's server stops accepting at 1024 concurrent connections by default
+        run_options['max_size'] = int(os.environ.get('MAX_CONNECTIONS', 10000))
+    
+    socketio.run(app, host='0.0.0.0', port=port, debug=True, allow_unsafe_werkzeug=True, **run_options)
+
 if __name__ == '__main__':
+    import sys
+    
+    if '--migrate' in sys.argv[1:]:
+        # Run long migrations ahead of starting workers, which would
+        # otherwise wait for them up to MIGRATION_LOCK_TIMEOUT
+        print(f"Storage: {storage.describe()}")
+        run_database_migrations()
+        sys.exit(0)
+    
     print("=" * 60)
     print("LXCloud Backend Starting")
     print("=" * 60)
     
-    # Try to initialize database, but continue even if it fails
-    try:
-        init_database()
-    except Exception as e:
-        print(f"Warning: Database initialization failed: {e}")
-        print("Application will start but some features may not work")
-        print("See above for instructions to fix database issues")
+    configure_app()
     
     print("")
     print("Starting Flask application on:")
@@ -2371,4 +3930,4 @@ if __name__ == '__main__':
     print("or use nginx configuration as described in README.md")
     print("=" * 60)
     
-    socketio.run(app, host='0.0.0.0', port=5000, debug=True, allow_unsafe_werkzeug=True)
\ No newline at end of file
+    run_server(5000)
\ No newline at end of file
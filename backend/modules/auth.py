@@ -4,8 +4,6 @@ Authentication and authorization module for LXCloud
 from functools import wraps
 from flask import session, jsonify
 from werkzeug.security import generate_password_hash, check_password_hash
-import pyotp
-import qrcode
 from io import BytesIO
 import base64
 import secrets
@@ -132,11 +130,15 @@ def authenticate_user(username_or_email, password):
 
 def generate_2fa_secret():
     """Generate a new 2FA secret"""
+    import pyotp
     return pyotp.random_base32()
 
 def generate_2fa_qr_code(username, secret, app_name='LXCloud'):
     """Generate QR code for 2FA setup"""
     try:
+        import pyotp
+        import qrcode
+        
         totp_uri = pyotp.totp.TOTP(secret).provisioning_uri(
             username,
             issuer_name=app_name
@@ -156,6 +158,7 @@ def generate_2fa_qr_code(username, secret, app_name='LXCloud'):
 def verify_2fa_token(secret, token):
     """Verify 2FA token"""
     try:
+        import pyotp
         totp = pyotp.TOTP(secret)
         return totp.verify(token, valid_window=1)
     except Exception as e:
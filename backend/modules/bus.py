@@ -0,0 +1,227 @@
+"""
+Message bus for LXCloud workers
+
+With SOCKETIO_MESSAGE_QUEUE set, Socket.IO emits go through a message
+queue so browsers connected to any worker receive them. Beside the
+Socket.IO traffic the same queue carries bus events between workers
+(screen updates to route, fleet changes, user access changes), so each
+worker can deliver to its own connections and keep its caches current.
+
+Supported URLs are those of python-socketio (redis://, amqp:// and other
+kombu URLs, kafka://, zmq+tcp://) plus relay://host:port, a small
+built-in relay for running several workers locally without a broker:
+
+    python modules/bus.py --relay 127.0.0.1:6390
+"""
+import json
+import os
+import socket
+import socketserver
+import threading
+import time
+
+import socketio
+
+SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
+SOCKETIO_CHANNEL = os.environ.get('SOCKETIO_CHANNEL', 'lxcloud')
+
+# Bus events travel as emits to this namespace, which no client connects to
+BUS_NAMESPACE = '/lxcloud-bus'
+
+RELAY_DEFAULT_PORT = 6390
+
+_handlers = {}
+_manager = None
+
+def on_bus_event(name):
+    """Register the handler of a bus event published by other workers"""
+    def decorator(handler):
+        _handlers[name] = handler
+        return handler
+    return decorator
+
+def _dispatch(name, payload):
+    handler = _handlers.get(name)
+    if handler is None:
+        return
+    try:
+        handler(payload)
+    except Exception as e:
+        print(f"Error handling bus event {name}: {e}")
+
+def _relay_address(url):
+    host, _, port = url.split('://', 1)[1].rstrip('/').rpartition(':')
+    return host or 'localhost', int(port or RELAY_DEFAULT_PORT)
+
+class RelayManager(socketio.PubSubManager):
+    """Client manager publishing through the built-in relay
+
+    Messages are JSON lines over TCP. Listening connections announce the
+    channel they subscribe to; every other line is a message to forward.
+    """
+    name = 'relay'
+
+    def __init__(self, url='relay://localhost:6390', channel='socketio', write_only=False, logger=None):
+        self.address = _relay_address(url)
+        self._socket = None
+        self._socket_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger)
+
+    def _publish(self, data):
+        line = (json.dumps({'channel': self.channel, 'data': data}) + '\n').encode()
+        with self._socket_lock:
+            # Retry once on a fresh connection after the relay restarted
+            for attempt in range(2):
+                try:
+                    if self._socket is None:
+                        self._socket = socket.create_connection(self.address)
+                    self._socket.sendall(line)
+                    return
+                except OSError:
+                    if self._socket is not None:
+                        self._socket.close()
+                        self._socket = None
+                    if attempt:
+                        raise
+
+    def _listen(self):
+        while True:
+            try:
+                with socket.create_connection(self.address) as connection:
+                    connection.sendall((json.dumps({'subscribe': self.channel}) + '\n').encode())
+                    for line in connection.makefile('rb'):
+                        yield json.loads(line)['data']
+            except (OSError, ValueError) as e:
+                print(f"Message relay connection lost ({e}), reconnecting")
+            time.sleep(1)
+
+def _base_manager(url):
+    scheme = url.split('://', 1)[0]
+    if scheme == 'relay':
+        return RelayManager
+    if scheme.startswith('redis'):
+        return socketio.RedisManager
+    if scheme == 'kafka':
+        return socketio.KafkaManager
+    if scheme.startswith('zmq'):
+        return socketio.ZmqManager
+    return socketio.KombuManager
+
+def make_client_manager(url=None, channel=None, install=True):
+    """Build the Socket.IO client manager for a message queue URL
+
+    Returns None without a URL (single process mode). With install, the
+    manager is the one publish() sends through.
+    """
+    global _manager
+
+    url = url if url is not None else SOCKETIO_MESSAGE_QUEUE
+    if not url:
+        return None
+
+    class BusManager(_base_manager(url)):
+        def _handle_emit(self, message):
+            if message.get('namespace') != BUS_NAMESPACE:
+                return super()._handle_emit(message)
+            # The publishing worker already acted on its own event
+            if message.get('host_id') != self.host_id:
+                _dispatch(message['event'], message['data'])
+
+        def publish(self, name, payload):
+            self.emit(name, payload, namespace=BUS_NAMESPACE)
+
+    manager = BusManager(url, channel=channel or SOCKETIO_CHANNEL)
+    if install:
+        _manager = manager
+    return manager
+
+def start_listening(server):
+    """Start receiving from the queue now rather than on the first connection
+
+    A worker must apply other workers' changes even while no browser is
+    connected to it.
+    """
+    if not server.manager_initialized:
+        server.manager_initialized = True
+        server.manager.initialize()
+
+def bus_enabled():
+    """Check whether this process shares a message queue with other workers"""
+    return _manager is not None
+
+def publish(name, payload):
+    """Send a bus event to the other workers (a no-op in single process mode)"""
+    if _manager is None:
+        return
+    try:
+        _manager.publish(name, payload)
+    except Exception as e:
+        print(f"Error publishing bus event {name}: {e}")
+
+class _RelayHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        channel = None
+        try:
+            for line in self.rfile:
+                message = json.loads(line)
+                if 'subscribe' in message:
+                    channel = message['subscribe']
+                    self.server.add_listener(channel, self)
+                else:
+                    self.server.forward(message.get('channel'), line)
+        except (OSError, ValueError):
+            pass
+        finally:
+            if channel is not None:
+                self.server.remove_listener(channel, self)
+
+class RelayServer(socketserver.ThreadingTCPServer):
+    """Built-in relay forwarding each published line to the channel's listeners
+
+    Meant for development and tests; it keeps nothing and a slow listener
+    holds up publishers, so production deployments should use a broker.
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address):
+        self._listeners = {}  # channel -> {handler: send lock}
+        self._lock = threading.Lock()
+        super().__init__(address, _RelayHandler)
+
+    def add_listener(self, channel, handler):
+        with self._lock:
+            self._listeners.setdefault(channel, {})[handler] = threading.Lock()
+
+    def remove_listener(self, channel, handler):
+        with self._lock:
+            self._listeners.get(channel, {}).pop(handler, None)
+
+    def forward(self, channel, line):
+        with self._lock:
+            listeners = list(self._listeners.get(channel, {}).items())
+        for handler, send_lock in listeners:
+            try:
+                with send_lock:
+                    handler.wfile.write(line)
+            except OSError:
+                self.remove_listener(channel, handler)
+
+def serve_relay(host='127.0.0.1', port=RELAY_DEFAULT_PORT):
+    """Start the built-in relay in a background thread and return it"""
+    server = RelayServer((host, port))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='Run the built-in LXCloud message relay')
+    parser.add_argument('--relay', default=f'127.0.0.1:{RELAY_DEFAULT_PORT}', help='host:port to listen on')
+    args = parser.parse_args()
+
+    host, _, port = args.relay.rpartition(':')
+    relay = RelayServer((host or '127.0.0.1', int(port)))
+    print(f"Message relay listening on {host or '127.0.0.1'}:{port}, "
+          f"set SOCKETIO_MESSAGE_QUEUE=relay://{host or '127.0.0.1'}:{port}")
+    relay.serve_forever()
@@ -0,0 +1,97 @@
+"""
+Database connection pool for LXCloud
+
+Request handlers open a connection, run a few queries and close it. In
+threading mode that costs a new MariaDB connection per request; with
+green threads (ASYNC_MODE=eventlet or gevent) thousands of concurrent
+handlers would also open as many connections as the server allows. The
+pool keeps at most a fixed number of connections: close() hands a
+connection back instead of closing it, and handlers wait for a free one.
+Its locks come from the threading module, so they are cooperative once
+the standard library has been monkey-patched.
+"""
+import os
+import threading
+import time
+
+# Seconds to wait for a free connection before giving up
+DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT', 10))
+
+# Connections idle for longer than this are pinged before being reused
+DB_POOL_PING_INTERVAL = 60
+
+def _close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass
+
+class ConnectionPool:
+    """Bounded pool of connections made by a connect() callable"""
+
+    def __init__(self, connect, size, timeout=DB_POOL_TIMEOUT):
+        self._connect = connect
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []  # (connection, time released), most recent last
+        self._lock = threading.Lock()
+        self.size = size
+        self.timeout = timeout
+
+    def acquire(self):
+        """Get a connection, reusing an idle one when possible"""
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RuntimeError(f"No database connection free after {self.timeout:g} s "
+                               f"(pool of {self.size})")
+        try:
+            connection = self._take_idle() or self._connect()
+        except Exception:
+            self._slots.release()
+            raise
+        return PooledConnection(self, connection)
+
+    def _take_idle(self):
+        while True:
+            with self._lock:
+                if not self._idle:
+                    return None
+                connection, released_at = self._idle.pop()
+            if time.monotonic() - released_at < DB_POOL_PING_INTERVAL:
+                return connection
+            try:
+                connection.ping(reconnect=False)
+                return connection
+            except Exception:
+                _close_quietly(connection)
+
+    def release(self, connection):
+        """Take back a connection, ending whatever transaction it had open"""
+        try:
+            # The next user must not see this one's snapshot or uncommitted writes
+            connection.rollback()
+        except Exception:
+            _close_quietly(connection)
+        else:
+            with self._lock:
+                self._idle.append((connection, time.monotonic()))
+        self._slots.release()
+
+class PooledConnection:
+    """Connection handed out by a pool; close() gives it back"""
+
+    def __init__(self, pool, connection):
+        self._pool = pool
+        self._connection = connection
+
+    def __getattr__(self, name):
+        if self._connection is None:
+            raise AttributeError(f"{name} (connection already closed)")
+        return getattr(self._connection, name)
+
+    def close(self):
+        connection, self._connection = self._connection, None
+        if connection is not None:
+            self._pool.release(connection)
+
+    def __del__(self):
+        # Handlers that raise before closing would otherwise leak their slot
+        self.close()
@@ -0,0 +1,80 @@
+"""
+Realtime fan-out buffer for LXCloud
+
+Screen updates are not emitted one by one. They are queued per Socket.IO
+room, keeping only the latest update of each screen, and a flusher sends
+each room one batched frame per interval. Browsers thus receive at most
+one frame per interval however fast screens report.
+
+Frames of long-lived rooms can be numbered and kept in a ring buffer, so
+a client that reconnects after missing some frames is sent just those.
+"""
+import os
+import threading
+from collections import deque
+
+# Milliseconds between batched frames
+FANOUT_INTERVAL_MS = int(os.environ.get('FANOUT_INTERVAL_MS', 500))
+
+# Numbered frames kept per room for clients catching up after a reconnect
+FANOUT_REPLAY_FRAMES = int(os.environ.get('FANOUT_REPLAY_FRAMES', 120))
+
+_pending = {}  # room -> {serial_number: update}, oldest first
+_sequences = {}  # room -> sequence of its latest numbered frame
+_frames = {}  # room -> deque of (sequence, updates), oldest first
+_lock = threading.Lock()
+
+def queue_update(rooms, serial_number, update):
+    """Queue a screen update for the next frame of each room
+
+    An update still waiting replaces the previous one for that screen.
+    """
+    if isinstance(rooms, str):
+        rooms = (rooms,)
+    with _lock:
+        for room in rooms:
+            updates = _pending.setdefault(room, {})
+            # Re-insert so each frame lists screens in order of their latest update
+            updates.pop(serial_number, None)
+            updates[serial_number] = update
+
+def take_pending():
+    """Take all queued updates as a {room: [update, ...]} dict"""
+    global _pending
+
+    with _lock:
+        pending, _pending = _pending, {}
+    return {room: list(updates.values()) for room, updates in pending.items()}
+
+def record_frame(room, updates):
+    """Number a frame sent to a room and keep it for replay
+
+    Returns the frame's sequence, which increases by one per frame.
+    """
+    with _lock:
+        sequence = _sequences.get(room, 0) + 1
+        _sequences[room] = sequence
+        frames = _frames.get(room)
+        if frames is None:
+            frames = _frames[room] = deque(maxlen=FANOUT_REPLAY_FRAMES)
+        frames.append((sequence, updates))
+        return sequence
+
+def get_frame_sequence(room):
+    """Get the sequence of the latest numbered frame of a room (0 if none)"""
+    with _lock:
+        return _sequences.get(room, 0)
+
+def frames_since(room, since):
+    """Get the (sequence, updates) frames of a room sent after `since`
+
+    Returns None when some of them are no longer kept (or `since` is from
+    the future), in which case the client has to reload instead.
+    """
+    with _lock:
+        sequence = _sequences.get(room, 0)
+        frames = _frames.get(room, ())
+        oldest = frames[0][0] if frames else sequence + 1
+        if since > sequence or since < oldest - 1:
+            return None
+        return [frame for frame in frames if frame[0] > since]
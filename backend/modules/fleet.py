@@ -0,0 +1,143 @@
+"""
+Fleet change tracking for LXCloud
+
+Every write touching screens or controllers is recorded under a
+monotonically increasing change sequence, keyed by serial number (which
+is unique across both tables). From that we derive:
+
+- a version for the screen list of every user plus the admin-wide list,
+  so an unchanged list can be answered from memory (or with a 304)
+  without querying the database
+- the set of serial numbers changed since a given version, so clients
+  can sync deltas instead of reloading the whole list
+"""
+import os
+import secrets
+import threading
+from collections import OrderedDict
+
+ADMIN_SCOPE = 'admin'
+
+# Number of serial numbers whose latest change is remembered. Only the
+# latest change per serial is kept, so this bounds memory by fleet size
+# rather than by write rate.
+FLEET_CHANGE_LOG_SIZE = int(os.environ.get('FLEET_CHANGE_LOG_SIZE', 100000))
+
+# Distinguishes versions handed out by this process from those of an
+# earlier run or another worker
+BOOT_ID = secrets.token_hex(4)
+
+_sequence = 0
+_versions = {}
+_changes = OrderedDict()  # serial_number -> (sequence, {user_id: sequence}), oldest first
+_floor = 0  # changes up to this sequence are no longer individually known
+_payloads = {}
+_listeners = []
+_lock = threading.Lock()
+
+def add_fleet_change_listener(listener):
+    """Call listener(serial_number, user_ids) after each notified change"""
+    _listeners.append(listener)
+
+def get_fleet_version(scope):
+    """Get the current version of a scope (a user id or ADMIN_SCOPE)"""
+    with _lock:
+        return _versions.get(scope, 0)
+
+def record_fleet_change(serial_number, *user_ids, notify=True):
+    """Record a change to a screen or controller
+
+    The admin-wide list changes with every write; a user's list only when
+    their id is passed (pass both owners when a screen changes hands).
+    A serial_number of None means an unknown set of screens changed, which
+    forces affected clients to reload the full list. Listeners are told
+    unless notify is false (for changes reported by another worker).
+    """
+    user_ids = frozenset(user_id for user_id in user_ids if user_id is not None)
+    sequence = _record_change(serial_number, user_ids)
+    if notify:
+        for listener in _listeners:
+            listener(serial_number, user_ids)
+    return sequence
+
+def _record_change(serial_number, user_ids):
+    global _sequence, _floor
+
+    with _lock:
+        _sequence += 1
+        sequence = _sequence
+
+        _versions[ADMIN_SCOPE] = sequence
+        _payloads.pop(ADMIN_SCOPE, None)
+        for user_id in user_ids:
+            _versions[user_id] = sequence
+            _payloads.pop(user_id, None)
+
+        if serial_number is None:
+            _floor = sequence
+            _changes.clear()
+            return sequence
+
+        # Remember when each user's view of this serial last changed, so an
+        # earlier owner still learns about a removal after later changes
+        previous = _changes.pop(serial_number, None)
+        user_sequences = dict(previous[1]) if previous else {}
+        for user_id in user_ids:
+            user_sequences[user_id] = sequence
+        _changes[serial_number] = (sequence, user_sequences)
+
+        while len(_changes) > FLEET_CHANGE_LOG_SIZE:
+            _, (evicted_sequence, _) = _changes.popitem(last=False)
+            _floor = evicted_sequence
+
+    return sequence
+
+def get_changes_since(scope, since):
+    """Get the serial numbers changed in a scope after version `since`
+
+    Returns None when the changes can't be reconstructed (the version is
+    older than what is remembered, or from the future), in which case the
+    client has to reload the full list.
+    """
+    with _lock:
+        if since < _floor or since > _sequence:
+            return None
+
+        serial_numbers = []
+        for serial_number in reversed(_changes):
+            sequence, user_sequences = _changes[serial_number]
+            if sequence <= since:
+                break
+            if scope == ADMIN_SCOPE or user_sequences.get(scope, 0) > since:
+                serial_numbers.append(serial_number)
+        return serial_numbers
+
+def make_version_token(version):
+    """Build the opaque version token handed to clients"""
+    return f"{BOOT_ID}.{version}"
+
+def parse_version_token(token):
+    """Parse a version token, returning None if it isn't from this process"""
+    boot_id, _, version = (token or '').partition('.')
+    if boot_id != BOOT_ID or not version.isdigit():
+        return None
+    return int(version)
+
+def make_etag(scope, version):
+    """Build the entity tag for a version of a scope's screen list"""
+    return f"{scope}-{BOOT_ID}-{version}"
+
+def get_cached_payload(scope, version):
+    """Get the serialized screen list of a scope if it is still current"""
+    with _lock:
+        cached = _payloads.get(scope)
+    if cached and cached[0] == version:
+        return cached[1]
+    return None
+
+def store_cached_payload(scope, version, payload):
+    """Cache the serialized screen list built for a version of a scope"""
+    with _lock:
+        # Skip payloads that were outdated by a write while they were built
+        if _versions.get(scope, 0) == version:
+            _payloads[scope] = (version, payload)
@@ -0,0 +1,238 @@
+"""
+Geospatial index for LXCloud
+
+Keeps the position of every located screen and unassigned controller in
+a fixed grid of GEO_GRID_CELL_DEGREES sized cells, so map viewport
+queries only look at the cells overlapping the bounding box instead of
+the whole fleet.
+
+For zoomed-out maps it also keeps marker clusters for every zoom level
+up to GEO_CLUSTER_MAX_ZOOM: per grid cell of that zoom, the number of
+members, how many are online and the sum of their coordinates. These
+are adjusted as entries are added and removed, so answering a cluster
+query costs O(clusters in view) no matter how many screens they hold.
+
+The index holds no database access of its own: the caller loads entries
+and tells the index which fleet version (see modules.fleet) they reflect.
+"""
+import math
+import os
+import threading
+
+GEO_GRID_CELL_DEGREES = float(os.environ.get('GEO_GRID_CELL_DEGREES', 0.5))
+GEO_CLUSTER_MAX_ZOOM = int(os.environ.get('GEO_CLUSTER_MAX_ZOOM', 12))
+
+# Clusters per 256px map tile in each direction, i.e. roughly 64px apart
+GEO_CLUSTER_CELLS_PER_TILE = 4
+
+# Cluster scopes besides user ids
+GEO_ALL_SCREENS = 'screens'
+GEO_UNASSIGNED = 'controllers'
+
+_entries = {}  # serial_number -> (latitude, longitude, user_id, item, key)
+_cells = {}  # (row, column) -> set of serial numbers
+_keys = {}  # key -> serial_number
+_next_key = 1
+_clusters = {}  # (scope, zoom) -> {(row, column): [count, online, latitude sum, longitude sum, key sum]}
+_version = None  # fleet version the index reflects, None until loaded
+_lock = threading.Lock()
+
+def _cell(latitude, longitude, size=GEO_GRID_CELL_DEGREES):
+    return (math.floor(latitude / size), math.floor(longitude / size))
+
+def cluster_cell_degrees(zoom):
+    """Get the cluster cell size in degrees at a zoom level"""
+    return 360.0 / (2 ** zoom * GEO_CLUSTER_CELLS_PER_TILE)
+
+def _scopes(user_id):
+    if user_id is None:
+        return (GEO_UNASSIGNED,)
+    return (GEO_ALL_SCREENS, user_id)
+
+def _cluster(latitude, longitude, user_id, item, key, sign):
+    online = 1 if item.get('online_status') else 0
+    for scope in _scopes(user_id):
+        for zoom in range(GEO_CLUSTER_MAX_ZOOM + 1):
+            cells = _clusters.setdefault((scope, zoom), {})
+            cell = _cell(latitude, longitude, cluster_cell_degrees(zoom))
+            totals = cells.get(cell)
+            if totals is None:
+                totals = cells[cell] = [0, 0, 0.0, 0.0, 0]
+            totals[0] += sign
+            totals[1] += sign * online
+            totals[2] += sign * latitude
+            totals[3] += sign * longitude
+            totals[4] += sign * key
+            if totals[0] == 0:
+                del cells[cell]
+
+def _remove(serial_number):
+    entry = _entries.pop(serial_number, None)
+    if entry:
+        latitude, longitude, user_id, item, key = entry
+        cell = _cell(latitude, longitude)
+        members = _cells.get(cell)
+        if members:
+            members.discard(serial_number)
+            if not members:
+                del _cells[cell]
+        _cluster(latitude, longitude, user_id, item, key, -1)
+        del _keys[key]
+
+def _add(serial_number, latitude, longitude, user_id, item):
+    global _next_key
+
+    key = _next_key
+    _next_key += 1
+    _keys[key] = serial_number
+    _entries[serial_number] = (latitude, longitude, user_id, item, key)
+    _cells.setdefault(_cell(latitude, longitude), set()).add(serial_number)
+    _cluster(latitude, longitude, user_id, item, key, 1)
+
+def get_geo_version():
+    """Get the fleet version the index reflects, or None if never loaded"""
+    with _lock:
+        return _version
+
+def replace_geo_entries(entries, version):
+    """Replace the whole index
+
+    entries is an iterable of (serial_number, latitude, longitude,
+    user_id, item) tuples, user_id being None for unassigned controllers.
+    """
+    global _version, _next_key
+
+    with _lock:
+        _entries.clear()
+        _cells.clear()
+        _keys.clear()
+        _clusters.clear()
+        _next_key = 1
+        for serial_number, latitude, longitude, user_id, item in entries:
+            _add(serial_number, latitude, longitude, user_id, item)
+        _version = version
+
+def update_geo_entries(serial_numbers, entries, version):
+    """Reload the given serial numbers from their current entries
+
+    Serial numbers without an entry (deleted or no longer located) are
+    dropped from the index.
+    """
+    global _version
+
+    with _lock:
+        for serial_number in serial_numbers:
+            _remove(serial_number)
+        for serial_number, latitude, longitude, user_id, item in entries:
+            _remove(serial_number)
+            _add(serial_number, latitude, longitude, user_id, item)
+        if _version is None or version > _version:
+            _version = version
+
+def apply_geo_update(serial_number, latitude, longitude, fields, version):
+    """Apply a device update straight to the index
+
+    Only possible when the update is the very next fleet change after the
+    indexed version and the entry is already known; otherwise returns
+    False and the next refresh reloads the serial number instead.
+    """
+    global _version
+
+    with _lock:
+        if _version is None or version != _version + 1:
+            return False
+
+        entry = _entries.get(serial_number)
+        if latitude is None or longitude is None:
+            _remove(serial_number)
+        elif entry is None:
+            return False
+        else:
+            item = dict(entry[3], latitude=latitude, longitude=longitude, **fields)
+            _remove(serial_number)
+            _add(serial_number, latitude, longitude, entry[2], item)
+
+        _version = version
+        return True
+
+def normalize_bbox(west, south, east, north):
+    """Split a bounding box into ranges that don't cross the antimeridian
+
+    Returns a list of (west, south, east, north) tuples with longitudes in
+    [-180, 180]. Map viewports can extend past +/-180 after panning around
+    the world, so the box is wrapped rather than clipped.
+    """
+    south = max(south, -90.0)
+    north = min(north, 90.0)
+    if east - west >= 360:
+        return [(-180.0, south, 180.0, north)]
+
+    width = east - west if east >= west else east - west + 360.0
+    west = (west + 180.0) % 360.0 - 180.0
+    east = west + width
+    if east <= 180.0:
+        return [(west, south, east, north)]
+    return [(west, south, 180.0, north), (-180.0, south, east - 360.0, north)]
+
+def _cells_in_box(cells, box_west, box_south, box_east, box_north, size):
+    first_row, first_column = _cell(box_south, box_west, size)
+    last_row, last_column = _cell(box_north, box_east, size)
+
+    # Zoomed far out there are more cells in view than occupied cells
+    if (last_row - first_row + 1) * (last_column - first_column + 1) > len(cells):
+        return [cell for cell in cells
+                if first_row <= cell[0] <= last_row and first_column <= cell[1] <= last_column]
+    return [(row, column)
+            for row in range(first_row, last_row + 1)
+            for column in range(first_column, last_column + 1)
+            if (row, column) in cells]
+
+def query_geo_bbox(west, south, east, north, user_id=None):
+    """Get the items located inside a bounding box
+
+    With user_id only that user's screens are returned, otherwise every
+    screen and unassigned controller.
+    """
+    items = []
+    with _lock:
+        for box in normalize_bbox(west, south, east, north):
+            box_west, box_south, box_east, box_north = box
+            for cell in _cells_in_box(_cells, *box, GEO_GRID_CELL_DEGREES):
+                for serial_number in _cells[cell]:
+                    latitude, longitude, owner_id, item, _ = _entries[serial_number]
+                    if user_id is not None and owner_id != user_id:
+                        continue
+                    if box_south <= latitude <= box_north and box_west <= longitude <= box_east:
+                        items.append(item)
+    return items
+
+def query_geo_clusters(west, south, east, north, zoom, scope):
+    """Get the clusters of a scope in the cells overlapping a bounding box
+
+    scope is a user id, GEO_ALL_SCREENS or GEO_UNASSIGNED. Returns
+    (clusters, items): cells holding a single entry are returned as that
+    entry's item rather than as a cluster of one.
+    """
+    size = cluster_cell_degrees(zoom)
+    clusters = []
+    items = []
+    with _lock:
+        cells = _clusters.get((scope, zoom), {})
+        # Coarse cells can overlap both halves of a box split at the antimeridian
+        in_view = set()
+        for box in normalize_bbox(west, south, east, north):
+            in_view.update(_cells_in_box(cells, *box, size))
+        for cell in in_view:
+            count, online, latitude_sum, longitude_sum, key_sum = cells[cell]
+            if count == 1:
+                # With one member the key sum is that member's key
+                items.append(_entries[_keys[key_sum]][3])
+                continue
+            clusters.append({
+                'latitude': latitude_sum / count,
+                'longitude': longitude_sum / count,
+                'count': count,
+                'online': online,
+                'offline': count - online
+            })
+    return clusters, items
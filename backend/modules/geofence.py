@@ -0,0 +1,63 @@
+"""
+Geofences for LXCloud
+
+Screens are fixed installations, so each one has a home position and a
+radius it is expected to stay within. Checking a position costs a
+handful of float operations: the radius is turned into a haversine
+threshold once per screen, so the check needs no square root or arctan.
+"""
+import math
+import os
+
+EARTH_RADIUS_METERS = 6371008.8
+GEOFENCE_DEFAULT_RADIUS = int(os.environ.get('GEOFENCE_DEFAULT_RADIUS', 100))
+
+ALERT_GEOFENCE_EXIT = 'geofence_exit'
+ALERT_GEOFENCE_RETURN = 'geofence_return'
+
+_fences = {}  # serial_number -> ((home latitude, home longitude, radius), fence)
+
+def make_geofence(home_latitude, home_longitude, radius=None):
+    """Precompute a geofence
+
+    Returns (home latitude in radians, home longitude in radians, cosine
+    of the home latitude, haversine threshold).
+    """
+    radius = radius or GEOFENCE_DEFAULT_RADIUS
+    latitude = math.radians(float(home_latitude))
+    # Half the central angle is at most pi/2, beyond which everything is inside
+    half_angle = min(float(radius) / (2 * EARTH_RADIUS_METERS), math.pi / 2)
+    return (latitude, math.radians(float(home_longitude)), math.cos(latitude), math.sin(half_angle) ** 2)
+
+def get_geofence(serial_number, home_latitude, home_longitude, radius=None):
+    """Get the precomputed geofence of a screen, or None without a home"""
+    if home_latitude is None or home_longitude is None:
+        return None
+
+    settings = (home_latitude, home_longitude, radius)
+    cached = _fences.get(serial_number)
+    if cached and cached[0] == settings:
+        return cached[1]
+
+    fence = make_geofence(home_latitude, home_longitude, radius)
+    _fences[serial_number] = (settings, fence)
+    return fence
+
+def forget_geofence(serial_number):
+    """Drop the cached geofence of a screen"""
+    _fences.pop(serial_number, None)
+
+def _haversine(fence, latitude, longitude):
+    home_latitude, home_longitude, cos_home_latitude, _ = fence
+    latitude = math.radians(latitude)
+    return (math.sin((latitude - home_latitude) / 2) ** 2 +
+            cos_home_latitude * math.cos(latitude) *
+            math.sin((math.radians(longitude) - home_longitude) / 2) ** 2)
+
+def is_outside_geofence(fence, latitude, longitude):
+    """Check whether a position lies outside a geofence"""
+    return _haversine(fence, latitude, longitude) > fence[3]
+
+def geofence_distance(fence, latitude, longitude):
+    """Get the distance in meters between a position and a geofence's home"""
+    return 2 * EARTH_RADIUS_METERS * math.asin(min(1.0, math.sqrt(_haversine(fence, latitude, longitude))))
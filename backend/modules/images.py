@@ -0,0 +1,397 @@
+"""
+Image processing for uploaded UI assets
+
+Uploads are stored under a name derived from a hash of their content and
+of the size limits they were processed with, so uploading the same image
+twice reuses the files already on disk. Raster images are re-encoded with
+Pillow, which drops EXIF, XMP and other metadata, and scaled down to the
+maximum dimensions of their asset type:
+
+    <name>@1x.png, <name>@2x.png        fallback format, per DPR
+    <name>@1x.webp, <name>@1x.avif ...  modern formats, per DPR
+    <name>.ico, <name>-180.png ...      favicon set (favicon uploads only)
+    <name>.json                         manifest listing the files above
+
+The fallback at 1x is written while handling the upload, so the asset can
+be used right away; build_variants() adds the rest from a background
+task. choose_variant() picks the file to serve for an Accept header and
+device pixel ratio. Animated GIFs are scaled frame by frame and keep
+their frame durations. SVG files are stored as they are.
+"""
+import hashlib
+import json
+import os
+import re
+import shutil
+import threading
+from io import BytesIO
+
+UPLOAD_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                          'static', 'uploads', 'ui')
+
+def _parse_dimensions(value):
+    limits = {}
+    for item in value.split(','):
+        name, _, size = item.strip().partition('=')
+        if size:
+            width, _, height = size.lower().partition('x')
+            limits[name.strip()] = (int(width), int(height or width))
+    return limits
+
+# Maximum CSS pixel size (at 1x) per asset type, or type prefix ending in '_'
+UI_ASSET_MAX_DIMENSIONS = {
+    'logo': (400, 120),
+    'favicon': (64, 64),
+    'background': (1920, 1080),
+    'map_marker_': (96, 96),
+    'button_': (128, 128),
+    'screen_': (128, 128),
+    'default': (1024, 1024),
+}
+UI_ASSET_MAX_DIMENSIONS.update(_parse_dimensions(os.environ.get('UI_ASSET_MAX_DIMENSIONS', '')))
+
+# Device pixel ratios to generate variants for
+UI_ASSET_DPRS = tuple(sorted(int(dpr) for dpr in os.environ.get('UI_ASSET_DPRS', '1,2').split(',')))
+
+# Uploads decoding to more pixels than this are refused
+UI_ASSET_MAX_PIXELS = int(os.environ.get('UI_ASSET_MAX_PIXELS', 40_000_000))
+
+FAVICON_ICO_SIZES = (16, 32, 48)
+FAVICON_PNG_SIZES = (180, 192, 512)
+
+# Modern formats by preference, with their encoder options
+MODERN_FORMATS = (
+    ('avif', 'image/avif', {'quality': 60}),
+    ('webp', 'image/webp', {'quality': 82, 'method': 6}),
+)
+
+MIMETYPES = {
+    'png': 'image/png', 'jpg': 'image/jpeg', 'gif': 'image/gif',
+    'webp': 'image/webp', 'avif': 'image/avif', 'svg': 'image/svg+xml',
+    'ico': 'image/x-icon',
+}
+
+ASSET_NAME = re.compile(r'^[0-9a-f]{20}$')
+ASSET_FILE = re.compile(r'^[0-9a-f]{20}(@\d+x|-\d+)?\.[a-z]+$')
+
+_manifests = {}  # name -> manifest, complete manifests only
+_processing = set()  # names with variants being built in this process
+_lock = threading.Lock()
+
+class InvalidImage(ValueError):
+    """Upload that is not an image Pillow can process"""
+
+def max_dimensions(asset_type):
+    """Get the 1x size limit of an asset type"""
+    if asset_type in UI_ASSET_MAX_DIMENSIONS:
+        return UI_ASSET_MAX_DIMENSIONS[asset_type]
+    for prefix, size in UI_ASSET_MAX_DIMENSIONS.items():
+        if prefix.endswith('_') and asset_type.startswith(prefix):
+            return size
+    return UI_ASSET_MAX_DIMENSIONS['default']
+
+def asset_name(content_digest, asset_type):
+    """Content-hash name of an upload processed for an asset type
+
+    `content_digest` is the hex SHA-256 of the uploaded file.
+    """
+    digest = hashlib.sha256()
+    digest.update(content_digest.encode())
+    if asset_type == 'favicon':
+        digest.update(b'\nfavicon')
+    digest.update(('\n%dx%d' % max_dimensions(asset_type)).encode())
+    digest.update(('\n' + ','.join(map(str, UI_ASSET_DPRS))).encode())
+    return digest.hexdigest()[:20]
+
+def _path(filename):
+    return os.path.join(UPLOAD_DIR, filename)
+
+def _write_file(filename, data):
+    # Write next to the target and rename, so readers never see half a file
+    temporary = _path(f'.{filename}.{os.getpid()}.{threading.get_ident()}')
+    with open(temporary, 'wb') as output:
+        output.write(data)
+    os.replace(temporary, _path(filename))
+
+def _copy_file(filename, source):
+    temporary = _path(f'.{filename}.{os.getpid()}.{threading.get_ident()}')
+    shutil.copyfile(source, temporary)
+    os.replace(temporary, _path(filename))
+
+def _write_manifest(manifest):
+    _write_file(f"{manifest['name']}.json", json.dumps(manifest, sort_keys=True).encode())
+    if manifest['complete']:
+        with _lock:
+            _manifests[manifest['name']] = manifest
+
+def get_manifest(name):
+    """Get the manifest of an asset, or None if there is no such asset
+
+    Complete manifests are cached; pending ones are read from disk each
+    time, since another worker may be building their variants.
+    """
+    with _lock:
+        manifest = _manifests.get(name)
+    if manifest:
+        return manifest
+    try:
+        with open(_path(f'{name}.json'), 'rb') as source:
+            manifest = json.load(source)
+    except (OSError, ValueError):
+        return None
+    if manifest.get('complete'):
+        with _lock:
+            _manifests[name] = manifest
+    return manifest
+
+def _open_image(path, largest=None):
+    """Decode an uploaded file, returning (image, source format)
+
+    JPEGs are decoded at a reduced scale when `largest` pixels per side
+    are enough, which takes a fraction of the memory.
+    """
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        image = Image.open(path)
+        if image.width * image.height > UI_ASSET_MAX_PIXELS:
+            raise InvalidImage(f'Image too large ({image.width}x{image.height} pixels)')
+        if largest:
+            # Square, as the EXIF orientation may still swap the sides
+            image.draft(None, (largest, largest))
+        image.load()
+    except InvalidImage:
+        raise
+    except UnidentifiedImageError:
+        raise InvalidImage('Invalid image file')
+    except Exception as e:
+        raise InvalidImage(f'Cannot read image: {e}')
+
+    source_format = image.format
+    if _is_animated(image):
+        # Every frame is decoded when scaling
+        if image.width * image.height * image.n_frames > UI_ASSET_MAX_PIXELS:
+            raise InvalidImage(f'Animation too large ({image.n_frames} frames of '
+                               f'{image.width}x{image.height} pixels)')
+        return image, source_format
+    # Apply the EXIF orientation to the pixels, as the EXIF data is dropped
+    image = ImageOps.exif_transpose(image)
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() or 'transparency' in image.info else 'RGB')
+    return image, source_format
+
+def _is_animated(image):
+    # Other animated formats are reduced to their first frame
+    return image.format == 'GIF' and getattr(image, 'is_animated', False)
+
+def _fallback_format(image, source_format):
+    if _is_animated(image):
+        return 'gif'
+    if image.mode == 'RGBA' or source_format != 'JPEG':
+        return 'png'
+    return 'jpg'
+
+def _scaled(image, width, height):
+    from PIL import Image
+
+    if image.size == (width, height):
+        return image
+    return image.resize((width, height), Image.Resampling.LANCZOS)
+
+def _encode_animation(image, extension, width, height, options=None):
+    """Encode every frame of an animated image, scaled, with its duration"""
+    from PIL import ImageSequence
+
+    frames = []
+    durations = []
+    for frame in ImageSequence.Iterator(image):
+        durations.append(frame.info.get('duration', 100))
+        frames.append(_scaled(frame.convert('RGBA'), width, height))
+
+    buffer = BytesIO()
+    if extension == 'gif':
+        # Frames are whole images, so each replaces the previous one
+        options = {'optimize': True, 'disposal': 2}
+    frames[0].save(buffer, extension.upper(), save_all=True, append_images=frames[1:],
+                   duration=durations, loop=image.info.get('loop', 0), **(options or {}))
+    return buffer.getvalue()
+
+def _encode(image, extension, options=None):
+    from PIL import Image
+
+    buffer = BytesIO()
+    if extension == 'jpg':
+        image.save(buffer, 'JPEG', quality=85, optimize=True, progressive=True)
+    elif extension == 'png':
+        image.save(buffer, 'PNG', optimize=True)
+    elif extension == 'ico':
+        image.save(buffer, 'ICO', sizes=[(size, size) for size in FAVICON_ICO_SIZES])
+    else:
+        image.save(buffer, Image.registered_extensions()[f'.{extension}'], **(options or {}))
+    return buffer.getvalue()
+
+def _dpr_sizes(image, asset_type):
+    """(dpr, width, height) per DPR, skipping ratios the source is too small for"""
+    width, height = max_dimensions(asset_type)
+    sizes = []
+    for dpr in UI_ASSET_DPRS:
+        ratio = min(width * dpr / image.width, height * dpr / image.height, 1)
+        size = (max(1, round(image.width * ratio)), max(1, round(image.height * ratio)))
+        if sizes and size == sizes[-1][1:]:
+            break
+        sizes.append((dpr,) + size)
+    return sizes
+
+def _add_variant(manifest, filename, extension, dpr, size, data):
+    _write_file(filename, data)
+    manifest['variants'].append({
+        'file': filename, 'format': extension, 'dpr': dpr,
+        'width': size[0], 'height': size[1], 'bytes': len(data)
+    })
+
+def _largest_side(asset_type):
+    largest = max(max_dimensions(asset_type)) * UI_ASSET_DPRS[-1]
+    if asset_type == 'favicon':
+        largest = max(largest, max(FAVICON_PNG_SIZES))
+    return largest
+
+def store_upload(path, content_digest, asset_type, content_type):
+    """Store an uploaded file and its fallback variant, returning (name, manifest, pending)
+
+    `pending` is True when build_variants() still has to run for the name.
+    Raises InvalidImage if the upload cannot be processed.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    name = asset_name(content_digest, asset_type)
+    manifest = get_manifest(name)
+    if manifest:
+        with _lock:
+            pending = not manifest['complete'] and name not in _processing
+        return name, manifest, pending
+
+    manifest = {'name': name, 'type': asset_type, 'variants': [], 'favicons': [], 'complete': False}
+    if content_type == 'image/svg+xml':
+        # Vector images are served as uploaded, at any pixel ratio
+        _copy_file(f'{name}.svg', path)
+        manifest['variants'].append({'file': f'{name}.svg', 'format': 'svg', 'dpr': 0,
+                                     'width': 0, 'height': 0, 'bytes': os.path.getsize(path)})
+        manifest['complete'] = True
+        _write_manifest(manifest)
+        return name, manifest, False
+
+    image, source_format = _open_image(path, _largest_side(asset_type))
+    extension = _fallback_format(image, source_format)
+    dpr, width, height = _dpr_sizes(image, asset_type)[0]
+    if extension == 'gif':
+        # Pillow rewrites the frames without comments
+        encoded = _encode_animation(image, extension, width, height)
+    else:
+        encoded = _encode(_scaled(image, width, height), extension)
+    _add_variant(manifest, f'{name}@{dpr}x.{extension}', extension, dpr, (width, height), encoded)
+    manifest['width'], manifest['height'] = width, height
+    _write_manifest(manifest)
+    return name, manifest, True
+
+def build_variants(name, path):
+    """Add the remaining DPR, modern format and favicon variants of an upload
+
+    Runs once per name and process at a time; the manifest is marked
+    complete when all files exist.
+    """
+    from PIL import features
+
+    with _lock:
+        if name in _processing:
+            return None
+        _processing.add(name)
+    try:
+        manifest = get_manifest(name)
+        if not manifest or manifest['complete']:
+            return manifest
+        asset_type = manifest['type']
+        image, _ = _open_image(path, _largest_side(asset_type))
+        done = {variant['file'] for variant in manifest['variants']}
+        animated = _is_animated(image)
+
+        fallback = manifest['variants'][0]['format']
+        formats = [(fallback, None)] + [(extension, options) for extension, _, options
+                                       in MODERN_FORMATS if features.check(extension)]
+        if animated:
+            # Animated AVIF support varies between Pillow builds
+            formats = [(extension, options) for extension, options in formats if extension != 'avif']
+        for dpr, width, height in _dpr_sizes(image, asset_type):
+            scaled = None if animated else _scaled(image, width, height)
+            for extension, options in formats:
+                filename = f'{name}@{dpr}x.{extension}'
+                if filename in done:
+                    continue
+                if animated:
+                    data = _encode_animation(image, extension, width, height, options)
+                else:
+                    data = _encode(scaled, extension, options)
+                _add_variant(manifest, filename, extension, dpr, (width, height), data)
+
+        if asset_type == 'favicon' and not animated:
+            _add_favicons(manifest, _square(image))
+
+        manifest['complete'] = True
+        _write_manifest(manifest)
+        return manifest
+    finally:
+        with _lock:
+            _processing.discard(name)
+
+def _square(image):
+    """Pad an image to a transparent square, as icons are square"""
+    from PIL import Image
+
+    side = max(image.size)
+    square = Image.new('RGBA', (side, side), (0, 0, 0, 0))
+    square.paste(image, ((side - image.width) // 2, (side - image.height) // 2))
+    return square
+
+def _add_favicons(manifest, square):
+    from PIL import Image
+
+    name = manifest['name']
+    # Pillow leaves out the ICO sizes larger than the source
+    _write_file(f'{name}.ico', _encode(square, 'ico'))
+    manifest['favicons'].append({'file': f'{name}.ico', 'format': 'ico', 'size': max(FAVICON_ICO_SIZES)})
+    for size in FAVICON_PNG_SIZES:
+        # Scaled up icons look blurry; only the apple-touch-icon size is always made
+        if size > square.width and size != FAVICON_PNG_SIZES[0]:
+            continue
+        filename = f'{name}-{size}.png'
+        _write_file(filename, _encode(square.resize((size, size), Image.Resampling.LANCZOS), 'png'))
+        manifest['favicons'].append({'file': filename, 'format': 'png', 'size': size})
+
+def accepted_formats(accept):
+    """Image formats an Accept header names explicitly
+
+    Clients sending only */* get the fallback format: old browsers do so
+    without being able to decode AVIF or WebP.
+    """
+    formats = set()
+    for item in (accept or '').split(','):
+        mimetype, _, parameters = item.strip().partition(';')
+        quality = re.search(r'q=([0-9.]+)', parameters)
+        if quality and float(quality.group(1)) == 0:
+            continue
+        formats.add(mimetype.strip().lower())
+    return formats
+
+def choose_variant(manifest, accept, dpr=1):
+    """Pick the variant to serve for an Accept header and device pixel ratio"""
+    variants = manifest['variants']
+    ratios = sorted({variant['dpr'] for variant in variants})
+    # The smallest ratio at least as sharp as the display, else the sharpest there is
+    ratio = next((r for r in ratios if r >= dpr), ratios[-1])
+    candidates = [variant for variant in variants if variant['dpr'] == ratio]
+
+    formats = accepted_formats(accept)
+    for extension, mimetype, _ in MODERN_FORMATS:
+        if mimetype in formats:
+            for variant in candidates:
+                if variant['format'] == extension:
+                    return variant
+    return candidates[0]
@@ -0,0 +1,335 @@
+"""
+Schema migrations for LXCloud
+
+Migrations are (version, description, function) steps in version order;
+each function gets a cursor and brings the schema from the previous
+version to its own. Steps changing large tables can be an OnlineAlter
+instead of a function, which keeps the table writable meanwhile. The
+latest row of schema_version records the version reached and, once up
+to date, a fingerprint of the step list, so every later start of every
+worker checks the schema with one query and returns.
+
+Otherwise the runner takes a lock held across processes (GET_LOCK on
+MariaDB, see StorageEngine.migration_lock), checks again (another worker
+may have migrated in the meantime) and runs the missing steps on its one
+connection. Each step commits together with its schema_version row;
+MariaDB commits DDL statements on its own, which is why the steps are
+written to be rerun safely (IF NOT EXISTS, INSERT IGNORE) after an
+interruption.
+"""
+import hashlib
+import os
+import time
+
+from modules.storage import DatabaseError
+
+# Seconds a worker waits for another one's migrations before giving up
+MIGRATION_LOCK_TIMEOUT = int(os.environ.get('MIGRATION_LOCK_TIMEOUT', 300))
+
+# Rows copied per statement by OnlineAlter, and seconds to rest between
+# chunks so device updates keep their share of the server
+ONLINE_MIGRATION_CHUNK_SIZE = int(os.environ.get('ONLINE_MIGRATION_CHUNK_SIZE', 5000))
+ONLINE_MIGRATION_PAUSE = float(os.environ.get('ONLINE_MIGRATION_PAUSE', 0.05))
+
+# Seconds between progress messages of a table copy
+ONLINE_MIGRATION_REPORT_INTERVAL = 10
+
+# MariaDB errors for an ALTER TABLE that can't run with the requested algorithm or lock
+ALTER_NOT_ONLINE_ERRORS = (1845, 1846)
+
+# MariaDB errors for a CREATE TRIGGER the user isn't allowed to run: no
+# TRIGGER privilege, or binary logging without SUPER
+TRIGGER_DENIED_ERRORS = (1142, 1227, 1419)
+
+class OnlineAlter:
+    """Migration step changing a large table without blocking its writes
+
+    On MariaDB the alteration (say "ADD INDEX IF NOT EXISTS ...") first
+    runs with ALGORITHM=INPLACE, LOCK=NONE. Where the server can't do
+    that, it is applied to an empty copy of the table instead, which is
+    filled in chunks of ONLINE_MIGRATION_CHUNK_SIZE rows by primary key
+    while triggers replay the table's writes on it; RENAME TABLE then
+    swaps the two atomically. The copy's progress is kept in
+    schema_migration_progress, so a copy interrupted by a restart
+    resumes where it stopped.
+
+    Copying needs an integer primary key named id and a table no other
+    table references (their foreign keys would follow the rename to the
+    old copy). The database user needs the TRIGGER privilege and, with
+    binary logging on, SUPER or log_bin_trust_function_creators=1.
+    Alterations must be safe to repeat (IF NOT EXISTS). On SQLite the
+    alteration just runs: adding a column only changes the schema, and
+    site databases are small.
+
+    A copy that failed before recording its progress leaves no progress
+    row but may leave the shadow table and triggers; the next run drops
+    them before starting over.
+    """
+
+    def __init__(self, table, alteration):
+        self.table = table
+        self.alteration = alteration
+        self.shadow = f"_{table}_new"
+        self.old = f"_{table}_old"
+        self.triggers = {event: f"{table}_online_{event.lower()}" for event in ('INSERT', 'UPDATE', 'DELETE')}
+
+    def run(self, engine, conn, cursor):
+        """Apply the alteration, committing as it goes"""
+        if engine.name != 'mariadb':
+            cursor.execute(f"ALTER TABLE {self.table} {self.alteration}")
+            return
+
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS schema_migration_progress (
+                table_name VARCHAR(64) PRIMARY KEY,
+                alteration TEXT NOT NULL,
+                last_id BIGINT NOT NULL DEFAULT 0,
+                max_id BIGINT NOT NULL DEFAULT 0,
+                started_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+        if self._progress(cursor) is None:
+            # Left behind, the triggers would mirror every write into the
+            # shadow table, and fail them once it is gone
+            self._discard_copy(cursor)
+            try:
+                cursor.execute(f"ALTER TABLE {self.table} {self.alteration}, ALGORITHM=INPLACE, LOCK=NONE")
+                return
+            except DatabaseError as e:
+                if not e.args or e.args[0] not in ALTER_NOT_ONLINE_ERRORS:
+                    raise
+                print(f"{self.table}: cannot change in place ({e.args[-1]}), copying the table")
+            try:
+                self._create_shadow(cursor)
+            except DatabaseError as e:
+                self._discard_copy(cursor)
+                if e.args and e.args[0] in TRIGGER_DENIED_ERRORS:
+                    raise RuntimeError(
+                        f"Cannot copy {self.table} online: {e.args[-1]}. The database user needs the "
+                        f"TRIGGER privilege and, with binary logging on, SUPER or "
+                        f"log_bin_trust_function_creators=1"
+                    ) from e
+                raise
+            conn.commit()
+        else:
+            print(f"{self.table}: resuming the interrupted copy")
+
+        self._copy(conn, cursor)
+        self._clean_up(conn, cursor)
+
+    def _progress(self, cursor):
+        cursor.execute(
+            "SELECT last_id, max_id FROM schema_migration_progress WHERE table_name = %s AND alteration = %s",
+            (self.table, self.alteration)
+        )
+        return cursor.fetchone()
+
+    def _columns(self, cursor):
+        cursor.execute("""
+            SELECT COLUMN_NAME FROM information_schema.COLUMNS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+            ORDER BY ORDINAL_POSITION
+        """, (self.table,))
+        return [row[0] for row in cursor.fetchall()]
+
+    def _create_shadow(self, cursor):
+        table, shadow = self.table, self.shadow
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.REFERENTIAL_CONSTRAINTS
+            WHERE CONSTRAINT_SCHEMA = DATABASE() AND REFERENCED_TABLE_NAME = %s
+        """, (table,))
+        if cursor.fetchone()[0]:
+            raise RuntimeError(f"Cannot copy {table} online: other tables have foreign keys to it")
+
+        cursor.execute(f"CREATE TABLE {shadow} LIKE {table}")
+        cursor.execute(f"ALTER TABLE {shadow} {self.alteration}")
+
+        # CREATE TABLE ... LIKE leaves out foreign keys; unnamed ones get
+        # names derived from the table's, renamed along with it
+        cursor.execute("""
+            SELECT k.CONSTRAINT_NAME, k.COLUMN_NAME, k.REFERENCED_TABLE_NAME, k.REFERENCED_COLUMN_NAME,
+                   r.DELETE_RULE, r.UPDATE_RULE
+            FROM information_schema.KEY_COLUMN_USAGE k
+            JOIN information_schema.REFERENTIAL_CONSTRAINTS r
+              ON r.CONSTRAINT_SCHEMA = k.CONSTRAINT_SCHEMA AND r.CONSTRAINT_NAME = k.CONSTRAINT_NAME
+            WHERE k.TABLE_SCHEMA = DATABASE() AND k.TABLE_NAME = %s
+            ORDER BY k.CONSTRAINT_NAME, k.ORDINAL_POSITION
+        """, (table,))
+        foreign_keys = {}
+        for name, column, referenced, referenced_column, on_delete, on_update in cursor.fetchall():
+            key = foreign_keys.setdefault(name, ([], referenced, [], on_delete, on_update))
+            key[0].append(f"`{column}`")
+            key[2].append(f"`{referenced_column}`")
+        for columns, referenced, referenced_columns, on_delete, on_update in foreign_keys.values():
+            cursor.execute(
+                f"ALTER TABLE {shadow} ADD FOREIGN KEY ({', '.join(columns)}) "
+                f"REFERENCES {referenced} ({', '.join(referenced_columns)}) "
+                f"ON DELETE {on_delete} ON UPDATE {on_update}"
+            )
+
+        columns = self._columns(cursor)
+        names = ', '.join(f"`{column}`" for column in columns)
+        values = ', '.join(f"NEW.`{column}`" for column in columns)
+        # Rows written during the copy reach the shadow table right away;
+        # the copy's INSERT IGNORE leaves them alone
+        cursor.execute(f"""
+            CREATE TRIGGER {self.triggers['INSERT']} AFTER INSERT ON {table} FOR EACH ROW
+            REPLACE INTO {shadow} ({names}) VALUES ({values})
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {self.triggers['UPDATE']} AFTER UPDATE ON {table} FOR EACH ROW
+            REPLACE INTO {shadow} ({names}) VALUES ({values})
+        """)
+        cursor.execute(f"""
+            CREATE TRIGGER {self.triggers['DELETE']} AFTER DELETE ON {table} FOR EACH ROW
+            DELETE FROM {shadow} WHERE id = OLD.id
+        """)
+
+        cursor.execute(f"SELECT COALESCE(MAX(id), 0) FROM {table}")
+        max_id = cursor.fetchone()[0]
+        cursor.execute(
+            "REPLACE INTO schema_migration_progress (table_name, alteration, last_id, max_id) VALUES (%s, %s, 0, %s)",
+            (table, self.alteration, max_id)
+        )
+
+    def _discard_copy(self, cursor):
+        for trigger in self.triggers.values():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {self.shadow}")
+        cursor.execute(f"DROP TABLE IF EXISTS {self.old}")
+        # Progress of a copy with another alteration, abandoned for this one
+        cursor.execute("DELETE FROM schema_migration_progress WHERE table_name = %s", (self.table,))
+
+    def _copy(self, conn, cursor):
+        cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.TABLES
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = %s
+        """, (self.shadow,))
+        if not cursor.fetchone()[0]:
+            # Interrupted after the swap; only the cleanup is left
+            return
+
+        last_id, max_id = self._progress(cursor)
+        names = ', '.join(f"`{column}`" for column in self._columns(cursor))
+        reported = time.monotonic()
+        while last_id < max_id:
+            upper = min(last_id + ONLINE_MIGRATION_CHUNK_SIZE, max_id)
+            cursor.execute(
+                f"INSERT IGNORE INTO {self.shadow} ({names}) "
+                f"SELECT {names} FROM {self.table} WHERE id > %s AND id <= %s",
+                (last_id, upper)
+            )
+            cursor.execute(
+                "UPDATE schema_migration_progress SET last_id = %s WHERE table_name = %s",
+                (upper, self.table)
+            )
+            conn.commit()
+            last_id = upper
+            if time.monotonic() - reported >= ONLINE_MIGRATION_REPORT_INTERVAL:
+                print(f"{self.table}: copied up to id {last_id} of {max_id} ({last_id / max_id:.0%})")
+                reported = time.monotonic()
+            time.sleep(ONLINE_MIGRATION_PAUSE)
+        print(f"{self.table}: copy complete, swapping tables")
+
+        cursor.execute(f"DROP TABLE IF EXISTS {self.old}")
+        cursor.execute(f"RENAME TABLE {self.table} TO {self.old}, {self.shadow} TO {self.table}")
+
+    def _clean_up(self, conn, cursor):
+        # The triggers went along with the old table, which nothing writes to now
+        for trigger in self.triggers.values():
+            cursor.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+        cursor.execute(f"DROP TABLE IF EXISTS {self.old}")
+        cursor.execute("DELETE FROM schema_migration_progress WHERE table_name = %s", (self.table,))
+        conn.commit()
+
+def schema_fingerprint(migrations):
+    """Identify a list of migration steps by their versions and descriptions"""
+    steps = '\n'.join(f"{version}:{description}" for version, description, _ in migrations)
+    return hashlib.sha256(steps.encode()).hexdigest()[:16]
+
+def _latest_row(cursor, columns):
+    cursor.execute(f"SELECT {columns} FROM schema_version ORDER BY id DESC LIMIT 1")
+    return cursor.fetchone()
+
+def is_up_to_date(cursor, migrations):
+    """Check with one query whether the last step was recorded with this step list"""
+    try:
+        row = _latest_row(cursor, 'version, fingerprint')
+    except DatabaseError:
+        # No schema_version table, or one from before fingerprints
+        return False
+    return row is not None and tuple(row) == (migrations[-1][0], schema_fingerprint(migrations))
+
+def run_migrations(engine, connect, migrations):
+    """Bring the schema up to date, returning the version reached"""
+    target = migrations[-1][0]
+    fingerprint = schema_fingerprint(migrations)
+
+    conn = connect()
+    cursor = conn.cursor()
+    try:
+        if is_up_to_date(cursor, migrations):
+            print(f"Database is up to date (version {target})")
+            return target
+        conn.rollback()
+
+        with engine.migration_lock(conn, MIGRATION_LOCK_TIMEOUT):
+            cursor.execute("""
+                CREATE TABLE IF NOT EXISTS schema_version (
+                    id INT AUTO_INCREMENT PRIMARY KEY,
+                    version INT NOT NULL,
+                    fingerprint VARCHAR(64) NULL,
+                    updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+                )
+            """)
+            conn.commit()
+
+            # Another worker may have finished while this one waited
+            if is_up_to_date(cursor, migrations):
+                print(f"Database is up to date (version {target})")
+                return target
+
+            row = _latest_row(cursor, 'version')
+            current_version = row[0] if row else 0
+            print(f"Current database version: {current_version}")
+            print(f"Target database version: {target}")
+
+            pending = [step for step in migrations if step[0] > current_version]
+            if pending:
+                print("Running database migrations...")
+            for version, description, migrate in pending:
+                print(f"{description}...")
+                try:
+                    if isinstance(migrate, OnlineAlter):
+                        migrate.run(engine, conn, cursor)
+                    else:
+                        migrate(cursor)
+                    # Steps before the one adding the column can't record a fingerprint
+                    if version == target:
+                        cursor.execute(
+                            "INSERT INTO schema_version (version, fingerprint) VALUES (%s, %s)",
+                            (version, fingerprint)
+                        )
+                    else:
+                        cursor.execute("INSERT INTO schema_version (version) VALUES (%s)", (version,))
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+                print(f"Migration to version {version} completed")
+
+            if pending:
+                print("All database migrations completed successfully")
+                return target
+            if current_version == target:
+                # Migrated by a build with other step descriptions; fast path from now on
+                cursor.execute(
+                    "INSERT INTO schema_version (version, fingerprint) VALUES (%s, %s)",
+                    (target, fingerprint)
+                )
+                conn.commit()
+            print("Database is up to date")
+            return current_version
+    finally:
+        cursor.close()
+        conn.close()
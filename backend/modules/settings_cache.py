@@ -0,0 +1,54 @@
+"""
+Settings cache for LXCloud
+
+ui_settings and admin_settings change rarely but are read on every page
+load. Each table has a version row in settings_versions that is bumped in
+the same transaction as every write. A worker keeps the merged settings
+and their serialized JSON per version, and asks the database for the
+version at most once per SETTINGS_POLL_INTERVAL, so writes made through
+another worker show up within that interval.
+"""
+import os
+import threading
+import time
+
+SETTINGS_POLL_INTERVAL = float(os.environ.get('SETTINGS_POLL_INTERVAL', 5))
+
+_entries = {}  # table -> (version, settings, payload)
+_checked = {}  # table -> time.monotonic() of the last version check
+_lock = threading.Lock()
+
+def get_fresh_settings(table):
+    """Get the cached (version, settings, payload) of a table if recently checked"""
+    with _lock:
+        entry = _entries.get(table)
+        if entry and time.monotonic() - _checked.get(table, 0) < SETTINGS_POLL_INTERVAL:
+            return entry
+    return None
+
+def get_settings_for_version(table, version):
+    """Get the cached entry of a table if it is at `version`
+
+    Either way the version counts as checked for SETTINGS_POLL_INTERVAL
+    once an entry for it is cached.
+    """
+    with _lock:
+        entry = _entries.get(table)
+        if entry and entry[0] == version:
+            _checked[table] = time.monotonic()
+            return entry
+    return None
+
+def store_settings(table, version, settings, payload):
+    """Cache the merged settings of a table and their serialized JSON"""
+    entry = (version, settings, payload)
+    with _lock:
+        _entries[table] = entry
+        _checked[table] = time.monotonic()
+    return entry
+
+def forget_settings(table):
+    """Drop the cached settings of a table after a write"""
+    with _lock:
+        _entries.pop(table, None)
+        _checked.pop(table, None)
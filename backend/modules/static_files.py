@@ -0,0 +1,182 @@
+"""
+Static file serving for LXCloud
+
+Without nginx in front (standalone installs), the backend serves the
+frontend build itself. StaticFiles keeps an index of the build directory
+in memory: every file's size, type and a strong ETag from a hash of its
+content, plus gzip (and brotli, if the brotli package is installed)
+copies of compressible files. The copies are written next to the
+originals when the index is built, unless the build already produced
+them, so each file is compressed once rather than per request.
+
+Responses go through Flask's send_file, which answers conditional and
+range requests and hands the file to the server's wsgi.file_wrapper
+(sendfile under gunicorn). Names holding a content hash, like
+bundle.3f2a9c1d.js, are sent as immutable; anything else, index.html
+included, must be revalidated.
+
+Run this module on a build directory to precompress it ahead of time:
+
+    python backend/modules/static_files.py frontend/dist
+"""
+import gzip
+import hashlib
+import mimetypes
+import os
+import re
+import sys
+import threading
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Files smaller than this gain too little from compression
+STATIC_COMPRESS_MIN_SIZE = 1024
+
+COMPRESSIBLE_TYPES = ('text/', 'application/javascript', 'application/json',
+                      'application/xml', 'image/svg+xml', 'image/x-icon', 'application/wasm')
+
+# bundle.3f2a9c1d.js, main.3f2a9c1d4b.chunk.css, ...
+HASHED_NAME = re.compile(r'\.[0-9a-f]{8,}\.')
+
+# Content-Encoding -> suffix of the precompressed copy, by preference
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+def _compress(encoding, data):
+    if encoding == 'gzip':
+        # mtime=0 keeps the output identical between builds
+        return gzip.compress(data, compresslevel=9, mtime=0)
+    return _brotli().compress(data, quality=11)
+
+def _compressible(mimetype, size):
+    return size >= STATIC_COMPRESS_MIN_SIZE and (mimetype or '').startswith(COMPRESSIBLE_TYPES)
+
+def _precompress(path, data, mtime):
+    """Write missing or outdated compressed copies of a file, returning {encoding: path}"""
+    copies = {}
+    for encoding, suffix in ENCODINGS:
+        if encoding == 'br' and not _brotli():
+            continue
+        copy = path + suffix
+        try:
+            if not os.path.exists(copy) or os.stat(copy).st_mtime_ns < mtime:
+                compressed = _compress(encoding, data)
+                if len(compressed) >= len(data):
+                    continue
+                temporary = f'{copy}.{os.getpid()}.tmp'
+                with open(temporary, 'wb') as output:
+                    output.write(compressed)
+                os.replace(temporary, copy)
+        except OSError as e:
+            print(f"Cannot precompress {path}: {e}")
+            continue
+        copies[encoding] = copy
+    return copies
+
+class StaticFiles:
+    """In-memory index of a directory tree, served with precompressed copies"""
+
+    def __init__(self, root, compress=True):
+        self.root = os.path.abspath(root)
+        self.compress = compress
+        self._files = {}
+        self._stamp = None
+        self._lock = threading.Lock()
+
+    def _current_stamp(self):
+        # New builds change the root directory (new hashed names) or index.html
+        stamps = []
+        for path in (self.root, os.path.join(self.root, 'index.html')):
+            try:
+                stamps.append(os.stat(path).st_mtime_ns)
+            except OSError:
+                stamps.append(None)
+        return tuple(stamps)
+
+    def _scan(self):
+        files = {}
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                path = os.path.join(directory, name)
+                source, suffix = os.path.splitext(path)
+                if suffix == '.tmp' or suffix in ('.gz', '.br') and os.path.exists(source):
+                    continue
+                try:
+                    stat = os.stat(path)
+                    with open(path, 'rb') as source_file:
+                        data = source_file.read()
+                except OSError:
+                    continue
+                mimetype = mimetypes.guess_type(name)[0] or 'application/octet-stream'
+                relative = os.path.relpath(path, self.root).replace(os.sep, '/')
+                files[relative] = {
+                    'path': path,
+                    'mimetype': mimetype,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'etag': hashlib.sha256(data).hexdigest()[:20],
+                    'immutable': bool(HASHED_NAME.search(name)),
+                    'encodings': (_precompress(path, data, stat.st_mtime_ns)
+                                  if self.compress and _compressible(mimetype, len(data)) else {}),
+                }
+        return files
+
+    def refresh(self):
+        """Rebuild the index if the directory changed since it was built"""
+        stamp = self._current_stamp()
+        if stamp == self._stamp:
+            return self._files
+        with self._lock:
+            if stamp != self._stamp:
+                self._files = self._scan() if stamp[0] is not None else {}
+                # Writing compressed copies touches the directory, so stamp afterwards
+                self._stamp = self._current_stamp()
+                if self._files:
+                    compressed = sum(1 for entry in self._files.values() if entry['encodings'])
+                    print(f"Indexed {len(self._files)} static files in {self.root} "
+                          f"({compressed} precompressed)")
+        return self._files
+
+    def lookup(self, path):
+        """Get the index entry of a relative path, or None"""
+        return self.refresh().get(path.lstrip('/'))
+
+    def send(self, path, accept_encodings=None):
+        """Build the response for a relative path, or None if there is no such file
+
+        `accept_encodings` is the request's werkzeug Accept-Encoding object.
+        """
+        from flask import send_file
+
+        entry = self.lookup(path)
+        if not entry:
+            return None
+
+        file, etag, encoding = entry['path'], entry['etag'], None
+        for candidate, _ in ENCODINGS:
+            if candidate in entry['encodings'] and accept_encodings and accept_encodings[candidate]:
+                file, etag, encoding = entry['encodings'][candidate], f"{etag}-{candidate}", candidate
+                break
+
+        try:
+            response = send_file(file, mimetype=entry['mimetype'], etag=etag, conditional=True,
+                                 last_modified=entry['mtime'], max_age=None)
+        except OSError:
+            # Removed by a new build since the index was made
+            return None
+        if encoding:
+            response.headers['Content-Encoding'] = encoding
+        if entry['encodings']:
+            response.vary.add('Accept-Encoding')
+        response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if entry['immutable'] else 'no-cache'
+        return response
+
+if __name__ == '__main__':
+    for root in sys.argv[1:] or ['.']:
+        StaticFiles(root).refresh()
@@ -0,0 +1,501 @@
+"""
+Storage engines for LXCloud
+
+The backend talks to its database through DB-API connections that take
+%s placeholders and return tuple rows, with SQL written for MariaDB. A
+storage engine hands out those connections:
+
+    mariadb  MariaDB/MySQL through PyMySQL (default)
+    sqlite   a SQLite database file in WAL mode, for site installs without
+             a database server
+    memory   a SQLite database in memory, emptied on restart, serving one
+             request at a time (standalone demos and tests)
+
+The SQLite engines rewrite statements into SQLite's dialect as they are
+executed. The rewrites cover the MariaDB constructs the backend uses:
+AUTO_INCREMENT, ENUM and inline indexes in CREATE TABLE, ALTER TABLE
+with several ADD COLUMN IF NOT EXISTS or ADD INDEX, INSERT IGNORE, ON
+DUPLICATE KEY UPDATE, NOW(), TIMESTAMPDIFF(SECOND, ...), GREATEST/LEAST
+and random registration keys. Each distinct statement is rewritten once.
+"""
+import contextlib
+import functools
+import os
+import re
+import sqlite3
+import threading
+import time
+from datetime import datetime
+
+import pymysql
+
+STORAGE_ENGINES = ('mariadb', 'sqlite', 'memory')
+
+# Database file of the sqlite engine
+STORAGE_PATH = os.environ.get(
+    'STORAGE_PATH',
+    os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'lxcloud.db')
+)
+
+# Idle connections the sqlite engine keeps open for reuse
+SQLITE_CONNECTIONS = int(os.environ.get('SQLITE_CONNECTIONS', 8))
+
+# Prepared statements cached per SQLite connection
+SQLITE_STATEMENT_CACHE = 256
+
+# Device updates kept per screen by the memory engine; older ones are
+# dropped as new ones arrive (0 keeps all)
+MEMORY_SCREEN_DATA_LIMIT = int(os.environ.get('MEMORY_SCREEN_DATA_LIMIT', 1000))
+
+# Errors raised by any engine, for handlers reporting database failures
+DatabaseError = (pymysql.Error, sqlite3.Error)
+
+class StorageEngine:
+    """Source of database connections for one kind of database"""
+
+    name = None
+    # Whether connections may be kept open by modules.dbpool
+    poolable = False
+
+    def connect(self):
+        """Open a connection; close() ends it (and rolls back if uncommitted)"""
+        raise NotImplementedError
+
+    def describe(self):
+        """Name the database for startup messages, without credentials"""
+        return self.name
+
+    def finish_schema(self):
+        """Apply engine-specific additions once migrations have run"""
+
+    @contextlib.contextmanager
+    def migration_lock(self, connection, timeout):
+        """Hold a lock that all processes using the database honour while migrating"""
+        # In-process databases are migrated by one process
+        yield
+
+class MariaDBEngine(StorageEngine):
+    """MariaDB or MySQL server, through PyMySQL"""
+
+    name = 'mariadb'
+    poolable = True
+
+    def __init__(self, config):
+        self.config = config
+
+    def connect(self):
+        return pymysql.connect(**self.config)
+
+    def describe(self):
+        return f"mariadb ({self.config.get('database')} on {self.config.get('host')})"
+
+    @contextlib.contextmanager
+    def migration_lock(self, connection, timeout):
+        # Lock names are server-wide, so name the database
+        name = f"{self.config.get('database')}.migrations"
+        cursor = connection.cursor()
+        cursor.execute("SELECT GET_LOCK(%s, %s)", (name, timeout))
+        if cursor.fetchone()[0] != 1:
+            cursor.close()
+            raise RuntimeError(f"Another process held the migration lock for {timeout} s")
+        try:
+            yield
+        finally:
+            cursor.execute("SELECT RELEASE_LOCK(%s)", (name,))
+            cursor.close()
+
+# SQLite rewrites of MariaDB statements
+
+_NOW = "(datetime('now', 'localtime'))"
+
+_RULES = [
+    (re.compile(r'\bON UPDATE CURRENT_TIMESTAMP\b', re.I), ''),
+    (re.compile(r'\bINT\s+AUTO_INCREMENT\s+PRIMARY\s+KEY\b', re.I), 'INTEGER PRIMARY KEY AUTOINCREMENT'),
+    (re.compile(r"\bENUM\s*\([^)]*\)", re.I), 'TEXT'),
+    (re.compile(r'\bINSERT\s+IGNORE\b', re.I), 'INSERT OR IGNORE'),
+    (re.compile(r"\bCONCAT\('([^']*)',\s*SUBSTRING\(MD5\(RAND\(\)\),\s*1,\s*(\d+)\)\)", re.I),
+     r"('\1' || substr(lower(hex(randomblob(16))), 1, \2))"),
+    (re.compile(r'\bTIMESTAMPDIFF\(\s*SECOND\s*,\s*([\w.]+(?:\(\))?)\s*,\s*([\w.]+(?:\(\))?)\s*\)', re.I),
+     r'CAST(ROUND((julianday(\2) - julianday(\1)) * 86400) AS INTEGER)'),
+    (re.compile(r'\bGREATEST\(', re.I), 'MAX('),
+    (re.compile(r'\bLEAST\(', re.I), 'MIN('),
+    (re.compile(r'\b(?:NOW\(\)|CURRENT_TIMESTAMP)', re.I), _NOW),
+]
+
+_CREATE_TABLE = re.compile(r'^\s*CREATE\s+TABLE\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)', re.I)
+_INLINE_INDEX = re.compile(r',\s*(UNIQUE\s+)?(?:INDEX|KEY)\s+(\w+)\s*\(([^)]*)\)', re.I)
+_FOREIGN_KEY = re.compile(r'\bFOREIGN\s+KEY\s*\((\w+)\)', re.I)
+_ALTER_ADD = re.compile(r'^\s*ALTER\s+TABLE\s+(\w+)\s+(ADD\s+(?:COLUMN|INDEX|KEY|UNIQUE)\b.*)$', re.I | re.S)
+_ADD_INDEX = re.compile(r'^ADD\s+(UNIQUE\s+)?(?:INDEX|KEY)\s+(?:IF\s+NOT\s+EXISTS\s+)?(\w+)\s*\((.*)\)$', re.I | re.S)
+_UPSERT = re.compile(r'\bON\s+DUPLICATE\s+KEY\s+UPDATE\b', re.I)
+
+def _split_top_level(text):
+    parts, depth, start = [], 0, 0
+    for i, char in enumerate(text):
+        if char == '(':
+            depth += 1
+        elif char == ')':
+            depth -= 1
+        elif char == ',' and depth == 0:
+            parts.append(text[start:i])
+            start = i + 1
+    parts.append(text[start:])
+    return [part.strip() for part in parts if part.strip()]
+
+@functools.lru_cache(maxsize=1024)
+def translate(query):
+    """Rewrite a MariaDB statement for SQLite
+
+    Returns a tuple of (statement, if_not_exists) to run in order;
+    if_not_exists marks ADD COLUMN statements whose column may exist.
+    """
+    query = query.replace('%s', '?').replace('%%', '%')
+
+    upsert = _UPSERT.search(query)
+    if upsert:
+        assignments = re.sub(r'\bVALUES\((\w+)\)', r'excluded.\1', query[upsert.end():])
+        query = query[:upsert.start()] + 'ON CONFLICT DO UPDATE SET' + assignments
+
+    for pattern, replacement in _RULES:
+        query = pattern.sub(replacement, query)
+
+    alter = _ALTER_ADD.match(query)
+    if alter:
+        table, columns = alter.groups()
+        statements = []
+        for column in _split_top_level(columns):
+            index = _ADD_INDEX.match(column)
+            if index:
+                unique, name, indexed = index.groups()
+                statements.append((f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS "
+                                   f"{table}_{name} ON {table} ({indexed})", False))
+                continue
+            if_not_exists = bool(re.match(r'ADD\s+COLUMN\s+IF\s+NOT\s+EXISTS\b', column, re.I))
+            column = re.sub(r'\s+IF\s+NOT\s+EXISTS\b', '', column, count=1, flags=re.I)
+            statements.append((f'ALTER TABLE {table} {column}', if_not_exists))
+        return tuple(statements)
+
+    table = _CREATE_TABLE.match(query)
+    if table:
+        # SQLite has no inline indexes, and index names are per database.
+        # Foreign key columns get the index InnoDB would create for them.
+        name = table.group(1)
+        indexes = [
+            f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name}_{index} ON {name} ({columns})"
+            for unique, index, columns in _INLINE_INDEX.findall(query)
+        ] + [
+            f"CREATE INDEX IF NOT EXISTS {name}_fk_{column} ON {name} ({column})"
+            for column in _FOREIGN_KEY.findall(query)
+        ]
+        query = _INLINE_INDEX.sub('', query)
+        return ((query, False),) + tuple((index, False) for index in indexes)
+
+    return ((query, False),)
+
+def _convert_timestamp(value):
+    value = value.decode()
+    try:
+        return datetime.fromisoformat(value)
+    except ValueError:
+        return value
+
+# TIMESTAMP columns come back as datetime objects, like with PyMySQL, and
+# datetime parameters are stored in the format NOW() is rewritten to
+sqlite3.register_converter('TIMESTAMP', _convert_timestamp)
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(' ', 'seconds'))
+
+_READ_ONLY = re.compile(r'^\s*(?:SELECT|PRAGMA|EXPLAIN)\b', re.I)
+
+class SQLiteCursor:
+    """Cursor running MariaDB statements on a SQLite connection"""
+
+    def __init__(self, cursor, before_write):
+        self._cursor = cursor
+        self._before_write = before_write
+
+    def execute(self, query, params=None):
+        for statement, if_not_exists in translate(query):
+            if not _READ_ONLY.match(statement):
+                self._before_write()
+            try:
+                self._cursor.execute(statement, tuple(params or ()) if '?' in statement else ())
+            except sqlite3.OperationalError as e:
+                if not (if_not_exists and 'duplicate column' in str(e)):
+                    raise
+        return self._cursor.rowcount
+
+    def executemany(self, query, seq_of_params):
+        (statement, _), = translate(query)
+        self._before_write()
+        self._cursor.executemany(statement, [tuple(params) for params in seq_of_params])
+        return self._cursor.rowcount
+
+    def fetchone(self):
+        return self._cursor.fetchone()
+
+    def fetchall(self):
+        return self._cursor.fetchall()
+
+    def fetchmany(self, size=None):
+        return self._cursor.fetchmany(size or self._cursor.arraysize)
+
+    @property
+    def rowcount(self):
+        return self._cursor.rowcount
+
+    @property
+    def lastrowid(self):
+        return self._cursor.lastrowid
+
+    @property
+    def description(self):
+        return self._cursor.description
+
+    def close(self):
+        self._cursor.close()
+
+class _ThreadConnection:
+    """sqlite3 connection held by one thread, with its nesting depth"""
+
+    def __init__(self, connection):
+        self.connection = connection
+        self.depth = 0
+        self.writing = False
+
+class SQLiteConnection:
+    """PyMySQL-like handle on a thread's sqlite3 connection
+
+    A handle opened while the thread holds another one is nested: its
+    writes go into a savepoint, so its commit() and rollback() only end
+    its own work. Committing releases the savepoint into the caller's
+    transaction, or commits if the caller had none open.
+    """
+
+    def __init__(self, engine, state):
+        self._engine = engine
+        self._state = state
+        self._savepoint = f"nested_{state.depth}" if state.depth > 1 else None
+        self._in_savepoint = False
+
+    def cursor(self):
+        return SQLiteCursor(self._state.connection.cursor(), self._before_write)
+
+    def _before_write(self):
+        self._engine._begin_write(self._state)
+        if self._savepoint and not self._in_savepoint:
+            self._state.connection.execute(f"SAVEPOINT {self._savepoint}")
+            self._in_savepoint = True
+
+    def _end_savepoint(self, rollback):
+        if self._in_savepoint:
+            self._in_savepoint = False
+            if rollback:
+                self._state.connection.execute(f"ROLLBACK TO {self._savepoint}")
+            self._state.connection.execute(f"RELEASE {self._savepoint}")
+        if not self._state.connection.in_transaction:
+            self._engine._end_write(self._state)
+
+    def commit(self):
+        if self._savepoint:
+            self._end_savepoint(rollback=False)
+            return
+        self._state.connection.commit()
+        self._engine._end_write(self._state)
+
+    def rollback(self):
+        if self._savepoint:
+            self._end_savepoint(rollback=True)
+            return
+        self._state.connection.rollback()
+        self._engine._end_write(self._state)
+
+    def ping(self, reconnect=False):
+        pass
+
+    def close(self):
+        state = self._state
+        if state is None:
+            return
+        if self._savepoint:
+            self._end_savepoint(rollback=True)
+        self._state = None
+        self._engine._release(state)
+
+    def __del__(self):
+        # Handlers that raise before closing must not keep the database locked
+        self.close()
+
+def _open_sqlite(path):
+    connection = sqlite3.connect(path, timeout=30, detect_types=sqlite3.PARSE_DECLTYPES,
+                                 check_same_thread=False, cached_statements=SQLITE_STATEMENT_CACHE)
+    connection.execute('PRAGMA foreign_keys = ON')
+    return connection
+
+class SQLiteEngine(StorageEngine):
+    """SQLite database file in WAL mode
+
+    Readers never wait: WAL lets any number of connections read while
+    one writes. Writers take the engine's write lock at their first
+    write statement and hold it until commit or rollback, so the
+    process runs one write transaction at a time and queues the others
+    on the lock instead of SQLite's sleep-and-retry busy handler.
+    Commits only append to the WAL (synchronous=NORMAL); it is synced to
+    disk at checkpoints, once per batch of transactions.
+
+    Closed connections are kept open for reuse, up to SQLITE_CONNECTIONS,
+    so their prepared statements stay cached. A thread that connects
+    again while it holds a connection (helpers open their own) gets a
+    nested handle on the same one instead of waiting on its own
+    transaction (see SQLiteConnection); the outermost close() rolls back
+    uncommitted work.
+    """
+
+    name = 'sqlite'
+
+    def __init__(self, path=STORAGE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self._idle = []
+        self._idle_lock = threading.Lock()
+
+    def connect(self):
+        state = getattr(self._local, 'state', None)
+        if state is None or not state.depth:
+            state = self._local.state = _ThreadConnection(self._open())
+        state.depth += 1
+        return SQLiteConnection(self, state)
+
+    def _begin_write(self, state):
+        if not state.writing:
+            self._write_lock.acquire()
+            state.writing = True
+
+    def _end_write(self, state):
+        if state.writing:
+            state.writing = False
+            self._write_lock.release()
+
+    def _release(self, state):
+        state.depth -= 1
+        if not state.depth:
+            try:
+                state.connection.rollback()
+            finally:
+                self._end_write(state)
+            self._close(state.connection)
+
+    def _open(self):
+        with self._idle_lock:
+            if self._idle:
+                return self._idle.pop()
+        connection = _open_sqlite(self.path)
+        # The journal mode is stored in the database file; the rest is per connection
+        connection.execute('PRAGMA journal_mode = WAL')
+        connection.execute('PRAGMA synchronous = NORMAL')
+        return connection
+
+    def _close(self, connection):
+        with self._idle_lock:
+            if len(self._idle) < SQLITE_CONNECTIONS:
+                self._idle.append(connection)
+                return
+        connection.close()
+
+    def describe(self):
+        return f"sqlite ({self.path}, WAL)"
+
+    @contextlib.contextmanager
+    def migration_lock(self, connection, timeout):
+        try:
+            import fcntl
+        except ImportError:
+            # No flock (Windows); run one process at a time there
+            yield
+            return
+        with open(f"{self.path}.migrate-lock", 'a') as lock_file:
+            deadline = time.monotonic() + timeout
+            while True:
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    if time.monotonic() > deadline:
+                        raise RuntimeError(f"Another process held the migration lock for {timeout} s")
+                    time.sleep(0.1)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+class MemoryEngine(SQLiteEngine):
+    """SQLite database in memory, shared by every connection of the process
+
+    There is a single underlying connection, so one thread at a time
+    holds it: connect() waits until the previous thread has closed its
+    outermost handle. Every request, Socket.IO handlers included, is
+    serialized behind it and one slow request stalls the others, which
+    makes this engine for single-client demos and tests. Use the sqlite
+    engine for anything with concurrent users. (A shared-cache
+    ":memory:" database doesn't help: its table locks fail concurrent
+    writers with SQLITE_LOCKED instead of queueing them.)
+
+    screen_data is kept as a ring buffer of the last
+    MEMORY_SCREEN_DATA_LIMIT updates of each screen, so a long-running
+    instance doesn't grow without bound. Lookups by serial number and
+    owner go through the same indexes as on MariaDB.
+    """
+
+    name = 'memory'
+
+    def __init__(self):
+        super().__init__(':memory:')
+        self._connection = _open_sqlite(':memory:')
+        self._available = threading.Condition()
+        self._in_use = False
+
+    def _open(self):
+        with self._available:
+            while self._in_use:
+                self._available.wait()
+            self._in_use = True
+        return self._connection
+
+    def _close(self, connection):
+        with self._available:
+            self._in_use = False
+            self._available.notify()
+
+    def describe(self):
+        return self.name
+
+    migration_lock = StorageEngine.migration_lock
+
+    def finish_schema(self):
+        if not MEMORY_SCREEN_DATA_LIMIT:
+            return
+        connection = self.connect()
+        cursor = connection.cursor()
+        # The newest rows of a screen are found through screen_data_fk_screen_id
+        cursor.execute(f"""
+            CREATE TRIGGER IF NOT EXISTS screen_data_ring AFTER INSERT ON screen_data
+            BEGIN
+                DELETE FROM screen_data WHERE screen_id = NEW.screen_id AND id <= (
+                    SELECT id FROM screen_data WHERE screen_id = NEW.screen_id
+                    ORDER BY id DESC LIMIT 1 OFFSET {MEMORY_SCREEN_DATA_LIMIT}
+                );
+            END
+        """)
+        connection.commit()
+        cursor.close()
+        connection.close()
+
+def make_engine(name, mariadb_config=None, path=None):
+    """Build the storage engine called `name`"""
+    if name == 'mariadb':
+        return MariaDBEngine(mariadb_config or {})
+    if name == 'sqlite':
+        return SQLiteEngine(path or STORAGE_PATH)
+    if name == 'memory':
+        return MemoryEngine()
+    raise ValueError(f"Unknown storage engine {name!r} (expected one of {', '.join(STORAGE_ENGINES)})")
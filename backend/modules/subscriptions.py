@@ -0,0 +1,167 @@
+"""
+Realtime update subscriptions for LXCloud
+
+A Socket.IO connection can narrow the screen updates it receives to a
+set of screen ids (subscribe_screens) and/or a map bounding box
+(subscribe_bbox). Subscriptions are indexed by screen id and by a grid
+of SUBSCRIPTION_GRID_DEGREES cells, so routing an update costs
+O(interested connections) rather than O(all connections).
+"""
+import math
+import os
+import threading
+
+from modules.geo import normalize_bbox
+
+SUBSCRIPTION_GRID_DEGREES = float(os.environ.get('SUBSCRIPTION_GRID_DEGREES', 1.0))
+
+# Boxes covering more cells than this are checked against every update
+# instead of being put into the grid (a zoomed-out world map, say)
+SUBSCRIPTION_MAX_GRID_CELLS = 256
+
+# Screen ids a single connection may subscribe to
+SUBSCRIPTION_MAX_SCREENS = 1000
+
+_subscribers = {}  # sid -> {'user_id', 'is_admin', 'screen_ids', 'boxes', 'cells'}
+_by_screen = {}  # screen_id -> set of sids
+_by_cell = {}  # (row, column) -> set of sids
+_wide = set()  # sids whose box is too large for the grid
+_lock = threading.Lock()
+
+def _cell(latitude, longitude):
+    return (math.floor(latitude / SUBSCRIPTION_GRID_DEGREES),
+            math.floor(longitude / SUBSCRIPTION_GRID_DEGREES))
+
+def _box_cells(boxes):
+    cells = set()
+    for west, south, east, north in boxes:
+        first_row, first_column = _cell(south, west)
+        last_row, last_column = _cell(north, east)
+        if (last_row - first_row + 1) * (last_column - first_column + 1) + len(cells) > SUBSCRIPTION_MAX_GRID_CELLS:
+            return None
+        cells.update((row, column)
+                     for row in range(first_row, last_row + 1)
+                     for column in range(first_column, last_column + 1))
+    return cells
+
+def _clear_screens(sid, subscriber):
+    for screen_id in subscriber['screen_ids']:
+        sids = _by_screen.get(screen_id)
+        if sids:
+            sids.discard(sid)
+            if not sids:
+                del _by_screen[screen_id]
+    subscriber['screen_ids'] = set()
+
+def _clear_bbox(sid, subscriber):
+    for cell in subscriber['cells'] or ():
+        sids = _by_cell.get(cell)
+        if sids:
+            sids.discard(sid)
+            if not sids:
+                del _by_cell[cell]
+    _wide.discard(sid)
+    subscriber['boxes'] = None
+    subscriber['cells'] = None
+
+def _subscriber(sid, user_id, is_admin_user):
+    subscriber = _subscribers.get(sid)
+    if subscriber is None:
+        subscriber = _subscribers[sid] = {
+            'user_id': user_id,
+            'is_admin': is_admin_user,
+            'screen_ids': set(),
+            'boxes': None,
+            'cells': None
+        }
+    return subscriber
+
+def _drop_if_empty(sid, subscriber):
+    if not subscriber['screen_ids'] and subscriber['boxes'] is None:
+        del _subscribers[sid]
+        return False
+    return True
+
+def subscribe_screens(sid, user_id, is_admin_user, screen_ids):
+    """Replace the screen ids a connection is subscribed to
+
+    Returns whether the connection still has any subscription.
+    """
+    with _lock:
+        subscriber = _subscriber(sid, user_id, is_admin_user)
+        _clear_screens(sid, subscriber)
+        subscriber['screen_ids'] = set(list(screen_ids)[:SUBSCRIPTION_MAX_SCREENS])
+        for screen_id in subscriber['screen_ids']:
+            _by_screen.setdefault(screen_id, set()).add(sid)
+        return _drop_if_empty(sid, subscriber)
+
+def subscribe_bbox(sid, user_id, is_admin_user, bbox):
+    """Replace the bounding box a connection is subscribed to
+
+    bbox is (west, south, east, north), or None to clear it. Returns
+    whether the connection still has any subscription.
+    """
+    with _lock:
+        subscriber = _subscriber(sid, user_id, is_admin_user)
+        _clear_bbox(sid, subscriber)
+        if bbox is not None:
+            subscriber['boxes'] = normalize_bbox(*bbox)
+            subscriber['cells'] = _box_cells(subscriber['boxes'])
+            if subscriber['cells'] is None:
+                _wide.add(sid)
+            else:
+                for cell in subscriber['cells']:
+                    _by_cell.setdefault(cell, set()).add(sid)
+        return _drop_if_empty(sid, subscriber)
+
+def unsubscribe(sid):
+    """Drop every subscription of a connection"""
+    with _lock:
+        subscriber = _subscribers.pop(sid, None)
+        if subscriber:
+            _clear_screens(sid, subscriber)
+            _clear_bbox(sid, subscriber)
+
+def is_subscribed(sid):
+    """Check whether a connection has narrowed its updates"""
+    with _lock:
+        return sid in _subscribers
+
+def get_subscriber(sid):
+    """Get (user_id, is_admin) of a subscribed connection, or None"""
+    with _lock:
+        subscriber = _subscribers.get(sid)
+        if subscriber is None:
+            return None
+        return subscriber['user_id'], subscriber['is_admin']
+
+def set_subscriber_admin(sid, is_admin_user):
+    """Update the admin flag of a subscribed connection"""
+    with _lock:
+        subscriber = _subscribers.get(sid)
+        if subscriber:
+            subscriber['is_admin'] = is_admin_user
+
+def route_update(screen_id, owner_id, position):
+    """Get the subscribed connections interested in a screen update
+
+    position is (latitude, longitude) or None. Only connections of the
+    screen's owner or of admins are returned.
+    """
+    with _lock:
+        candidates = set(_by_screen.get(screen_id, ()))
+        if position is not None:
+            latitude, longitude = position
+            for sid in _by_cell.get(_cell(latitude, longitude), ()):
+                if sid not in candidates and _in_boxes(_subscribers[sid]['boxes'], latitude, longitude):
+                    candidates.add(sid)
+            for sid in _wide:
+                if sid not in candidates and _in_boxes(_subscribers[sid]['boxes'], latitude, longitude):
+                    candidates.add(sid)
+
+        return [sid for sid in candidates
+                if _subscribers[sid]['is_admin'] or _subscribers[sid]['user_id'] == owner_id]
+
+def _in_boxes(boxes, latitude, longitude):
+    return any(south <= latitude <= north and west <= longitude <= east
+               for west, south, east, north in boxes)
@@ -0,0 +1,89 @@
+"""
+Theme bundles for LXCloud
+
+The merged ui_settings are compiled once per settings version into a
+JSON bundle and a minified stylesheet of CSS variables (followed by the
+admin's custom CSS). Both are addressed by a reference holding the
+settings version and a hash of the content, so they can be served as
+immutable files: any change produces a new reference.
+"""
+import hashlib
+import json
+import re
+import threading
+
+# Settings exposed as CSS variables, named after the setting with dashes
+THEME_CSS_VARIABLES = (
+    'primary_color', 'secondary_color', 'header_color', 'header_text_color',
+    'button_color', 'button_hover_color', 'nav_color', 'nav_hover_color',
+    'footer_color', 'footer_text_color', 'font_family', 'font_size_base',
+    'font_size_heading', 'line_height', 'border_radius', 'spacing_unit',
+    'header_height', 'header_button_spacing'
+)
+
+# Settings holding CSS appended after the variables, in this order
+THEME_CUSTOM_CSS = ('custom_css', 'header_custom_css')
+
+_CSS_TOKENS = re.compile(r'"(?:\\.|[^"\\])*"|\'(?:\\.|[^\'\\])*\'|/\*.*?\*/|\s+', re.S)
+_CSS_PUNCTUATION = '{};,'
+
+_bundle = None  # (settings version, reference, json, css)
+_lock = threading.Lock()
+
+def minify_css(css):
+    """Drop comments and needless whitespace from a stylesheet
+
+    Quoted strings are kept as they are.
+    """
+    def replace(match):
+        token = match.group(0)
+        if token[0] in '"\'':
+            return token
+        if token.startswith('/*'):
+            return ''
+        before = css[match.start() - 1] if match.start() else '{'
+        after = css[match.end()] if match.end() < len(css) else '}'
+        if before in _CSS_PUNCTUATION or after in _CSS_PUNCTUATION:
+            return ''
+        return ' '
+
+    return _CSS_TOKENS.sub(replace, css).strip()
+
+def _css_value(value):
+    # A value may not end the declaration or the :root block early
+    return re.sub(r'[;{}<>]', '', str(value)).strip()
+
+def compile_theme_css(settings):
+    """Compile theme settings into a minified stylesheet"""
+    variables = []
+    for key in THEME_CSS_VARIABLES:
+        value = _css_value(settings.get(key) or '')
+        if value:
+            variables.append(f"--{key.replace('_', '-')}:{value}")
+
+    css = ':root{' + ';'.join(variables) + '}'
+    for key in THEME_CUSTOM_CSS:
+        if settings.get(key):
+            css += minify_css(settings[key])
+    return css
+
+def get_theme_bundle(version, settings):
+    """Get (reference, json, css) of the theme for a settings version
+
+    The bundle is compiled on the first request for a version only.
+    """
+    global _bundle
+
+    with _lock:
+        if _bundle and _bundle[0] == version:
+            return _bundle[1:]
+
+    payload = json.dumps({'settings': settings}, sort_keys=True, separators=(',', ':')).encode()
+    css = compile_theme_css(settings).encode()
+    # Hash both, so a new compiler on the same settings also gets a new reference
+    digest = hashlib.sha256(payload + b'\n' + css).hexdigest()[:12]
+    bundle = (version, f"{version}-{digest}", payload, css)
+
+    with _lock:
+        _bundle = bundle
+    return bundle[1:]
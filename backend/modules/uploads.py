@@ -0,0 +1,149 @@
+"""
+Streaming file uploads for LXCloud
+
+Flask parses multipart bodies on first access to request.files and keeps
+each file in memory up to 500KB before spooling it. receive_upload()
+parses the body itself and writes the file part to a temporary file on
+disk chunk by chunk, so concurrent uploads only cost a buffer each.
+While the file is written it is:
+
+- refused as soon as it grows past the size limit (or up front, when
+  the Content-Length already says so)
+- typed from its first bytes instead of the client's Content-Type, and
+  refused as soon as those show a type that isn't allowed
+- hashed, so callers get the content digest without reading it again
+"""
+import hashlib
+import os
+import tempfile
+
+# Directory for uploads in progress (default: the system temp directory)
+UPLOAD_TEMP_DIR = os.environ.get('UPLOAD_TEMP_DIR') or None
+
+# Bytes needed to tell the types apart; SVG may start with a long XML prolog
+SNIFF_BYTES = 4096
+
+# Allowance for the multipart boundaries and form fields around the file
+FORM_OVERHEAD = 64 * 1024
+
+# Limit of the parser's buffer, which holds the form fields and the chunk
+# being parsed (werkzeug reads 64KB at a time)
+FORM_MEMORY_LIMIT = 256 * 1024
+
+class UploadRejected(Exception):
+    """Upload refused while receiving it, with the HTTP status to answer"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.message = message
+        self.status_code = status_code
+
+def too_large(max_size):
+    return f'File too large (limit {max_size / (1024 * 1024):g}MB)'
+
+def sniff_mimetype(head):
+    """Guess the type of an image from its first bytes, or None"""
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'image/png'
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'image/jpeg'
+    if head[:6] in (b'GIF87a', b'GIF89a'):
+        return 'image/gif'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'image/webp'
+    text = head.lstrip(b'\xef\xbb\xbf \t\r\n')
+    if text.startswith((b'<?xml', b'<svg', b'<!--', b'<!DOCTYPE')) and b'<svg' in head:
+        return 'image/svg+xml'
+    return None
+
+class UploadedFile:
+    """Temporary file receiving one uploaded part, checked as it is written"""
+
+    def __init__(self, max_size, allowed_types):
+        self.max_size = max_size
+        self.allowed_types = allowed_types
+        self.size = 0
+        self.mimetype = None
+        self._head = b''
+        self._sha256 = hashlib.sha256()
+        self._file = tempfile.NamedTemporaryFile(prefix='upload-', dir=UPLOAD_TEMP_DIR, delete=False)
+        self.path = self._file.name
+
+    def _sniff(self):
+        self.mimetype = sniff_mimetype(self._head)
+        if self.mimetype not in self.allowed_types:
+            raise UploadRejected('Invalid file type', 415)
+
+    def write(self, data):
+        self.size += len(data)
+        if self.size > self.max_size:
+            raise UploadRejected(too_large(self.max_size), 413)
+        if self.mimetype is None:
+            self._head += data[:SNIFF_BYTES - len(self._head)]
+            if len(self._head) >= SNIFF_BYTES:
+                self._sniff()
+        self._sha256.update(data)
+        self._file.write(data)
+
+    def seek(self, offset, whence=0):
+        # Called by the parser once the part is complete
+        if self.mimetype is None:
+            self._sniff()
+        self._file.flush()
+        return self._file.seek(offset, whence)
+
+    @property
+    def digest(self):
+        """Hex SHA-256 of the content received"""
+        return self._sha256.hexdigest()
+
+    def close(self):
+        self._file.close()
+
+    def discard(self):
+        """Close and delete the temporary file"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+def receive_upload(environ, field, max_size, allowed_types):
+    """Stream the file in form field `field` of a multipart request to disk
+
+    Returns (form, UploadedFile); the caller owns the file and must
+    discard() it. Raises UploadRejected if the request has no such file,
+    or it is too large or of a type not in `allowed_types`.
+    """
+    from werkzeug.exceptions import RequestEntityTooLarge
+    from werkzeug.formparser import parse_form_data
+
+    content_length = environ.get('CONTENT_LENGTH')
+    if content_length and content_length.isdigit() and int(content_length) > max_size + FORM_OVERHEAD:
+        raise UploadRejected(too_large(max_size), 413)
+
+    received = []
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        if received:
+            raise UploadRejected('Only one file may be uploaded at a time')
+        received.append(UploadedFile(max_size, allowed_types))
+        return received[0]
+
+    try:
+        _, form, files = parse_form_data(environ, stream_factory=stream_factory,
+                                         max_form_memory_size=FORM_MEMORY_LIMIT)
+    except Exception as e:
+        for upload in received:
+            upload.discard()
+        if isinstance(e, RequestEntityTooLarge):
+            raise UploadRejected('Form fields too large', 413)
+        raise
+
+    upload = received[0] if received else None
+    if upload is None or field not in files or not files[field].filename:
+        if upload:
+            upload.discard()
+        raise UploadRejected('No file provided')
+    upload.close()
+    return form, upload
@@ -0,0 +1,29 @@
+"""
+Shared setup for the backend tests
+
+Run from the repository root with: python -m pytest backend/tests
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pytest
+
+@pytest.fixture(scope='session')
+def backend():
+    """The app module, set up once on a fresh in-memory database
+
+    app.py has one application per process, so tests share it and use
+    their own users and serial numbers.
+    """
+    import app as backend
+    from modules.storage import make_engine
+
+    backend.configure_app(make_engine('memory'))
+    backend.app.config['TESTING'] = True
+    return backend
+
+@pytest.fixture
+def client(backend):
+    return backend.app.test_client()
@@ -0,0 +1,77 @@
+"""Tests for signed controller requests"""
+import hashlib
+import hmac
+import json
+import time
+
+import pytest
+
+def register(client, serial_number):
+    response = client.post('/api/controller/register', json={'serial_number': serial_number})
+    assert response.status_code == 200
+    return response.get_json()
+
+def signed_update(client, serial_number, key, timestamp=None, body=None):
+    body = body or json.dumps({'serial_number': serial_number, 'latitude': 52.37, 'longitude': 4.9})
+    timestamp = str(int(time.time()) if timestamp is None else timestamp)
+    signature = hmac.new(key.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    return client.post('/api/device/update', data=body, content_type='application/json', headers={
+        'X-LXCloud-Timestamp': timestamp,
+        'X-LXCloud-Signature': signature
+    })
+
+def test_registration_returns_only_the_controller_secret(client):
+    registration = register(client, 'AUTH-NEW')
+    assert registration['registration_key']
+    assert 'expected_auth_key' not in registration
+
+def test_signed_update_is_accepted_once(client):
+    key = register(client, 'AUTH-SIGNED')['registration_key']
+    body = json.dumps({'serial_number': 'AUTH-SIGNED'})
+    timestamp = int(time.time())
+
+    assert signed_update(client, 'AUTH-SIGNED', key, timestamp, body).status_code == 200
+    replay = signed_update(client, 'AUTH-SIGNED', key, timestamp, body)
+    assert replay.status_code == 401
+    assert replay.get_json()['error'] == 'Replayed controller request'
+
+def test_wrong_key_and_old_timestamp_are_rejected(client, backend):
+    key = register(client, 'AUTH-BAD')['registration_key']
+
+    assert signed_update(client, 'AUTH-BAD', key + 'x').status_code == 401
+    old = int(time.time()) - backend.CONTROLLER_SIGNATURE_WINDOW - 10
+    response = signed_update(client, 'AUTH-BAD', key, timestamp=old)
+    assert response.status_code == 401
+    assert 'window' in response.get_json()['error']
+
+def test_unknown_serials_are_looked_up_once(client, backend, monkeypatch):
+    connections = []
+    connect = backend.get_db_connection
+    monkeypatch.setattr(backend, 'get_db_connection', lambda: connections.append(1) or connect())
+
+    for _ in range(3):
+        assert signed_update(client, 'AUTH-UNKNOWN', 'guess').status_code == 401
+    assert len(connections) == 1
+
+def test_rotated_key_replaces_the_old_one(client):
+    key = register(client, 'AUTH-ROTATE')['registration_key']
+    body = json.dumps({'serial_number': 'AUTH-ROTATE'})
+    timestamp = str(int(time.time()))
+    signature = hmac.new(key.encode(), f"{timestamp}.{body}".encode(), hashlib.sha256).hexdigest()
+    response = client.post('/api/controller/rotate-key', data=body, content_type='application/json', headers={
+        'X-LXCloud-Timestamp': timestamp,
+        'X-LXCloud-Signature': signature
+    })
+    assert response.status_code == 200
+    new_key = response.get_json()['registration_key']
+
+    assert signed_update(client, 'AUTH-ROTATE', new_key).status_code == 200
+    # The previous key stays valid for the rotation grace period
+    assert signed_update(client, 'AUTH-ROTATE', key).status_code == 200
+
+@pytest.mark.parametrize('required, status', [(False, 200), (True, 401)])
+def test_unsigned_updates_follow_the_setting(client, backend, monkeypatch, required, status):
+    register(client, 'AUTH-UNSIGNED')
+    monkeypatch.setattr(backend, 'CONTROLLER_AUTH_REQUIRED', required)
+    response = client.post('/api/device/update', json={'serial_number': 'AUTH-UNSIGNED'})
+    assert response.status_code == status
@@ -0,0 +1,36 @@
+"""Tests for the position handling of device updates"""
+import math
+
+import pytest
+
+@pytest.mark.parametrize('latitude, longitude', [
+    ('nan', '4.9'), ('52.3', 'inf'), (float('-inf'), 4.9), (91, 0), (0, -181), ('north', 4.9), (None, None)
+])
+def test_invalid_positions_are_rejected(backend, latitude, longitude):
+    assert backend.parse_position(latitude, longitude) is None
+
+def test_valid_position_is_parsed(backend):
+    latitude, longitude = backend.parse_position('52.3676', 4.9041)
+    assert math.isclose(latitude, 52.3676) and math.isclose(longitude, 4.9041)
+
+def test_stationary_online_device_needs_no_write(backend):
+    stored = (52.3676, 4.9041, True, 10)
+    assert backend.device_position_writes(stored, 52.367601, 4.9041, (52.367601, 4.9041)) == ([], [])
+
+def test_moved_device_writes_its_position_and_last_seen(backend):
+    stored = (52.3676, 4.9041, True, 10)
+    assignments, params = backend.device_position_writes(stored, 52.37, 4.9041, (52.37, 4.9041))
+    assert assignments == ['latitude = %s, longitude = %s',
+                           'online_status = TRUE, last_seen = CURRENT_TIMESTAMP']
+    assert params == [52.37, 4.9041]
+
+@pytest.mark.parametrize('online_status, seconds_since_seen, force', [
+    (False, 10, False), (True, None, False), (True, 60, False), (True, 10, True)
+])
+def test_heartbeat_is_written_when_due(backend, online_status, seconds_since_seen, force):
+    stored = (52.3676, 4.9041, online_status, seconds_since_seen)
+    assignments, params = backend.device_position_writes(
+        stored, 52.3676, 4.9041, (52.3676, 4.9041), force=force
+    )
+    assert assignments == ['online_status = TRUE, last_seen = CURRENT_TIMESTAMP']
+    assert params == []
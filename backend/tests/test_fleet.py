@@ -0,0 +1,55 @@
+"""Tests for the fleet change log behind delta syncs"""
+from collections import OrderedDict
+
+import pytest
+
+from modules import fleet
+from modules.fleet import ADMIN_SCOPE, get_changes_since, record_fleet_change
+
+@pytest.fixture(autouse=True)
+def empty_log(monkeypatch):
+    monkeypatch.setattr(fleet, '_sequence', 0)
+    monkeypatch.setattr(fleet, '_floor', 0)
+    monkeypatch.setattr(fleet, '_versions', {})
+    monkeypatch.setattr(fleet, '_changes', OrderedDict())
+    monkeypatch.setattr(fleet, '_payloads', {})
+    monkeypatch.setattr(fleet, '_listeners', [])
+
+def test_changes_since_a_version():
+    start = record_fleet_change('A', 1)
+    record_fleet_change('B', 1)
+    record_fleet_change('C')
+    record_fleet_change('A', 1)
+
+    assert sorted(get_changes_since(ADMIN_SCOPE, start)) == ['A', 'B', 'C']
+    assert sorted(get_changes_since(1, start)) == ['A', 'B']
+    assert get_changes_since(1, fleet.get_fleet_version(1)) == []
+
+def test_previous_owner_sees_a_screen_that_changed_hands():
+    since = record_fleet_change('A', 1)
+    record_fleet_change('A', 1, 2)
+    record_fleet_change('A', 2)
+
+    assert get_changes_since(1, since) == ['A']
+    assert get_changes_since(3, since) == []
+
+def test_unknown_versions_need_a_full_reload(monkeypatch):
+    monkeypatch.setattr(fleet, 'FLEET_CHANGE_LOG_SIZE', 2)
+    first = record_fleet_change('A')
+    for serial_number in 'BCD':
+        record_fleet_change(serial_number)
+
+    assert get_changes_since(ADMIN_SCOPE, first) is None
+    assert get_changes_since(ADMIN_SCOPE, 99) is None
+    assert get_changes_since(ADMIN_SCOPE, fleet.get_fleet_version(ADMIN_SCOPE) - 1) == ['D']
+
+def test_unknown_serial_resets_the_log():
+    since = record_fleet_change('A')
+    record_fleet_change(None)
+    assert get_changes_since(ADMIN_SCOPE, since) is None
+
+def test_version_tokens_are_tied_to_this_process():
+    token = fleet.make_version_token(7)
+    assert fleet.parse_version_token(token) == 7
+    assert fleet.parse_version_token('other.7') is None
+    assert fleet.parse_version_token(None) is None
@@ -0,0 +1,17 @@
+"""Tests for modules.geo"""
+from modules.geo import normalize_bbox
+
+def test_box_inside_the_world_is_kept():
+    assert normalize_bbox(4.0, 52.0, 5.0, 53.0) == [(4.0, 52.0, 5.0, 53.0)]
+
+def test_box_across_the_antimeridian_is_split():
+    assert normalize_bbox(170.0, -10.0, 190.0, 10.0) == [
+        (170.0, -10.0, 180.0, 10.0),
+        (-180.0, -10.0, -170.0, 10.0),
+    ]
+
+def test_panned_box_is_wrapped():
+    assert normalize_bbox(356.0, 52.0, 357.0, 53.0) == [(-4.0, 52.0, -3.0, 53.0)]
+
+def test_box_wider_than_the_world_and_beyond_the_poles_is_clamped():
+    assert normalize_bbox(-300.0, -100.0, 300.0, 100.0) == [(-180.0, -90.0, 180.0, 90.0)]
@@ -0,0 +1,50 @@
+"""Tests for modules.images"""
+import hashlib
+
+import pytest
+from PIL import Image
+
+from modules import images
+
+@pytest.fixture(autouse=True)
+def upload_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, 'UPLOAD_DIR', str(tmp_path))
+    monkeypatch.setattr(images, '_manifests', {})
+    return tmp_path
+
+def write_animation(path, size, durations):
+    frames = [Image.new('RGB', size, color) for color in ('red', 'green', 'blue')[:len(durations)]]
+    frames[0].save(path, 'GIF', save_all=True, append_images=frames[1:], duration=durations, loop=0)
+    return hashlib.sha256(path.read_bytes()).hexdigest()
+
+def test_animated_gifs_are_scaled_frame_by_frame(tmp_path, upload_dir):
+    source = tmp_path / 'source.gif'
+    digest = write_animation(source, (800, 800), [50, 120, 200])
+
+    name, manifest, pending = images.store_upload(str(source), digest, 'logo', 'image/gif')
+    assert pending
+    assert (manifest['width'], manifest['height']) == (120, 120)
+
+    manifest = images.build_variants(name, str(source))
+    sizes = {(variant['format'], variant['dpr']): (variant['width'], variant['height'])
+             for variant in manifest['variants']}
+    assert sizes[('gif', 1)] == (120, 120) and sizes[('gif', 2)] == (240, 240)
+
+    for variant in manifest['variants']:
+        with Image.open(upload_dir / variant['file']) as output:
+            assert output.size == (variant['width'], variant['height'])
+            assert output.n_frames == 3
+            durations = []
+            for frame in range(output.n_frames):
+                output.seek(frame)
+                output.load()  # WebP frames report their duration once loaded
+                durations.append(output.info['duration'])
+            assert durations == [50, 120, 200]
+
+def test_animations_decoding_to_too_many_pixels_are_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(images, 'UI_ASSET_MAX_PIXELS', 100 * 100 * 2)
+    source = tmp_path / 'source.gif'
+    digest = write_animation(source, (100, 100), [50, 50, 50])
+
+    with pytest.raises(images.InvalidImage):
+        images.store_upload(str(source), digest, 'logo', 'image/gif')
@@ -0,0 +1,140 @@
+"""Tests for modules.migrations"""
+import pymysql
+import pytest
+
+from modules import migrations
+from modules.migrations import OnlineAlter, run_migrations
+from modules.storage import make_engine
+
+ALTERATION = "ADD INDEX IF NOT EXISTS idx_screen_time (screen_id, year, timestamp)"
+
+class MariaDB:
+    name = 'mariadb'
+
+class RecordingCursor:
+    """Cursor answering the information_schema queries of OnlineAlter"""
+
+    def __init__(self, inplace=True, progress=None, shadow_exists=True, fail_on=None):
+        self.statements = []
+        self.inplace = inplace
+        self.progress = progress
+        self.shadow_exists = shadow_exists
+        self.fail_on = fail_on or {}
+        self._rows = []
+
+    def execute(self, query, params=None):
+        query = ' '.join(query.split())
+        self.statements.append(query)
+        self._rows = []
+        for prefix, error in self.fail_on.items():
+            if query.startswith(prefix):
+                raise error
+        if 'ALGORITHM=INPLACE' in query and not self.inplace:
+            raise pymysql.err.InternalError(1846, 'LOCK=NONE is not supported')
+        if query.startswith('SELECT last_id'):
+            self._rows = [self.progress] if self.progress else []
+        elif query.startswith('REPLACE INTO schema_migration_progress'):
+            self.progress = (0, params[2])
+        elif query.startswith('UPDATE schema_migration_progress'):
+            self.progress = (params[0], self.progress[1])
+        elif 'REFERENCED_TABLE_NAME = %s' in query:
+            self._rows = [(0,)]
+        elif 'information_schema.COLUMNS' in query:
+            self._rows = [('id',), ('screen_id',), ('timestamp',), ('year',)]
+        elif 'information_schema.TABLES' in query:
+            self._rows = [(1 if self.shadow_exists else 0,)]
+        elif 'MAX(id)' in query:
+            self._rows = [(10,)]
+
+    def fetchone(self):
+        return self._rows[0] if self._rows else None
+
+    def fetchall(self):
+        return self._rows
+
+    def index(self, prefix):
+        return next(i for i, statement in enumerate(self.statements) if statement.startswith(prefix))
+
+class Connection:
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+@pytest.fixture(autouse=True)
+def no_pause(monkeypatch):
+    monkeypatch.setattr(migrations, 'ONLINE_MIGRATION_PAUSE', 0)
+    monkeypatch.setattr(migrations, 'ONLINE_MIGRATION_CHUNK_SIZE', 4)
+
+def test_restart_drops_leftovers_of_a_failed_copy():
+    cursor = RecordingCursor()
+    OnlineAlter('screen_data', ALTERATION).run(MariaDB(), Connection(), cursor)
+
+    alter = cursor.index('ALTER TABLE screen_data ADD INDEX')
+    for trigger in ('insert', 'update', 'delete'):
+        assert cursor.index(f'DROP TRIGGER IF EXISTS screen_data_online_{trigger}') < alter
+    assert cursor.index('DROP TABLE IF EXISTS _screen_data_new') < alter
+    assert cursor.index('DELETE FROM schema_migration_progress') < alter
+
+def test_copy_swaps_and_cleans_up():
+    cursor = RecordingCursor(inplace=False)
+    OnlineAlter('screen_data', ALTERATION).run(MariaDB(), Connection(), cursor)
+
+    copies = [s for s in cursor.statements if s.startswith('INSERT IGNORE INTO _screen_data_new')]
+    assert len(copies) == 3
+    rename = cursor.index('RENAME TABLE screen_data TO _screen_data_old, _screen_data_new TO screen_data')
+    assert cursor.statements.index('DROP TRIGGER IF EXISTS screen_data_online_insert', rename) > rename
+    assert cursor.statements[-1].startswith('DELETE FROM schema_migration_progress')
+
+def test_resume_continues_from_recorded_progress():
+    cursor = RecordingCursor(inplace=False, progress=(8, 10))
+    OnlineAlter('screen_data', ALTERATION).run(MariaDB(), Connection(), cursor)
+
+    assert not any(s.startswith('DROP TABLE IF EXISTS _screen_data_new') for s in cursor.statements)
+    copies = [s for s in cursor.statements if s.startswith('INSERT IGNORE INTO _screen_data_new')]
+    assert len(copies) == 1
+
+def test_restart_after_swap_only_cleans_up():
+    cursor = RecordingCursor(inplace=False, progress=(10, 10), shadow_exists=False)
+    OnlineAlter('screen_data', ALTERATION).run(MariaDB(), Connection(), cursor)
+
+    assert not any(s.startswith(('INSERT IGNORE', 'RENAME TABLE')) for s in cursor.statements)
+    assert 'DROP TABLE IF EXISTS _screen_data_old' in cursor.statements
+    assert cursor.statements[-1].startswith('DELETE FROM schema_migration_progress')
+
+def test_denied_trigger_drops_the_copy_and_names_the_privilege():
+    denied = pymysql.err.OperationalError(1419, 'You do not have the SUPER privilege and binary logging is enabled')
+    cursor = RecordingCursor(inplace=False, fail_on={'CREATE TRIGGER screen_data_online_update': denied})
+
+    with pytest.raises(RuntimeError, match='log_bin_trust_function_creators'):
+        OnlineAlter('screen_data', ALTERATION).run(MariaDB(), Connection(), cursor)
+
+    failed = cursor.index('CREATE TRIGGER screen_data_online_update')
+    assert cursor.statements.index('DROP TRIGGER IF EXISTS screen_data_online_insert', failed) > failed
+    assert cursor.statements.index('DROP TABLE IF EXISTS _screen_data_new', failed) > failed
+
+def test_online_alter_runs_directly_on_sqlite(tmp_path):
+    engine = make_engine('sqlite', path=str(tmp_path / 'lxcloud.db'))
+
+    def create(cursor):
+        cursor.execute("""
+            CREATE TABLE IF NOT EXISTS screen_data (
+                id INT AUTO_INCREMENT PRIMARY KEY,
+                screen_id INT NOT NULL,
+                year INT NOT NULL,
+                timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+            )
+        """)
+
+    steps = [
+        (1, 'Create screen_data', create),
+        (2, 'Index screen_data', OnlineAlter('screen_data', ALTERATION)),
+    ]
+    assert run_migrations(engine, engine.connect, steps) == 2
+
+    conn = engine.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'screen_data'")
+    assert ('screen_data_idx_screen_time',) in cursor.fetchall()
+    conn.close()
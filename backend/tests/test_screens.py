@@ -0,0 +1,58 @@
+"""Tests for the screen list endpoint"""
+import pytest
+
+@pytest.fixture
+def admin(backend, monkeypatch):
+    """A client logged in as an administrator"""
+    monkeypatch.setattr(backend, 'NEW_USERS_ADMINISTRATORS', True)
+    client = backend.app.test_client()
+    response = client.post('/api/register', json={
+        'username': 'delta_admin', 'email': 'delta_admin@example.com', 'password': 'secret123'
+    })
+    if response.status_code != 201:
+        client.post('/api/login', json={'username': 'delta_admin', 'password': 'secret123'})
+    return client
+
+def test_delta_sync_returns_changed_and_removed_entries(admin):
+    version = admin.get('/api/screens').get_json()['version']
+    admin.post('/api/controller/register', json={'serial_number': 'DELTA-1'})
+    admin.post('/api/controller/register', json={'serial_number': 'DELTA-2'})
+    admin.post('/api/screens', json={'serial_number': 'DELTA-2'})
+
+    delta = admin.get(f'/api/screens?since={version}').get_json()
+    assert delta['delta'] is True
+    assert [c['serial_number'] for c in delta['unassigned_controllers']] == ['DELTA-1']
+    assert [s['serial_number'] for s in delta['screens']] == ['DELTA-2']
+    assert delta['removed'] == []
+
+    unchanged = admin.get(f"/api/screens?since={delta['version']}").get_json()
+    assert unchanged['screens'] == [] and unchanged['unassigned_controllers'] == []
+
+    admin.delete(f"/api/screens/{delta['screens'][0]['id']}")
+    removed = admin.get(f"/api/screens?since={unchanged['version']}").get_json()
+    assert removed['removed'] == ['DELTA-2']
+    assert removed['screens'] == []
+
+def test_large_or_unknown_deltas_return_the_full_list(admin, backend, monkeypatch):
+    monkeypatch.setattr(backend, 'SCREEN_DELTA_MAX_CHANGES', 2)
+    version = admin.get('/api/screens').get_json()['version']
+    for number in range(3):
+        admin.post('/api/controller/register', json={'serial_number': f'DELTA-MANY-{number}'})
+
+    full = admin.get(f'/api/screens?since={version}').get_json()
+    assert 'delta' not in full
+    serials = {c['serial_number'] for c in full['unassigned_controllers']}
+    assert {'DELTA-MANY-0', 'DELTA-MANY-1', 'DELTA-MANY-2'} <= serials
+
+    assert 'delta' not in admin.get('/api/screens?since=other-process.1').get_json()
+
+def test_unchanged_list_is_answered_with_304(admin):
+    response = admin.get('/api/screens')
+    again = admin.get('/api/screens', headers={'If-None-Match': response.headers['ETag']})
+    assert again.status_code == 304
+    assert again.headers['ETag'] == response.headers['ETag']
+
+    admin.post('/api/controller/register', json={'serial_number': 'ETAG-1'})
+    changed = admin.get('/api/screens', headers={'If-None-Match': response.headers['ETag']})
+    assert changed.status_code == 200
+    assert changed.headers['ETag'] != response.headers['ETag']
@@ -0,0 +1,15 @@
+"""Tests for the settings responses"""
+
+def test_etag_changes_with_the_payload_of_a_version(backend):
+    with backend.app.test_request_context():
+        first = backend.settings_response('ui_settings', (3, {}, '{"settings": {"a": 1}}'))
+        second = backend.settings_response('ui_settings', (3, {}, '{"settings": {"a": 2}}'))
+    assert first.headers['ETag'] != second.headers['ETag']
+    assert first.headers['ETag'].startswith('"ui_settings-3-')
+
+def test_current_etag_is_answered_with_304(backend):
+    entry = (3, {}, '{"settings": {}}')
+    with backend.app.test_request_context():
+        etag = backend.settings_response('ui_settings', entry).headers['ETag']
+    with backend.app.test_request_context(headers={'If-None-Match': etag}):
+        assert backend.settings_response('ui_settings', entry).status_code == 304
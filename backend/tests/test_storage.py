@@ -0,0 +1,123 @@
+"""Tests for modules.storage"""
+import pytest
+
+from modules.storage import make_engine, translate
+
+def statements(query):
+    return [statement for statement, _ in translate(query)]
+
+def test_placeholders_and_literal_percent():
+    assert statements("SELECT id FROM users WHERE name LIKE '%%x' AND id = %s") == [
+        "SELECT id FROM users WHERE name LIKE '%x' AND id = ?"
+    ]
+
+def test_insert_ignore():
+    assert statements("INSERT IGNORE INTO settings_versions (scope) VALUES (%s)") == [
+        "INSERT OR IGNORE INTO settings_versions (scope) VALUES (?)"
+    ]
+
+def test_on_duplicate_key_update_becomes_upsert():
+    (statement,) = statements(
+        "INSERT INTO ui_settings (setting_key, setting_value) VALUES (%s, %s) "
+        "ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)"
+    )
+    assert statement.endswith("ON CONFLICT DO UPDATE SET setting_value = excluded.setting_value")
+
+def test_functions():
+    (statement,) = statements(
+        "SELECT GREATEST(0, %s - TIMESTAMPDIFF(SECOND, key_rotated_at, NOW())), LEAST(a, b) FROM controllers"
+    )
+    assert 'GREATEST' not in statement and 'LEAST' not in statement
+    assert "julianday((datetime('now', 'localtime'))) - julianday(key_rotated_at)" in statement
+    assert 'MIN(a, b)' in statement
+
+def test_create_table_moves_indexes_out_and_indexes_foreign_keys():
+    result = statements("""
+        CREATE TABLE IF NOT EXISTS screen_alerts (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            screen_id INT NOT NULL,
+            alert_type ENUM('geofence_exit', 'geofence_return') NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+            INDEX idx_screen_alerts_screen (screen_id, created_at),
+            FOREIGN KEY (screen_id) REFERENCES screens(id) ON DELETE CASCADE
+        )
+    """)
+    create, *indexes = result
+    assert 'INTEGER PRIMARY KEY AUTOINCREMENT' in create
+    assert 'ENUM' not in create and 'INDEX' not in create and 'ON UPDATE' not in create
+    assert indexes == [
+        "CREATE INDEX IF NOT EXISTS screen_alerts_idx_screen_alerts_screen ON screen_alerts (screen_id, created_at)",
+        "CREATE INDEX IF NOT EXISTS screen_alerts_fk_screen_id ON screen_alerts (screen_id)",
+    ]
+
+def test_alter_table_splits_columns_and_indexes():
+    assert translate("""
+        ALTER TABLE controllers
+        ADD COLUMN IF NOT EXISTS previous_registration_key VARCHAR(255) NULL,
+        ADD COLUMN key_rotated_at TIMESTAMP NULL DEFAULT NULL,
+        ADD INDEX IF NOT EXISTS idx_seen (last_seen, id)
+    """) == (
+        ("ALTER TABLE controllers ADD COLUMN previous_registration_key VARCHAR(255) NULL", True),
+        ("ALTER TABLE controllers ADD COLUMN key_rotated_at TIMESTAMP NULL DEFAULT NULL", False),
+        ("CREATE INDEX IF NOT EXISTS controllers_idx_seen ON controllers (last_seen, id)", False),
+    )
+
+def test_translated_statements_run_on_sqlite():
+    engine = make_engine('memory')
+    conn = engine.connect()
+    cursor = conn.cursor()
+    cursor.execute("""
+        CREATE TABLE settings (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            setting_key VARCHAR(64) NOT NULL,
+            setting_value TEXT,
+            UNIQUE KEY uniq_key (setting_key)
+        )
+    """)
+    for value in ('light', 'dark'):
+        cursor.execute(
+            "INSERT INTO settings (setting_key, setting_value) VALUES (%s, %s) "
+            "ON DUPLICATE KEY UPDATE setting_value = VALUES(setting_value)",
+            ('theme', value)
+        )
+    # Adding a column twice is ignored, as with IF NOT EXISTS on MariaDB
+    for _ in range(2):
+        cursor.execute("ALTER TABLE settings ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP NULL")
+    cursor.execute("SELECT setting_key, setting_value FROM settings")
+    assert cursor.fetchall() == [('theme', 'dark')]
+    conn.close()
+
+@pytest.mark.parametrize('engine_name', ['memory', 'sqlite'])
+def test_nested_handles_only_end_their_own_work(engine_name, tmp_path):
+    engine = make_engine(engine_name, path=str(tmp_path / 'lxcloud.db'))
+    outer = engine.connect()
+    cursor = outer.cursor()
+    cursor.execute("CREATE TABLE log (id INT AUTO_INCREMENT PRIMARY KEY, entry TEXT)")
+    outer.commit()
+
+    cursor.execute("INSERT INTO log (entry) VALUES (%s)", ('outer',))
+    inner = engine.connect()
+    inner.cursor().execute("INSERT INTO log (entry) VALUES (%s)", ('inner',))
+    inner.commit()
+    inner.cursor().execute("INSERT INTO log (entry) VALUES (%s)", ('discarded',))
+    inner.rollback()
+    inner.close()
+    assert engine._write_lock.locked()
+
+    outer.rollback()
+    assert not engine._write_lock.locked()
+    cursor.execute("SELECT entry FROM log")
+    assert cursor.fetchall() == []
+
+    # Without a transaction of the caller's, a nested commit is final
+    inner = engine.connect()
+    inner.cursor().execute("INSERT INTO log (entry) VALUES (%s)", ('inner',))
+    inner.commit()
+    inner.close()
+    outer.close()
+
+    conn = engine.connect()
+    cursor = conn.cursor()
+    cursor.execute("SELECT entry FROM log")
+    assert cursor.fetchall() == [('inner',)]
+    conn.close()
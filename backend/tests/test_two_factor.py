@@ -0,0 +1,43 @@
+"""Tests for the 2FA QR code cache and the lazy 2FA imports"""
+import os
+import subprocess
+import sys
+
+import pytest
+
+@pytest.fixture
+def qr_cache(backend, monkeypatch):
+    monkeypatch.setattr(backend, '_qr_code_cache', {})
+    return backend._qr_code_cache
+
+def test_2fa_dependencies_are_not_imported_with_the_app():
+    code = "import sys, app; print(sorted(m for m in ('qrcode', 'pyotp', 'PIL') if m in sys.modules))"
+    result = subprocess.run(
+        [sys.executable, '-c', code], capture_output=True, text=True, check=True,
+        cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    )
+    assert result.stdout.strip().splitlines()[-1] == '[]'
+
+@pytest.mark.parametrize('image_format, mime_type', [('png', 'image/png'), ('svg', 'image/svg+xml')])
+def test_rendered_qr_codes_are_reused(backend, qr_cache, monkeypatch, image_format, mime_type):
+    uri = 'otpauth://totp/LXCloud:qr?secret=JBSWY3DPEHPK3PXP'
+    data_uri = backend.render_qr_code(uri, image_format)
+    assert data_uri.startswith(f'data:{mime_type};base64,')
+
+    import qrcode
+    monkeypatch.setattr(qrcode, 'QRCode', None)  # a second rendering would fail
+    assert backend.render_qr_code(uri, image_format) == data_uri
+
+def test_expired_and_excess_entries_are_dropped(backend, qr_cache, monkeypatch):
+    monkeypatch.setattr(backend, 'QR_CODE_CACHE_MAX_ENTRIES', 2)
+    now = [1000.0]
+    monkeypatch.setattr(backend.time, 'monotonic', lambda: now[0])
+
+    backend.render_qr_code('first', 'svg')
+    backend.render_qr_code('second', 'svg')
+    backend.render_qr_code('third', 'svg')
+    assert list(qr_cache) == [('second', 'svg'), ('third', 'svg')]
+
+    now[0] += backend.QR_CODE_CACHE_TTL
+    backend.render_qr_code('fourth', 'svg')
+    assert list(qr_cache) == [('fourth', 'svg')]
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Cross-worker latency benchmark for the LXCloud message bus
+
+Starts two Socket.IO servers sharing a message queue, the way two
+workers do, publishes screen updates from one and measures how long
+each takes to reach the other. Without --url a built-in relay is
+started locally; pass e.g. --url redis://localhost:6379/0 to measure a
+real broker instead.
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+import socketio  # noqa: E402
+
+from modules.bus import make_client_manager, on_bus_event, serve_relay, start_listening  # noqa: E402
+
+def make_worker(url, channel):
+    """Build a Socket.IO server listening on the shared queue"""
+    manager = make_client_manager(url, channel=channel, install=False)
+    server = socketio.Server(client_manager=manager, async_mode='threading')
+    start_listening(server)
+    return manager
+
+def benchmark(url, messages, rate):
+    channel = f'lxcloud-bench-{os.getpid()}'
+    latencies = []
+    done = threading.Event()
+
+    @on_bus_event('bench_update')
+    def receive(data):
+        latencies.append(time.perf_counter() - data['sent'])
+        if len(latencies) >= messages:
+            done.set()
+
+    sender = make_worker(url, channel)
+    make_worker(url, channel)
+    # Give the listeners time to subscribe before publishing
+    time.sleep(1)
+
+    interval = 1 / rate if rate else 0
+    started = time.perf_counter()
+    next_send = started
+    for i in range(messages):
+        sender.publish('bench_update', {
+            'sent': time.perf_counter(),
+            'screen_id': i,
+            'update': {'serial_number': f'BENCH{i:06d}', 'latitude': 52.0, 'longitude': 5.0,
+                       'online_status': True, 'information': None}
+        })
+        if interval:
+            next_send += interval
+            time.sleep(max(0, next_send - time.perf_counter()))
+    published = time.perf_counter() - started
+
+    done.wait(timeout=30)
+    latencies.sort()
+    print(f"Bus events: {messages} published in {published:.2f} s "
+          f"({messages / published:,.0f}/s), {len(latencies)} received")
+    if latencies:
+        print(f"  latency p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms, "
+              f"max {latencies[-1] * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', help='message queue URL (default: a local built-in relay)')
+    parser.add_argument('--messages', type=int, default=10000, help='updates to publish')
+    parser.add_argument('--rate', type=int, default=5000, help='updates per second (0 for as fast as possible)')
+    args = parser.parse_args()
+
+    url = args.url
+    if not url:
+        relay = serve_relay('127.0.0.1', 0)
+        url = f'relay://127.0.0.1:{relay.server_address[1]}'
+        print(f"Started built-in relay on {url}")
+
+    benchmark(url, args.messages, args.rate)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""
+Connection scaling benchmark for the LXCloud Socket.IO server
+
+Logs in, then opens idle dashboard websockets against a running server
+in steps and reports the server's memory and thread count per step, read
+from /proc for the given --pid. Compare ASYNC_MODE=threading with
+eventlet or gevent by running the server in each mode.
+
+    ASYNC_MODE=eventlet python backend/app.py &
+    python benchmark_connections.py --pid $! --username admin --password ...
+"""
+
+import argparse
+import base64
+import http.cookiejar
+import json
+import os
+import resource
+import selectors
+import socket
+import struct
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+def login(server, username, password):
+    """Log in and return the session cookie header"""
+    jar = http.cookiejar.CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    request = urllib.request.Request(
+        f"{server}/api/login",
+        data=json.dumps({'username': username, 'password': password}).encode(),
+        headers={'Content-Type': 'application/json'}
+    )
+    opener.open(request, timeout=10)
+    return '; '.join(f"{cookie.name}={cookie.value}" for cookie in jar)
+
+def send_text(connection, text):
+    """Send a masked websocket text frame"""
+    payload = text.encode()
+    mask = os.urandom(4)
+    header = bytes([0x81])
+    if len(payload) < 126:
+        header += bytes([0x80 | len(payload)])
+    else:
+        header += bytes([0x80 | 126]) + struct.pack('!H', len(payload))
+    masked = bytes(byte ^ mask[i % 4] for i, byte in enumerate(payload))
+    connection.sendall(header + mask + masked)
+
+def read_frames(buffer):
+    """Split complete unmasked frames off a buffer, returning (texts, rest)"""
+    texts = []
+    while len(buffer) >= 2:
+        length = buffer[1] & 0x7f
+        offset = 2
+        if length == 126:
+            if len(buffer) < 4:
+                break
+            length, offset = struct.unpack('!H', buffer[2:4])[0], 4
+        elif length == 127:
+            if len(buffer) < 10:
+                break
+            length, offset = struct.unpack('!Q', buffer[2:10])[0], 10
+        if len(buffer) < offset + length:
+            break
+        if buffer[0] & 0x0f == 1:
+            texts.append(buffer[offset:offset + length].decode())
+        buffer = buffer[offset + length:]
+    return texts, buffer
+
+def open_socket(host, port, cookie):
+    """Open a websocket and join Socket.IO, returning the connected socket"""
+    connection = socket.create_connection((host, port), timeout=10)
+    key = base64.b64encode(os.urandom(16)).decode()
+    connection.sendall((
+        "GET /socket.io/?EIO=4&transport=websocket HTTP/1.1\r\n"
+        f"Host: {host}:{port}\r\n"
+        "Upgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n"
+        f"Cookie: {cookie}\r\n\r\n"
+    ).encode())
+
+    response = b''
+    while b'\r\n\r\n' not in response:
+        chunk = connection.recv(4096)
+        if not chunk:
+            raise ConnectionError('connection closed during handshake')
+        response += chunk
+    head, _, buffer = response.partition(b'\r\n\r\n')
+    if b' 101 ' not in head.split(b'\r\n', 1)[0]:
+        raise ConnectionError(head.split(b'\r\n', 1)[0].decode())
+
+    # Wait for the engine.io open packet before joining, like browsers do
+    while True:
+        texts, buffer = read_frames(buffer)
+        for text in texts:
+            if text.startswith('0'):
+                send_text(connection, '40')
+            elif text.startswith('40'):
+                connection.setblocking(False)
+                return connection
+            elif text.startswith('44'):
+                raise ConnectionError(f'Socket.IO connection refused: {text[2:]}')
+        chunk = connection.recv(4096)
+        if not chunk:
+            raise ConnectionError('connection closed before Socket.IO connect')
+        buffer += chunk
+
+def keep_alive(selector):
+    """Answer engine.io pings on every open socket
+
+    Sockets are registered from the main thread while this one selects,
+    which epoll allows.
+    """
+    buffers = {}
+    while True:
+        for key, _ in selector.select(timeout=0.5):
+            connection = key.fileobj
+            try:
+                chunk = connection.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                chunk = b''
+            if not chunk:
+                selector.unregister(connection)
+                connection.close()
+                continue
+            texts, buffers[connection] = read_frames(buffers.get(connection, b'') + chunk)
+            for text in texts:
+                if text == '2':
+                    connection.setblocking(True)
+                    send_text(connection, '3')
+                    connection.setblocking(False)
+
+def process_stats(pid):
+    """Get (resident memory in KiB, thread count) of a process"""
+    stats = {}
+    with open(f'/proc/{pid}/status') as status:
+        for line in status:
+            name, _, value = line.partition(':')
+            stats[name] = value.split()[0] if value.split() else ''
+    return int(stats['VmRSS']), int(stats['Threads'])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', default='http://localhost:5000', help='server URL')
+    parser.add_argument('--username', help='account to log in with')
+    parser.add_argument('--password', help='password of the account')
+    parser.add_argument('--cookie', help='session cookie header to use instead of logging in')
+    parser.add_argument('--pid', type=int, help='server process id, to report its memory and threads')
+    parser.add_argument('--connections', type=int, default=2000, help='idle websockets to open')
+    parser.add_argument('--step', type=int, default=500, help='websockets opened between measurements')
+    parser.add_argument('--settle', type=float, default=2, help='seconds to wait before each measurement')
+    args = parser.parse_args()
+
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    if args.connections + 64 > hard:
+        parser.error(f'--connections exceeds the open file limit ({hard})')
+
+    cookie = args.cookie or login(args.server, args.username, args.password)
+    url = urllib.parse.urlparse(args.server)
+    host, port = url.hostname, url.port or 80
+
+    selector = selectors.EpollSelector()
+    threading.Thread(target=keep_alive, args=(selector,), daemon=True).start()
+
+    baseline = process_stats(args.pid) if args.pid else None
+    if baseline:
+        print(f"Idle server: {baseline[0] / 1024:.1f} MiB, {baseline[1]} threads")
+
+    opened = 0
+    started = time.perf_counter()
+    while opened < args.connections:
+        for _ in range(min(args.step, args.connections - opened)):
+            selector.register(open_socket(host, port, cookie), selectors.EVENT_READ)
+            opened += 1
+        elapsed = time.perf_counter() - started
+        time.sleep(args.settle)
+
+        line = f"{opened} sockets (opened in {elapsed:.1f} s)"
+        if baseline:
+            memory, threads = process_stats(args.pid)
+            line += (f": {memory / 1024:.1f} MiB, {threads} threads, "
+                     f"{(memory - baseline[0]) / opened:.1f} KiB and "
+                     f"{(threads - baseline[1]) / opened:.2f} threads per socket")
+        print(line)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Ingest benchmark for LXCloud device updates
+
+Without arguments, measures the geofence check done for every device
+update in-process. With --server, drives /api/device/update on a running
+server at a target rate and reports the achieved rate and latencies.
+A share of the updates report positions far from home to exercise the
+geofence alert path.
+"""
+
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend'))
+
+from modules.geofence import get_geofence, is_outside_geofence  # noqa: E402
+
+TARGET_RATE = 5000  # messages per second
+
+def make_fleet(count):
+    """Generate serial numbers with a home position each"""
+    random.seed(42)
+    return {
+        f"BENCH{i:06d}": (random.uniform(35, 60), random.uniform(-10, 30))
+        for i in range(count)
+    }
+
+def report_position(home, drift_share):
+    """Get a reported position: usually jitter around home, sometimes far off"""
+    if random.random() < drift_share:
+        return home[0] + 0.01, home[1] + 0.01
+    return home[0] + random.uniform(-0.0002, 0.0002), home[1] + random.uniform(-0.0002, 0.0002)
+
+def benchmark_check(fleet, messages, drift_share):
+    """Time the per-message geofence check, including the fence cache lookup"""
+    serials = list(fleet)
+    updates = []
+    for _ in range(messages):
+        serial = random.choice(serials)
+        updates.append((serial, fleet[serial], report_position(fleet[serial], drift_share)))
+
+    start = time.perf_counter()
+    alerts = 0
+    for serial, home, (latitude, longitude) in updates:
+        fence = get_geofence(serial, home[0], home[1], 100)
+        if is_outside_geofence(fence, latitude, longitude):
+            alerts += 1
+    elapsed = time.perf_counter() - start
+
+    rate = messages / elapsed
+    print(f"Geofence check: {messages} messages in {elapsed * 1000:.1f} ms")
+    print(f"  {elapsed / messages * 1e6:.2f} us/message, {rate:,.0f} messages/s, {alerts} outside")
+    print(f"  {TARGET_RATE} messages/s uses {TARGET_RATE / rate * 100:.2f}% of one core")
+
+def benchmark_server(server, fleet, rate, duration, workers, drift_share):
+    """Send device updates to a running server at a fixed rate"""
+    import requests
+
+    serials = list(fleet)
+    url = f"{server.rstrip('/')}/api/device/update"
+    latencies = []
+    errors = [0]
+    lock = threading.Lock()
+    interval = workers / rate
+    deadline = time.perf_counter() + duration
+
+    def worker():
+        session = requests.Session()
+        next_send = time.perf_counter()
+        while next_send < deadline:
+            serial = random.choice(serials)
+            latitude, longitude = report_position(fleet[serial], drift_share)
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json={
+                    'serial_number': serial,
+                    'latitude': latitude,
+                    'longitude': longitude
+                }, timeout=10)
+                ok = response.status_code == 200
+            except requests.RequestException:
+                ok = False
+            with lock:
+                latencies.append(time.perf_counter() - start)
+                if not ok:
+                    errors[0] += 1
+            next_send += interval
+            time.sleep(max(0, next_send - time.perf_counter()))
+
+    threads = [threading.Thread(target=worker) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    print(f"Device updates: {len(latencies)} sent in {elapsed:.1f} s "
+          f"({len(latencies) / elapsed:,.0f}/s, target {rate}/s), {errors[0]} errors")
+    if latencies:
+        print(f"  p50 {latencies[len(latencies) // 2] * 1000:.1f} ms, "
+              f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.1f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--server', help='server URL, e.g. http://localhost:5000')
+    parser.add_argument('--screens', type=int, default=20000, help='number of simulated screens')
+    parser.add_argument('--messages', type=int, default=TARGET_RATE * 10, help='messages for the in-process check')
+    parser.add_argument('--rate', type=int, default=TARGET_RATE, help='target messages per second')
+    parser.add_argument('--duration', type=float, default=10, help='seconds to run against the server')
+    parser.add_argument('--workers', type=int, default=64, help='concurrent connections to the server')
+    parser.add_argument('--drift', type=float, default=0.01, help='share of updates reported off home')
+    args = parser.parse_args()
+
+    fleet = make_fleet(args.screens)
+    if args.server:
+        benchmark_server(args.server, fleet, args.rate, args.duration, args.workers, args.drift)
+    else:
+        benchmark_check(fleet, args.messages, args.drift)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Storage engine benchmark for LXCloud
+
+Runs the same workload through the backend on each storage engine:
+device updates for a fleet of assigned screens from several threads,
+then screen list requests. The update rate is compared with the rate a
+site of that many screens sends heartbeats at. Requests go through
+Flask's test client, so the numbers cover the handlers and the database
+but not HTTP. Each engine runs in its own process so caches don't carry
+over.
+"""
+
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'backend')
+
+def run_engine(engine, screens, updates, lists, workers, interval):
+    """Benchmark one engine in this process"""
+    sys.path.insert(0, BACKEND)
+    os.environ['FIRST_USER_ADMIN'] = 'true'
+    import contextlib
+    import io
+
+    with contextlib.redirect_stdout(io.StringIO()):
+        from app import configure_app, DB_CONFIG
+        from modules.storage import make_engine
+        app, _ = configure_app(make_engine(engine, DB_CONFIG))
+    client = app.test_client()
+
+    client.post('/api/register', json={'username': 'bench', 'email': 'bench@example.com', 'password': 'benchmark'})
+    random.seed(42)
+    serials = [f"STORE{i:06d}" for i in range(screens)]
+    start = time.perf_counter()
+    for serial in serials:
+        client.post('/api/controller/register', json={
+            'serial_number': serial, 'latitude': random.uniform(35, 60), 'longitude': random.uniform(-10, 30)
+        })
+        client.post('/api/screens', json={'serial_number': serial})
+    setup = time.perf_counter() - start
+
+    latencies = []
+    errors = []
+
+    def send_updates(count):
+        worker_client = app.test_client()
+        for _ in range(count):
+            serial = random.choice(serials)
+            start = time.perf_counter()
+            response = worker_client.post('/api/device/update', json={
+                'serial_number': serial, 'latitude': random.uniform(35, 60),
+                'longitude': random.uniform(-10, 30), 'information': 'benchmark'
+            })
+            latencies.append(time.perf_counter() - start)
+            if response.status_code != 200:
+                errors.append(f"{response.status_code} {response.get_data(as_text=True)}")
+
+    threads = [threading.Thread(target=send_updates, args=(updates // workers,)) for _ in range(workers)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    if errors:
+        print(f"{engine}: {len(errors)} device updates failed, e.g. {errors[0]}")
+        return
+    report(engine, f'device updates ({workers} workers)', latencies, elapsed)
+    site_rate = screens / interval
+    print(f"  a site of {screens} screens reporting every {interval:g} s sends {site_rate:,.1f}/s "
+          f"({len(latencies) / elapsed / site_rate:,.0f}x headroom)")
+
+    latencies = []
+    for _ in range(lists):
+        # Move a screen first, so the list isn't served from the cache
+        client.post('/api/device/update', json={
+            'serial_number': random.choice(serials), 'latitude': random.uniform(35, 60),
+            'longitude': random.uniform(-10, 30)
+        })
+        start = time.perf_counter()
+        client.get('/api/screens')
+        latencies.append(time.perf_counter() - start)
+    report(engine, 'screen lists', latencies, sum(latencies))
+    print(f"  ({screens} screens set up in {setup:.1f} s)")
+
+def report(engine, label, latencies, elapsed):
+    latencies.sort()
+    print(f"{engine:8} {label}: {len(latencies)} in {elapsed:.2f} s ({len(latencies) / elapsed:,.0f}/s), "
+          f"p50 {latencies[len(latencies) // 2] * 1000:.2f} ms, "
+          f"p99 {latencies[int(len(latencies) * 0.99)] * 1000:.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--engines', default='memory,sqlite',
+                        help='comma-separated engines to compare (memory, sqlite, mariadb)')
+    parser.add_argument('--screens', type=int, default=200, help='number of assigned screens')
+    parser.add_argument('--updates', type=int, default=5000, help='device updates to send')
+    parser.add_argument('--lists', type=int, default=200, help='screen list requests to send')
+    parser.add_argument('--workers', type=int, default=4, help='threads sending device updates')
+    parser.add_argument('--interval', type=float, default=30, help='seconds between updates of a screen')
+    parser.add_argument('--engine', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.engine:
+        run_engine(args.engine, args.screens, args.updates, args.lists, args.workers, args.interval)
+        return
+
+    for engine in args.engines.split(','):
+        with tempfile.TemporaryDirectory() as directory:
+            # The sqlite engine starts from an empty file each run
+            env = dict(os.environ, STORAGE_PATH=os.path.join(directory, 'benchmark.db'))
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--engine', engine,
+                            '--screens', str(args.screens), '--updates', str(args.updates),
+                            '--lists', str(args.lists), '--workers', str(args.workers),
+                            '--interval', str(args.interval)], env=env, check=False)
+
+if __name__ == '__main__':
+    main()
@@ -44,7 +44,7 @@ def register_controller(serial_number, latitude=None, longitude=None):
         if response.status_code == 200:
             result = response.json()
             print(f"  Status: {result.get('status')}")
-            print(f"  Expected auth key: {result.get('expected_auth_key')}")
+            print(f"  Registration key: {result.get('registration_key')}")
         return response.status_code == 200
     except Exception as e:
         print(f"Failed to register controller {serial_number}: {e}")
@@ -179,6 +179,7 @@ def provide_solutions():
     print("   - Install MariaDB/MySQL")
     print("   - Run the install.sh script")
     print("   - Or use standalone mode: python app_standalone.py")
+    print("   - Or keep data in a file: STORAGE_ENGINE=sqlite python app.py")
     print()
     print("4. For network access issues:")
     print("   - Ensure firewall allows port 80 and 5000")
@@ -186,7 +187,7 @@ def provide_solutions():
     print("   - Use standalone mode for testing")
     print()
     print("5. Quick test setup:")
-    print("   python app_standalone.py  # Runs frontend + backend on port 80")
+    print("   python app_standalone.py  # Runs frontend + backend on port 8080")
 
 def main():
     """Main check function"""
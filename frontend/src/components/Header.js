@@ -3,6 +3,7 @@ import { Link, useNavigate, useLocation } from 'react-router-dom';
 import { useAuth } from '../context/AuthContext';
 import { useSettings } from '../context/SettingsContext';
 import { useTheme } from '../context/ThemeContext';
+import { assetSrcSet } from '../utils/helpers';
 
 const Header = () => {
   const { user, logout, isAuthenticated } = useAuth();
@@ -79,6 +80,7 @@ const Header = () => {
             {settings.logoUrl ? (
               <img 
                 src={settings.logoUrl} 
+                srcSet={assetSrcSet(settings.logoUrl)}
                 alt={settings.logoText} 
                 style={{ height: '40px', maxWidth: '200px', objectFit: 'contain' }}
               />
@@ -124,6 +126,7 @@ const Header = () => {
           {(theme.logo_url || settings.logoUrl) ? (
             <img 
               src={theme.logo_url || settings.logoUrl} 
+              srcSet={assetSrcSet(theme.logo_url || settings.logoUrl)}
               alt={theme.app_name || settings.logoText} 
               style={{ 
                 height: '40px', 
@@ -1,5 +1,6 @@
 import React, { createContext, useState, useContext, useEffect } from 'react';
 import api from '../services/api';
+import { appleTouchIconUrl } from '../utils/helpers';
 
 const ThemeContext = createContext();
 
@@ -106,7 +107,9 @@ export const ThemeProvider = ({ children }) => {
 
   const loadTheme = async () => {
     try {
-      const response = await api.getUISettings();
+      // The bundle URL changes with every settings change, so it is cached by the browser
+      const current = await api.getTheme();
+      const response = await api.getThemeBundle(current.data.version);
       const themeData = response.data.settings;
       setTheme(prev => ({ ...prev, ...themeData }));
       applyTheme(themeData);
@@ -530,11 +533,20 @@ export const ThemeProvider = ({ children }) => {
 
   // Helper function to update favicon
   const updateFavicon = (faviconUrl) => {
-    const link = document.querySelector("link[rel*='icon']") || document.createElement('link');
+    const link = document.querySelector("link[rel~='icon']") || document.createElement('link');
     link.type = 'image/x-icon';
     link.rel = 'shortcut icon';
     link.href = faviconUrl;
     document.getElementsByTagName('head')[0].appendChild(link);
+
+    // Uploaded favicons come with a 180px PNG for home screen shortcuts
+    const touchIconUrl = appleTouchIconUrl(faviconUrl);
+    if (touchIconUrl) {
+      const touchLink = document.querySelector("link[rel='apple-touch-icon']") || document.createElement('link');
+      touchLink.rel = 'apple-touch-icon';
+      touchLink.href = touchIconUrl;
+      document.getElementsByTagName('head')[0].appendChild(touchLink);
+    }
   };
 
   // Helper function to convert hex to RGB
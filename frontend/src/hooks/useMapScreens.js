@@ -0,0 +1,123 @@
+import { useState, useEffect, useRef } from 'react';
+import api from '../services/api';
+import { handleApiError, boundsToBbox } from '../utils/helpers';
+
+/**
+ * Custom hook for the dashboard map: loads only the screens inside the
+ * current viewport (clustered by the server when zoomed out), and fleet
+ * statistics from the count endpoint
+ */
+export const useMapScreens = () => {
+  const [screens, setScreens] = useState([]);
+  const [clusters, setClusters] = useState([]);
+  const [stats, setStats] = useState({ total: 0, online: 0, offline: 0, withLocation: 0 });
+  const [loading, setLoading] = useState(true);
+  const [error, setError] = useState('');
+  const viewportRef = useRef(null);
+
+  // Load fleet statistics
+  const loadStats = async () => {
+    try {
+      const response = await api.getScreenCount();
+      setStats({
+        total: response.data.count,
+        online: response.data.online,
+        offline: response.data.offline,
+        withLocation: response.data.with_location
+      });
+    } catch (error) {
+      setError(handleApiError(error));
+      console.error('Error loading screen stats:', error);
+    } finally {
+      setLoading(false);
+    }
+  };
+
+  // Load the screens inside a Leaflet viewport
+  const loadViewport = async (bounds, zoom) => {
+    viewportRef.current = { bounds, zoom };
+    try {
+      const response = await api.getScreensInBounds({
+        bbox: boundsToBbox(bounds),
+        zoom
+      });
+
+      // Ignore responses for a viewport the user has already moved away from
+      if (viewportRef.current?.bounds === bounds) {
+        setScreens(response.data.screens);
+        setClusters(response.data.clusters || []);
+      }
+    } catch (error) {
+      console.error('Error loading map screens:', error);
+    }
+  };
+
+  const reloadViewport = () => {
+    if (viewportRef.current) {
+      loadViewport(viewportRef.current.bounds, viewportRef.current.zoom);
+    }
+  };
+
+  // Reload statistics and the viewport (after missing real-time updates)
+  const reload = () => {
+    loadStats();
+    reloadViewport();
+  };
+
+  // Add new screen
+  const addScreen = async (screenData) => {
+    try {
+      setError('');
+      const response = await api.addScreen(screenData);
+      loadStats();
+      reloadViewport();
+      return { success: true, data: response.data };
+    } catch (error) {
+      const errorMessage = handleApiError(error);
+      setError(errorMessage);
+      return { success: false, error: errorMessage };
+    }
+  };
+
+  // Apply a batch of real-time updates in one pass
+  const updateScreenStatuses = (updates) => {
+    const updatesBySerial = new Map(updates.map(update => [update.serial_number, update]));
+    setScreens(prevScreens =>
+      prevScreens.map(screen => {
+        const statusData = updatesBySerial.get(screen.serial_number);
+        return statusData
+          ? {
+              ...screen,
+              ...statusData,
+              last_seen: statusData.timestamp || new Date().toISOString()
+            }
+          : screen;
+      })
+    );
+  };
+
+  // Update screen status (for real-time updates)
+  const updateScreenStatus = (serialNumber, statusData) => {
+    updateScreenStatuses([{ ...statusData, serial_number: serialNumber }]);
+  };
+
+  // Load statistics on mount; the map loads its viewport once it is ready
+  useEffect(() => {
+    loadStats();
+  }, []);
+
+  return {
+    screens,
+    clusters,
+    stats,
+    loading,
+    error,
+    loadStats,
+    loadViewport,
+    reload,
+    addScreen,
+    updateScreenStatus,
+    updateScreenStatuses,
+    clearError: () => setError('')
+  };
+};
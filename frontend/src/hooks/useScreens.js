@@ -1,6 +1,6 @@
-import { useState, useEffect } from 'react';
+import { useState, useEffect, useRef } from 'react';
 import api from '../services/api';
-import { handleApiError } from '../utils/helpers';
+import { handleApiError, applyScreenDelta } from '../utils/helpers';
 
 /**
  * Custom hook for managing screen data and operations
@@ -9,6 +9,7 @@ export const useScreens = () => {
   const [screens, setScreens] = useState([]);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
+  const versionRef = useRef(null);
 
   // Load screens from API
   const loadScreens = async () => {
@@ -17,6 +18,7 @@ export const useScreens = () => {
       setError('');
       const response = await api.getScreens();
       setScreens(response.data.screens);
+      versionRef.current = response.data.version || null;
     } catch (error) {
       const errorMessage = handleApiError(error);
       setError(errorMessage);
@@ -26,12 +28,40 @@ export const useScreens = () => {
     }
   };
 
+  // Fetch only what changed since the last load, falling back to a full load
+  const syncScreens = async () => {
+    if (!versionRef.current) {
+      return loadScreens();
+    }
+
+    try {
+      const response = await api.getScreens({ since: versionRef.current });
+      const { delta, version } = response.data;
+
+      if (delta) {
+        const changedSerials = [
+          ...response.data.removed,
+          ...response.data.screens.map(screen => screen.serial_number),
+          ...(response.data.unassigned_controllers || []).map(controller => controller.serial_number)
+        ];
+        setScreens(prevScreens => applyScreenDelta(prevScreens, response.data.screens, changedSerials));
+      } else {
+        // The server could not reconstruct the changes and sent the full list
+        setScreens(response.data.screens);
+      }
+      versionRef.current = version || null;
+    } catch (error) {
+      console.error('Error syncing screens:', error);
+      await loadScreens();
+    }
+  };
+
   // Add new screen
   const addScreen = async (screenData) => {
     try {
       setError('');
       const response = await api.addScreen(screenData);
-      await loadScreens(); // Reload to get updated data
+      await syncScreens(); // Fetch the changes
       return { success: true, data: response.data };
     } catch (error) {
       const errorMessage = handleApiError(error);
@@ -45,7 +75,7 @@ export const useScreens = () => {
     try {
       setError('');
       const response = await api.updateScreen(screenId, data);
-      await loadScreens(); // Reload to get updated data
+      await syncScreens(); // Fetch the changes
       return { success: true, data: response.data };
     } catch (error) {
       const errorMessage = handleApiError(error);
@@ -59,7 +89,7 @@ export const useScreens = () => {
     try {
       setError('');
       await api.deleteScreen(screenId);
-      await loadScreens(); // Reload to get updated data
+      await syncScreens(); // Fetch the changes
       return { success: true };
     } catch (error) {
       const errorMessage = handleApiError(error);
@@ -73,7 +103,7 @@ export const useScreens = () => {
     try {
       setError('');
       await api.unbindScreen(screenId);
-      await loadScreens(); // Reload to get updated data
+      await syncScreens(); // Fetch the changes
       return { success: true };
     } catch (error) {
       const errorMessage = handleApiError(error);
@@ -108,21 +138,28 @@ export const useScreens = () => {
     withLocation: getScreensWithLocation().length
   });
 
-  // Update screen status (for real-time updates)
-  const updateScreenStatus = (serialNumber, statusData) => {
-    setScreens(prevScreens => 
-      prevScreens.map(screen => 
-        screen.serial_number === serialNumber
+  // Apply a batch of real-time updates in one pass
+  const updateScreenStatuses = (updates) => {
+    const updatesBySerial = new Map(updates.map(update => [update.serial_number, update]));
+    setScreens(prevScreens =>
+      prevScreens.map(screen => {
+        const statusData = updatesBySerial.get(screen.serial_number);
+        return statusData
           ? {
               ...screen,
               ...statusData,
               last_seen: statusData.timestamp || new Date().toISOString()
             }
-          : screen
-      )
+          : screen;
+      })
     );
   };
 
+  // Update screen status (for real-time updates)
+  const updateScreenStatus = (serialNumber, statusData) => {
+    updateScreenStatuses([{ ...statusData, serial_number: serialNumber }]);
+  };
+
   // Load screens on mount
   useEffect(() => {
     loadScreens();
@@ -133,6 +170,7 @@ export const useScreens = () => {
     loading,
     error,
     loadScreens,
+    syncScreens,
     addScreen,
     updateScreen,
     deleteScreen,
@@ -143,6 +181,7 @@ export const useScreens = () => {
     getScreensWithLocation,
     getScreenStats,
     updateScreenStatus,
+    updateScreenStatuses,
     clearError: () => setError('')
   };
 };
\ No newline at end of file
@@ -4,14 +4,32 @@ import { APP_CONFIG } from '../utils/constants';
 
 /**
  * Custom hook for managing WebSocket connections
+ *
+ * The server batches screen updates into screens_update frames; they are
+ * passed to onScreensUpdate as a whole, or to onScreenUpdate one by one.
+ * subscribe() narrows the updates to some screens or a map area; the
+ * subscriptions are sent again whenever the socket reconnects.
+ * Frames are numbered per feed room: on reconnect the server replays the
+ * frames missed in between, or calls onResync when it no longer has them
+ * and the data has to be reloaded.
  */
-export const useWebSocket = (onScreenUpdate) => {
+export const useWebSocket = (onScreenUpdate, onScreensUpdate, onResync) => {
   const socketRef = useRef(null);
+  const handlersRef = useRef({ onScreenUpdate, onScreensUpdate, onResync });
+  const subscriptionsRef = useRef({});
+  const feedRef = useRef({ epoch: null, seqs: {} });
+  handlersRef.current = { onScreenUpdate, onScreensUpdate, onResync };
 
   useEffect(() => {
-    // Connect to WebSocket
+    // Connect to WebSocket; the session cookie authenticates the connection
+    // and the auth payload tells the server which frames we already have
     socketRef.current = io(APP_CONFIG.SOCKET_URL, {
-      transports: ['websocket', 'polling']
+      transports: ['websocket', 'polling'],
+      withCredentials: true,
+      auth: (cb) => {
+        const { epoch, seqs } = feedRef.current;
+        cb(epoch ? { epoch, since: seqs } : {});
+      }
     });
 
     const socket = socketRef.current;
@@ -19,6 +37,9 @@ export const useWebSocket = (onScreenUpdate) => {
     // Handle connection events
     socket.on('connect', () => {
       console.log('WebSocket connected');
+      Object.entries(subscriptionsRef.current).forEach(([event, data]) => {
+        socket.emit(event, data);
+      });
     });
 
     socket.on('disconnect', () => {
@@ -29,10 +50,39 @@ export const useWebSocket = (onScreenUpdate) => {
       console.error('WebSocket connection error:', error);
     });
 
-    // Handle screen updates
+    // Where the feed rooms stand, sent on every (re)connect
+    socket.on('feed_state', (data) => {
+      feedRef.current = { epoch: data.epoch, seqs: { ...data.seqs } };
+    });
+
+    // Missed frames are gone: reload instead
+    socket.on('resync', () => {
+      const { onResync } = handlersRef.current;
+      if (typeof onResync === 'function') {
+        onResync();
+      }
+    });
+
+    // Handle batched screen updates
+    socket.on('screens_update', (data) => {
+      if (data.room && data.epoch === feedRef.current.epoch) {
+        feedRef.current.seqs[data.room] = data.seq;
+      }
+
+      const { onScreenUpdate, onScreensUpdate } = handlersRef.current;
+      if (typeof onScreensUpdate === 'function') {
+        onScreensUpdate(data.updates);
+      } else if (typeof onScreenUpdate === 'function') {
+        data.updates.forEach(onScreenUpdate);
+      }
+    });
+
+    // Handle single screen updates (sent by the standalone backend)
     socket.on('screen_update', (data) => {
-      console.log('Screen update received:', data);
-      if (onScreenUpdate && typeof onScreenUpdate === 'function') {
+      const { onScreenUpdate, onScreensUpdate } = handlersRef.current;
+      if (typeof onScreensUpdate === 'function') {
+        onScreensUpdate([data]);
+      } else if (typeof onScreenUpdate === 'function') {
         onScreenUpdate(data);
       }
     });
@@ -40,7 +90,8 @@ export const useWebSocket = (onScreenUpdate) => {
     // Handle controller updates
     socket.on('controller_update', (data) => {
       console.log('Controller update received:', data);
-      if (onScreenUpdate && typeof onScreenUpdate === 'function') {
+      const { onScreenUpdate } = handlersRef.current;
+      if (typeof onScreenUpdate === 'function') {
         onScreenUpdate(data);
       }
     });
@@ -51,7 +102,7 @@ export const useWebSocket = (onScreenUpdate) => {
         socket.disconnect();
       }
     };
-  }, [onScreenUpdate]);
+  }, []);
 
   // Send message through WebSocket
   const sendMessage = (event, data) => {
@@ -62,6 +113,14 @@ export const useWebSocket = (onScreenUpdate) => {
     }
   };
 
+  // Subscribe to a subset of screen updates (subscribe_screens or subscribe_bbox)
+  const subscribe = (event, data) => {
+    subscriptionsRef.current[event] = data;
+    if (socketRef.current && socketRef.current.connected) {
+      socketRef.current.emit(event, data);
+    }
+  };
+
   // Check if socket is connected
   const isConnected = () => {
     return socketRef.current && socketRef.current.connected;
@@ -69,6 +128,7 @@ export const useWebSocket = (onScreenUpdate) => {
 
   return {
     sendMessage,
+    subscribe,
     isConnected
   };
 };
\ No newline at end of file
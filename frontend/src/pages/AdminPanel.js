@@ -1,13 +1,22 @@
-import React, { useState, useEffect } from 'react';
+import React, { useState, useEffect, useRef } from 'react';
 import { useAuth } from '../context/AuthContext';
 import { Link } from 'react-router-dom';
 import api from '../services/api';
 
+const PAGE_SIZE = 50;
+const SEARCH_DELAY_MS = 300;
+
 const AdminPanel = () => {
   const { user } = useAuth();
   const [users, setUsers] = useState([]);
   const [screens, setScreens] = useState([]);
+  const [screensCursor, setScreensCursor] = useState(null);
   const [unassignedControllers, setUnassignedControllers] = useState([]);
+  const [controllersCursor, setControllersCursor] = useState(null);
+  const [stats, setStats] = useState({ screens: 0, controllers: 0, online: 0, offline: 0 });
+  const [filters, setFilters] = useState({ q: '', online_status: '' });
+  const [appliedFilters, setAppliedFilters] = useState(filters);
+  const appliedFiltersRef = useRef(appliedFilters);
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
   const [success, setSuccess] = useState('');
@@ -15,6 +24,13 @@ const AdminPanel = () => {
   const [selectedUser, setSelectedUser] = useState(null);
   const [newPassword, setNewPassword] = useState('');
 
+  // Search once typing pauses, instead of five requests per keystroke
+  useEffect(() => {
+    const delay = filters.q === appliedFilters.q ? 0 : SEARCH_DELAY_MS;
+    const timeoutId = setTimeout(() => setAppliedFilters(filters), delay);
+    return () => clearTimeout(timeoutId);
+  }, [filters]);
+
   useEffect(() => {
     if (!user?.is_admin && !user?.is_administrator) {
       setError('Access denied. Admin privileges required.');
@@ -22,19 +38,45 @@ const AdminPanel = () => {
       return;
     }
     
+    appliedFiltersRef.current = appliedFilters;
     loadAdminData();
-  }, [user]);
+  }, [user, appliedFilters]);
+
+  const pageParams = (type, cursor) => {
+    const params = { type, limit: PAGE_SIZE };
+    if (appliedFilters.q) params.q = appliedFilters.q;
+    if (appliedFilters.online_status) params.online_status = appliedFilters.online_status;
+    if (cursor) params.cursor = cursor;
+    return params;
+  };
 
   const loadAdminData = async () => {
+    const requestFilters = appliedFilters;
     try {
-      const [usersResponse, screensResponse] = await Promise.all([
+      const [usersResponse, screensResponse, controllersResponse, screenCount, controllerCount] = await Promise.all([
         api.getUsers(),
-        api.getScreens()
+        api.getScreens(pageParams('screens')),
+        api.getScreens(pageParams('controllers')),
+        api.getScreenCount({ type: 'screens' }),
+        api.getScreenCount({ type: 'controllers' })
       ]);
       
+      // Ignore responses for filters the user has already changed
+      if (appliedFiltersRef.current !== requestFilters) {
+        return;
+      }
+      
       setUsers(usersResponse.data.users);
       setScreens(screensResponse.data.screens || []);
-      setUnassignedControllers(screensResponse.data.unassigned_controllers || []);
+      setScreensCursor(screensResponse.data.next_cursor);
+      setUnassignedControllers(controllersResponse.data.unassigned_controllers || []);
+      setControllersCursor(controllersResponse.data.next_cursor);
+      setStats({
+        screens: screenCount.data.count,
+        controllers: controllerCount.data.count,
+        online: screenCount.data.online + controllerCount.data.online,
+        offline: screenCount.data.offline + controllerCount.data.offline
+      });
     } catch (error) {
       setError('Failed to load admin data');
       console.error('Error loading admin data:', error);
@@ -43,6 +85,36 @@ const AdminPanel = () => {
     }
   };
 
+  const loadMoreScreens = async () => {
+    const requestFilters = appliedFilters;
+    try {
+      const response = await api.getScreens(pageParams('screens', screensCursor));
+      if (appliedFiltersRef.current !== requestFilters) {
+        return;
+      }
+      setScreens(prev => [...prev, ...(response.data.screens || [])]);
+      setScreensCursor(response.data.next_cursor);
+    } catch (error) {
+      setError('Failed to load screens');
+      setTimeout(() => setError(''), 3000);
+    }
+  };
+
+  const loadMoreControllers = async () => {
+    const requestFilters = appliedFilters;
+    try {
+      const response = await api.getScreens(pageParams('controllers', controllersCursor));
+      if (appliedFiltersRef.current !== requestFilters) {
+        return;
+      }
+      setUnassignedControllers(prev => [...prev, ...(response.data.unassigned_controllers || [])]);
+      setControllersCursor(response.data.next_cursor);
+    } catch (error) {
+      setError('Failed to load controllers');
+      setTimeout(() => setError(''), 3000);
+    }
+  };
+
   const toggleUserAdmin = async (userId) => {
     try {
       await api.toggleUserAdmin(userId);
@@ -172,7 +244,6 @@ const AdminPanel = () => {
             </thead>
             <tbody>
               {users.map(u => {
-                const userScreens = screens.filter(s => s.assigned_user === u.username);
                 return (
                   <tr key={u.id}>
                     <td>{u.username}</td>
@@ -191,7 +262,7 @@ const AdminPanel = () => {
                         {u.two_fa_enabled ? 'Enabled' : 'Disabled'}
                       </span>
                     </td>
-                    <td>{userScreens.length}</td>
+                    <td>{u.screen_count}</td>
                     <td>{new Date(u.created_at).toLocaleDateString()}</td>
                     <td>
                       <div style={{ display: 'flex', gap: '5px', flexWrap: 'wrap' }}>
@@ -206,7 +277,7 @@ const AdminPanel = () => {
                               {u.is_administrator ? '👑➖' : '👑➕'}
                             </button>
                             
-                            {userScreens.length > 0 && (
+                            {u.screen_count > 0 && (
                               <button
                                 className="button button-small button-secondary"
                                 onClick={() => unbindUserScreens(u.id, u.username)}
@@ -251,27 +322,44 @@ const AdminPanel = () => {
         <h2>Screen Overview</h2>
         <div style={{ display: 'grid', gridTemplateColumns: 'repeat(auto-fit, minmax(200px, 1fr))', gap: '20px', marginBottom: '20px' }}>
           <div className="stat-card">
-            <h3 style={{ color: '#667eea' }}>{screens.length}</h3>
+            <h3 style={{ color: '#667eea' }}>{stats.screens}</h3>
             <p>Assigned Screens</p>
           </div>
           <div className="stat-card">
-            <h3 style={{ color: '#f093fb' }}>{unassignedControllers.length}</h3>
+            <h3 style={{ color: '#f093fb' }}>{stats.controllers}</h3>
             <p>Unassigned Controllers</p>
           </div>
           <div className="stat-card">
-            <h3 style={{ color: '#28a745' }}>
-              {[...screens, ...unassignedControllers].filter(s => s.online_status).length}
-            </h3>
+            <h3 style={{ color: '#28a745' }}>{stats.online}</h3>
             <p>Online</p>
           </div>
           <div className="stat-card">
-            <h3 style={{ color: '#dc3545' }}>
-              {[...screens, ...unassignedControllers].filter(s => !s.online_status).length}
-            </h3>
+            <h3 style={{ color: '#dc3545' }}>{stats.offline}</h3>
             <p>Offline</p>
           </div>
         </div>
 
+        <div style={{ display: 'flex', gap: '10px', marginBottom: '20px', flexWrap: 'wrap' }}>
+          <input
+            type="text"
+            className="form-input"
+            placeholder="Search serial number or name"
+            value={filters.q}
+            onChange={(e) => setFilters({ ...filters, q: e.target.value })}
+            style={{ flex: 1, minWidth: '200px' }}
+          />
+          <select
+            className="form-input"
+            value={filters.online_status}
+            onChange={(e) => setFilters({ ...filters, online_status: e.target.value })}
+            style={{ width: 'auto' }}
+          >
+            <option value="">All statuses</option>
+            <option value="true">Online</option>
+            <option value="false">Offline</option>
+          </select>
+        </div>
+
         {unassignedControllers.length > 0 && (
           <div>
             <h3>Unassigned Controllers</h3>
@@ -312,6 +400,11 @@ const AdminPanel = () => {
                 </tbody>
               </table>
             </div>
+            {controllersCursor && (
+              <button className="button button-secondary" onClick={loadMoreControllers}>
+                Load more controllers
+              </button>
+            )}
           </div>
         )}
 
@@ -357,6 +450,11 @@ const AdminPanel = () => {
             </tbody>
           </table>
         </div>
+        {screensCursor && (
+          <button className="button button-secondary" onClick={loadMoreScreens}>
+            Load more screens
+          </button>
+        )}
       </div>
 
       {/* Password Reset Modal */}
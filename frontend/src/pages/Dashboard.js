@@ -1,13 +1,13 @@
 import React, { useState } from 'react';
-import { MapContainer, TileLayer, Marker, Popup } from 'react-leaflet';
+import { MapContainer, TileLayer, Marker, Popup, useMap, useMapEvents } from 'react-leaflet';
 import { useNavigate } from 'react-router-dom';
 import L from 'leaflet';
 import { useSettings } from '../context/SettingsContext';
 import { useTheme } from '../context/ThemeContext';
-import { useScreens } from '../hooks/useScreens';
+import { useMapScreens } from '../hooks/useMapScreens';
 import { useWebSocket } from '../hooks/useWebSocket';
 import { APP_CONFIG } from '../utils/constants';
-import { formatDate } from '../utils/helpers';
+import { formatDate, boundsToBbox } from '../utils/helpers';
 
 // Fix for default markers in React Leaflet
 delete L.Icon.Default.prototype._getIconUrl;
@@ -17,6 +17,52 @@ L.Icon.Default.mergeOptions({
   shadowUrl: 'https://cdnjs.cloudflare.com/ajax/libs/leaflet/1.9.4/images/marker-shadow.png',
 });
 
+// Reports the map viewport once ready and after every pan or zoom
+const ViewportWatcher = ({ onChange }) => {
+  const map = useMap();
+
+  useMapEvents({
+    moveend: () => onChange(map.getBounds(), map.getZoom()),
+  });
+
+  React.useEffect(() => {
+    onChange(map.getBounds(), map.getZoom());
+  }, [map]);
+
+  return null;
+};
+
+// A server-side cluster of screens; clicking it zooms in on the cluster
+const ClusterMarker = ({ cluster }) => {
+  const map = useMap();
+  const size = cluster.count < 100 ? 36 : cluster.count < 1000 ? 44 : 52;
+  const icon = L.divIcon({
+    className: 'screen-cluster',
+    html: `<div style="width:${size}px;height:${size}px;line-height:${size}px;border-radius:50%;` +
+      `text-align:center;font-weight:bold;color:#fff;` +
+      `background:${cluster.online > 0 ? 'rgba(40,167,69,0.85)' : 'rgba(220,53,69,0.85)'}">${cluster.count}</div>`,
+    iconSize: [size, size],
+  });
+
+  return (
+    <Marker
+      position={[cluster.latitude, cluster.longitude]}
+      icon={icon}
+      eventHandlers={{
+        click: () => map.setView([cluster.latitude, cluster.longitude], map.getZoom() + 2),
+      }}
+    >
+      <Popup>
+        <div>
+          <h3>{cluster.count} screens</h3>
+          <p>Online: {cluster.online}</p>
+          <p>Offline: {cluster.offline}</p>
+        </div>
+      </Popup>
+    </Marker>
+  );
+};
+
 const Dashboard = () => {
   const [showAddModal, setShowAddModal] = useState(false);
   const [newScreen, setNewScreen] = useState({
@@ -33,22 +79,28 @@ const Dashboard = () => {
     applyPageCSS('dashboard');
   }, [applyPageCSS]);
   
-  // Use custom hooks for screen management
+  // Use custom hooks for the screens in the map viewport
   const {
     screens,
+    clusters,
+    stats,
     loading,
     error,
+    loadViewport,
+    reload,
     addScreen,
-    getScreensWithLocation,
-    getScreenStats,
-    updateScreenStatus,
+    updateScreenStatuses,
     clearError
-  } = useScreens();
+  } = useMapScreens();
 
   // WebSocket for real-time updates
-  useWebSocket((data) => {
-    updateScreenStatus(data.serial_number, data);
-  });
+  const { subscribe } = useWebSocket(null, updateScreenStatuses, reload);
+
+  // Load the screens in view and only receive live updates for that area
+  const handleViewportChange = (bounds, zoom) => {
+    loadViewport(bounds, zoom);
+    subscribe('subscribe_bbox', { bbox: boundsToBbox(bounds) });
+  };
 
   // Create custom icons based on settings or use defaults
   const createMarkerIcons = () => {
@@ -88,9 +140,6 @@ const Dashboard = () => {
     navigate(`/screens/${screen.id}/data`);
   };
 
-  // Get screen data and statistics
-  const screensWithLocation = getScreensWithLocation();
-  const stats = getScreenStats();
   const { onlineIcon, offlineIcon } = createMarkerIcons();
 
   if (loading) {
@@ -120,7 +169,16 @@ const Dashboard = () => {
               attribution='&copy; <a href="https://www.openstreetmap.org/copyright">OpenStreetMap</a> contributors'
             />
             
-            {screensWithLocation.map((screen) => (
+            <ViewportWatcher onChange={handleViewportChange} />
+            
+            {clusters.map((cluster) => (
+              <ClusterMarker
+                key={`${cluster.latitude},${cluster.longitude}`}
+                cluster={cluster}
+              />
+            ))}
+            
+            {screens.map((screen) => (
               <Marker
                 key={screen.id}
                 position={[screen.latitude, screen.longitude]}
@@ -149,7 +207,7 @@ const Dashboard = () => {
           </MapContainer>
         </div>
         
-        {screensWithLocation.length === 0 && (
+        {stats.withLocation === 0 && (
           <p style={{ textAlign: 'center', color: '#666', marginTop: '20px' }}>
             No screens with location data available. Add screens and they will appear here once they send location updates.
           </p>
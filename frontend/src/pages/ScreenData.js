@@ -1,6 +1,7 @@
 import React, { useState, useEffect } from 'react';
 import { useParams, useNavigate } from 'react-router-dom';
 import api from '../services/api';
+import { useWebSocket } from '../hooks/useWebSocket';
 
 const ScreenData = () => {
   const { screenId } = useParams();
@@ -10,8 +11,26 @@ const ScreenData = () => {
   const [loading, setLoading] = useState(true);
   const [error, setError] = useState('');
 
+  // Live updates for this screen only
+  const { subscribe } = useWebSocket(null, (updates) => {
+    const update = updates.filter(u => u.screen_id === parseInt(screenId)).pop();
+    if (!update) return;
+
+    setScreen(prev => prev && {
+      ...prev,
+      latitude: update.latitude,
+      longitude: update.longitude,
+      online_status: update.online_status,
+      last_seen: update.timestamp
+    });
+    if (update.information) {
+      setData(prev => [{ information: update.information, timestamp: update.timestamp }, ...prev]);
+    }
+  }, () => loadScreenData());
+
   useEffect(() => {
     loadScreenData();
+    subscribe('subscribe_screens', { screen_ids: [parseInt(screenId)] });
   }, [screenId]);
 
   const loadScreenData = async () => {
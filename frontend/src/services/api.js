@@ -21,7 +21,9 @@ const api = {
   disable2FA: (data) => axios.post(`${API_BASE_URL}${API_ENDPOINTS.DISABLE_2FA}`, data),
 
   // Screen management
-  getScreens: () => axios.get(`${API_BASE_URL}${API_ENDPOINTS.SCREENS}`),
+  getScreens: (params) => axios.get(`${API_BASE_URL}${API_ENDPOINTS.SCREENS}`, { params }),
+  getScreenCount: (params) => axios.get(`${API_BASE_URL}${API_ENDPOINTS.SCREENS_COUNT}`, { params }),
+  getScreensInBounds: (params) => axios.get(`${API_BASE_URL}${API_ENDPOINTS.SCREENS_GEO}`, { params }),
   addScreen: (screenData) => axios.post(`${API_BASE_URL}${API_ENDPOINTS.SCREENS}`, screenData),
   updateScreen: (screenId, data) => axios.put(`${API_BASE_URL}${API_ENDPOINTS.SCREEN_BY_ID(screenId)}`, data),
   deleteScreen: (screenId) => axios.delete(`${API_BASE_URL}${API_ENDPOINTS.SCREEN_BY_ID(screenId)}`),
@@ -41,6 +43,9 @@ const api = {
   // UI Settings endpoints
   getUISettings: () => axios.get(`${API_BASE_URL}${API_ENDPOINTS.ADMIN_UI_SETTINGS}`),
   updateUISettings: (settings) => axios.post(`${API_BASE_URL}${API_ENDPOINTS.ADMIN_UI_SETTINGS}`, settings),
+  // Public theme (current version, then its immutable bundle)
+  getTheme: () => axios.get(`${API_BASE_URL}${API_ENDPOINTS.THEME}`),
+  getThemeBundle: (version) => axios.get(`${API_BASE_URL}${API_ENDPOINTS.THEME_BUNDLE(version)}`),
   uploadUIAsset: (formData) => axios.post(`${API_BASE_URL}${API_ENDPOINTS.ADMIN_UPLOAD_UI_ASSET}`, formData, {
     headers: {
       'Content-Type': 'multipart/form-data'
@@ -35,6 +35,8 @@ export const API_ENDPOINTS = {
 
   // Screen management
   SCREENS: '/screens',
+  SCREENS_COUNT: '/screens/count',
+  SCREENS_GEO: '/screens/geo',
   SCREEN_BY_ID: (id) => `/screens/${id}`,
   SCREEN_DATA: (id) => `/screens/${id}/data`,
   UNBIND_SCREEN: (id) => `/screens/${id}/unbind`,
@@ -47,6 +49,10 @@ export const API_ENDPOINTS = {
   ADMIN_UI_SETTINGS: '/admin/ui-settings',
   ADMIN_UPLOAD_UI_ASSET: '/admin/upload-ui-asset',
 
+  // Public theme
+  THEME: '/theme',
+  THEME_BUNDLE: (version) => `/theme/${version}.json`,
+
   // System endpoints
   HEALTH: '/health',
   VERSION: '/version'
@@ -179,4 +179,49 @@ export const downloadJSON = (data, filename) => {
   linkElement.setAttribute('href', dataUri);
   linkElement.setAttribute('download', exportFileDefaultName);
   linkElement.click();
-};
\ No newline at end of file
+};
+/**
+ * Apply a delta from the screen list endpoint to a local list
+ * @param {Array} items - Current screens (or controllers)
+ * @param {Array} changed - Changed entries returned in the delta
+ * @param {Array} changedSerials - Every serial number the delta covers
+ * @returns {Array} - Updated list, newest first
+ */
+export const applyScreenDelta = (items, changed, changedSerials) => {
+  const dropped = new Set(changedSerials);
+  const merged = items.filter(item => !dropped.has(item.serial_number)).concat(changed || []);
+  return merged.sort((a, b) => (b.created_at || '').localeCompare(a.created_at || ''));
+};
+
+/**
+ * Format Leaflet bounds as the west,south,east,north bbox the API expects
+ * @param {L.LatLngBounds} bounds - Map bounds
+ * @returns {string} - Bounding box string
+ */
+export const boundsToBbox = (bounds) => {
+  return [bounds.getWest(), bounds.getSouth(), bounds.getEast(), bounds.getNorth()]
+    .map(coordinate => coordinate.toFixed(6))
+    .join(',');
+};
+
+const UPLOADED_ASSET_URL = /\/api\/static\/uploads\/ui\/[0-9a-f]{20}$/;
+
+/**
+ * Build the srcSet of an uploaded UI asset, whose high-DPR variants are
+ * requested with ?dpr=
+ * @param {string} url - Asset URL
+ * @returns {string|undefined} - srcSet value, undefined for other images
+ */
+export const assetSrcSet = (url) => {
+  if (!url || !UPLOADED_ASSET_URL.test(url)) return undefined;
+  return `${url} 1x, ${url}?dpr=2 2x`;
+};
+
+/**
+ * Get the apple-touch-icon of a favicon uploaded as a UI asset
+ * @param {string} url - Favicon URL
+ * @returns {string|null} - 180px icon URL, null for other images
+ */
+export const appleTouchIconUrl = (url) => {
+  return url && UPLOADED_ASSET_URL.test(url) ? `${url}-180.png` : null;
+};
@@ -6,7 +6,9 @@ module.exports = {
   entry: './src/index.js',
   output: {
     path: path.resolve(__dirname, 'dist'),
-    filename: 'bundle.js',
+    // Content-hashed, so servers can mark the bundle immutable
+    filename: 'bundle.[contenthash].js',
+    clean: true,
     publicPath: '/',
   },
   module: {
@@ -14,6 +14,8 @@ if [ ! -d "frontend/dist" ]; then
     npm install
     npm run build
     cd ..
+    # Compress the build once instead of on the first requests
+    python3 backend/modules/static_files.py frontend/dist
 fi
 
 # Check if backend virtual env exists
@@ -27,11 +29,11 @@ if [ ! -d "backend/venv" ]; then
 fi
 
 # Start the standalone application
-echo "Starting application on port 80..."
+echo "Starting application on port 8080..."
 echo "You can access it at:"
-echo "  - http://localhost"
-echo "  - http://127.0.0.1"
-echo "  - http://[your-local-ip]"
+echo "  - http://localhost:8080"
+echo "  - http://127.0.0.1:8080"
+echo "  - http://[your-local-ip]:8080"
 echo ""
 echo "Press Ctrl+C to stop"
 echo ""